@@ -0,0 +1,209 @@
+import math
+import time
+import threading
+import contextlib
+from collections import deque, defaultdict
+from contextvars import ContextVar
+from config import ADMISSION_MAX_RETRY_AFTER
+from metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUED, ADMISSION_REJECTED, ADMISSION_WAIT_SECONDS
+from structured_logging import get_logger
+import deadlines
+
+logger = get_logger(__name__)
+
+# Who the current request or job is working for (the client address), for
+# per-client fairness; background jobs inherit it from the upload request
+client_var = ContextVar('client', default='-')
+
+
+class Overloaded(Exception):
+    """Raised instead of queueing more work than a resource can take.
+    ``retry_after`` estimates in seconds when it is worth trying again."""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """One admitted piece of work. ``start`` is called when it gets a slot;
+    the holder must call ``release`` when the work ends, or to give up its
+    place in line."""
+
+    def __init__(self, controller, client, start):
+        self.controller = controller
+        self.client = client
+        self.start = start
+        self.queued_at = time.monotonic()
+        self.started_at = None
+        self.released = False
+
+    def release(self):
+        self.controller._release(self)
+
+
+class AdmissionController:
+    """Bounds the work on one resource: at most ``capacity`` items run at
+    once and at most ``max_queue`` more wait; past that, Overloaded.
+
+    Waiting work is served round-robin across clients rather than first
+    come, first served, so one client with many answers queued cannot hold
+    back everyone else, and no client may have more than ``per_client``
+    items admitted (0 for no limit)."""
+
+    def __init__(self, name, capacity, max_queue, per_client=0, typical_seconds=1.0):
+        self.name = name
+        self.capacity = max(1, capacity)
+        self.max_queue = max_queue
+        self.per_client = per_client
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.queued = 0
+        self.rejected = 0
+        self.admitted = defaultdict(int)
+        self.waiting = {}
+        self.turns = deque()
+        # Moving average of how long work holds a slot, for Retry-After
+        self.average_seconds = typical_seconds
+        self._publish()
+
+    def admit(self, start, client=None):
+        """Admit work for ``client`` (default: the current one) and call
+        ``start(ticket)`` once it has a slot, right away if one is free.
+        Raises Overloaded when the queue or the client's share is full."""
+        client = client if client is not None else client_var.get()
+        ticket = Ticket(self, client, start)
+        with self.lock:
+            self._check(client)
+            self.admitted[client] += 1
+            if self.in_flight < self.capacity and not self.queued:
+                self.in_flight += 1
+                ticket.started_at = time.monotonic()
+                ready = True
+            else:
+                self.queued += 1
+                if client not in self.waiting:
+                    self.waiting[client] = deque()
+                    self.turns.append(client)
+                self.waiting[client].append(ticket)
+                ready = False
+            self._publish()
+        if ready:
+            self._start(ticket)
+        return ticket
+
+    def check(self, client=None):
+        """Raise Overloaded if work from ``client`` would be turned away now"""
+        with self.lock:
+            self._check(client if client is not None else client_var.get())
+
+    @contextlib.contextmanager
+    def slot(self, client=None):
+        """Hold a slot for the duration of the block, waiting in line for
+        it up to the current deadline"""
+        granted = threading.Event()
+        ticket = self.admit(lambda _: granted.set(), client)
+        try:
+            timeout = deadlines.remaining()
+            if not granted.wait(None if timeout is None else max(0, timeout)):
+                if self._withdraw(ticket):
+                    raise deadlines.DeadlineExceeded(f"Deadline exceeded waiting for {self.name} capacity")
+            yield
+        finally:
+            ticket.release()
+
+    def retry_after(self):
+        with self.lock:
+            return self._retry_after()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'capacity': self.capacity,
+                'maxQueue': self.max_queue,
+                'inFlight': self.in_flight,
+                'queued': self.queued,
+                'clients': len(self.admitted),
+                'rejected': self.rejected
+            }
+
+    def _check(self, client):
+        if self.queued >= self.max_queue and self.in_flight >= self.capacity:
+            reason = 'queue_full'
+        elif self.per_client and self.admitted.get(client, 0) >= self.per_client:
+            reason = 'client_limit'
+        else:
+            return
+        self.rejected += 1
+        ADMISSION_REJECTED.inc(resource=self.name, reason=reason)
+        raise Overloaded(f"{self.name} is at capacity ({reason})", self._retry_after())
+
+    def _retry_after(self):
+        # Time for the work ahead to drain through the slots
+        rounds = self.queued // self.capacity + 1
+        return max(1, min(ADMISSION_MAX_RETRY_AFTER, math.ceil(self.average_seconds * rounds)))
+
+    def _withdraw(self, ticket):
+        """Take a ticket that never got a slot out of the line; False if it
+        was granted meanwhile"""
+        with self.lock:
+            if ticket.started_at is not None or ticket.released:
+                return False
+            self.waiting[ticket.client].remove(ticket)
+            if not self.waiting[ticket.client]:
+                del self.waiting[ticket.client]
+                self.turns.remove(ticket.client)
+            self.queued -= 1
+            self._forget(ticket)
+            ticket.released = True
+            self._publish()
+            return True
+
+    def _release(self, ticket):
+        if self._withdraw(ticket):
+            return
+        with self.lock:
+            if ticket.released:
+                return
+            ticket.released = True
+            self._forget(ticket)
+            self.in_flight -= 1
+            held = time.monotonic() - ticket.started_at
+            self.average_seconds += 0.2 * (held - self.average_seconds)
+            ready = []
+            while self.turns and self.in_flight < self.capacity:
+                client = self.turns.popleft()
+                line = self.waiting[client]
+                granted = line.popleft()
+                granted.started_at = time.monotonic()
+                ready.append(granted)
+                if line:
+                    self.turns.append(client)
+                else:
+                    del self.waiting[client]
+                self.queued -= 1
+                self.in_flight += 1
+            self._publish()
+        for granted in ready:
+            try:
+                self._start(granted)
+            except Exception as e:
+                logger.exception("Could not start queued %s work: %s", self.name, e)
+
+    def _forget(self, ticket):
+        self.admitted[ticket.client] -= 1
+        if not self.admitted[ticket.client]:
+            del self.admitted[ticket.client]
+
+    def _start(self, ticket):
+        # Outside the lock: starting may submit to an executor or wake a thread
+        ADMISSION_WAIT_SECONDS.observe(ticket.started_at - ticket.queued_at, resource=self.name)
+        try:
+            ticket.start(ticket)
+        except Exception:
+            ticket.release()
+            raise
+
+    def _publish(self):
+        ADMISSION_IN_FLIGHT.set(self.in_flight, resource=self.name)
+        ADMISSION_QUEUED.set(self.queued, resource=self.name)
@@ -0,0 +1,159 @@
+import re
+import json
+
+_DECODER = json.JSONDecoder()
+_CODE_FENCE = re.compile(r'```(?:json)?')
+
+
+def parse_json_object(text):
+    """Return the first JSON object in a model answer.
+
+    Markdown code fences and prose around the object are ignored. If the
+    answer was cut off mid-object, the longest prefix that can be closed
+    into valid JSON is returned with ``repaired`` set to True. Raises
+    ValueError if nothing usable is found.
+
+    Returns (data, repaired)."""
+    text = _CODE_FENCE.sub('', text or '')
+    start = text.find('{')
+    while start != -1:
+        try:
+            data, _ = _DECODER.raw_decode(text, start)
+            if isinstance(data, dict):
+                return data, False
+        except json.JSONDecodeError:
+            # Try closing this object before falling back to one nested in it
+            data = _close_truncated(text[start:])
+            if isinstance(data, dict):
+                return data, True
+        start = text.find('{', start + 1)
+    raise ValueError("No JSON object found in response")
+
+
+def _close_truncated(text):
+    """Close the strings, objects and arrays left open by a truncated answer.
+    Falls back to cutting at earlier commas when the tail is a dangling key
+    or half-written value."""
+    stack = []
+    cut_points = []
+    in_string = False
+    escaped = False
+    for index, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in '{[':
+            stack.append('}' if char == '{' else ']')
+        elif char in '}]':
+            if stack:
+                stack.pop()
+            if not stack:
+                # A complete object followed by garbage; raw_decode would
+                # already have found it, so the text is not JSON at all
+                return None
+        elif char == ',':
+            cut_points.append((index, list(stack)))
+
+    candidates = [(text + ('"' if in_string else ''), stack)]
+    candidates += [(text[:index], closers) for index, closers in reversed(cut_points)]
+    for prefix, closers in candidates:
+        try:
+            return json.loads(prefix + ''.join(reversed(closers)))
+        except json.JSONDecodeError:
+            continue
+    return None
+
+
+class SchemaError(ValueError):
+    """Raised when required fields are still missing after re-prompting"""
+
+    def __init__(self, missing):
+        super().__init__(f"Invalid or missing fields: {', '.join(missing)}")
+        self.missing = missing
+
+
+class Schema:
+    """Validates the JSON object a prompt asks for.
+
+    ``fields`` maps each top-level key to ``(check, example)``: ``check``
+    returns the cleaned value or raises ValueError/TypeError/KeyError, and
+    ``example`` shows the expected shape when only that key is re-prompted.
+    Keys listed in ``defaults`` are optional."""
+
+    def __init__(self, fields, defaults=None):
+        self.fields = fields
+        self.defaults = defaults or {}
+
+    def validate(self, data):
+        """Return (cleaned, missing): the valid fields and the names of the
+        required fields that are absent or malformed"""
+        cleaned = {}
+        missing = []
+        for name, (check, _) in self.fields.items():
+            try:
+                cleaned[name] = check(data[name])
+            except (KeyError, TypeError, ValueError, AttributeError):
+                if name in self.defaults:
+                    cleaned[name] = self.defaults[name]
+                else:
+                    missing.append(name)
+        return cleaned, missing
+
+    def repair_prompt(self, prompt, missing):
+        """A follow-up prompt asking only for the ``missing`` fields"""
+        example = ",\n".join(f'  "{name}": {self.fields[name][1]}' for name in missing)
+        return f"""{prompt}
+
+Your previous answer was incomplete. Reply with only these fields, as a JSON object:
+{{
+{example}
+}}
+"""
+
+
+def score(value, maximum=25):
+    return max(0, min(maximum, int(round(float(value)))))
+
+
+def text(value):
+    if not isinstance(value, str):
+        raise TypeError("Expected a string")
+    return value.strip()
+
+
+def text_list(value):
+    if isinstance(value, str):
+        value = [value]
+    items = [item.strip() for item in value if isinstance(item, str) and item.strip()]
+    if not items:
+        raise ValueError("Expected a non-empty list of strings")
+    return items
+
+
+def per_category(check, categories):
+    def validate(value):
+        return {category: check(value[category]) for category in categories}
+    return validate
+
+
+def choice(options):
+    lookup = {option.lower(): option for option in options}
+
+    def validate(value):
+        return lookup[str(value).strip().lower()]
+    return validate
+
+
+def recommendation(value):
+    return {
+        'decision': choice(('Pass', 'Fail'))(value['decision']),
+        'confidence': choice(('High', 'Medium', 'Low'))(value.get('confidence', 'Low')),
+        'reasoning': text(value.get('reasoning', ''))
+    }
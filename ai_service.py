@@ -1,144 +1,446 @@
+import re
 import json
-import google.generativeai as genai
-from config import GEMINI_API_KEY, CAS_QUESTIONS
+import time
+import hashlib
+from config import GEMINI_API_KEY, AI_BACKEND, FAKE_AI_LATENCY, AI_MAX_IN_FLIGHT, AI_MAX_QUEUE
+from result_cache import create_cache, hash_text
+from gemini_client import GeminiClient, CircuitOpenError
+from ai_output import (
+    Schema, SchemaError, parse_json_object, score, text, text_list, per_category, recommendation
+)
+from metrics import STAGE_SECONDS, FALLBACKS, AI_OUTPUT
+from structured_logging import get_logger, redact
+from deadlines import DeadlineExceeded
+from admission import AdmissionController
+
+logger = get_logger(__name__)
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+class FakeGenerativeModel:
+    """Deterministic stand-in for Gemini used for load testing without
+    network access. Scores are derived from a hash of the prompt."""
+    
+    def __init__(self, latency=FAKE_AI_LATENCY):
+        self.latency = latency
+    
+    def generate_content(self, prompt):
+        time.sleep(self.latency)
+        digest = hashlib.sha256(prompt.encode('utf-8')).digest()
+        if '"scores"' in prompt:
+            return FakeResponse(json.dumps({
+                'scores': {category: digest[i] % 26 for i, category in enumerate(AIService.CATEGORIES)},
+                'feedback': 'Generated by the fake analysis backend'
+            }))
+        if '"interviews"' in prompt:
+            count = len(re.findall(r'^=== Interview \d+ ===$', prompt, re.MULTILINE))
+            return FakeResponse(json.dumps({
+                'interviews': {str(number): self._synthesis(digest[number % len(digest)]) for number in range(1, count + 1)}
+            }))
+        return FakeResponse(json.dumps(self._synthesis(digest[0])))
+    
+    def _synthesis(self, seed):
+        return {
+            'feedback': {category: 'Generated by the fake analysis backend' for category in AIService.CATEGORIES},
+            'strengths': ['Fake strength'],
+            'improvements': ['Fake improvement'],
+            'recommendation': {
+                'decision': 'Pass' if seed % 2 else 'Fail',
+                'confidence': 'Low',
+                'reasoning': 'Generated by the fake analysis backend'
+            }
+        }
 
 class AIService:
-    def __init__(self, speech_service):
+    CATEGORIES = ('communication', 'knowledge', 'motivation', 'adaptability')
+    
+    ANSWER_SCHEMA = Schema({
+        'scores': (per_category(score, CATEGORIES), '{"communication": number, "knowledge": number, "motivation": number, "adaptability": number}'),
+        'feedback': (text, '"one or two sentences"'),
+    }, defaults={'feedback': ''})
+    
+    SYNTHESIS_SCHEMA = Schema({
+        'feedback': (per_category(text, CATEGORIES), '{"communication": "string", "knowledge": "string", "motivation": "string", "adaptability": "string"}'),
+        'strengths': (text_list, '["string"]'),
+        'improvements': (text_list, '["string"]'),
+        'recommendation': (recommendation, '{"decision": "Pass" | "Fail", "confidence": "High" | "Medium" | "Low", "reasoning": "string"}'),
+    }, defaults={'strengths': []})
+    
+    SYNTHESIS_INSTRUCTIONS = """Please provide:
+1. Detailed feedback for each category based on the actual speech content
+2. Strengths identified (if any)
+3. Areas for improvement
+4. Final recommendation (Pass/Fail with confidence level) consistent with the scores"""
+    
+    SYNTHESIS_FORMAT = """{
+  "feedback": {
+    "communication": "string",
+    "knowledge": "string",
+    "motivation": "string",
+    "adaptability": "string"
+  },
+  "strengths": ["string"],
+  "improvements": ["string"],
+  "recommendation": {
+    "decision": "Pass" | "Fail",
+    "confidence": "High" | "Medium" | "Low",
+    "reasoning": "string"
+  }
+}"""
+    
+    def __init__(self, speech_service, cache=None, client=None):
         self.speech_service = speech_service
-        genai.configure(api_key=GEMINI_API_KEY)
-        self.model = genai.GenerativeModel('gemini-1.5-flash')
+        self.cache = cache if cache is not None else create_cache('analyses')
+        # Gemini requests in flight at once, across answer scoring and analyses
+        self.admission = AdmissionController('gemini', AI_MAX_IN_FLIGHT, AI_MAX_QUEUE, typical_seconds=5)
+        if client is not None:
+            self.client = client
+        elif AI_BACKEND == 'fake':
+            self.client = GeminiClient(FakeGenerativeModel())
+        else:
+            # Imported here: the SDK takes longer to import than the rest of
+            # the app put together and the fake backend does not need it
+            import google.generativeai as genai
+            genai.configure(api_key=GEMINI_API_KEY)
+            self.client = GeminiClient(genai.GenerativeModel('gemini-1.5-flash'))
     
-    def analyze_interview(self, session_data):
+    def generate_json(self, prompt, schema=None):
+        """Send a prompt to Gemini and parse the JSON answer, reusing the
+        cached result for an identical (whitespace-normalized) prompt.
+        
+        With a ``schema`` the answer is validated and only the invalid
+        fields are asked for again; SchemaError carries whatever was valid
+        if they still fail."""
+        cache_key = hash_text(prompt)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            logger.debug("Analysis cache hit")
+            return cached
+        
+        result = self.request_json(prompt)
+        if schema is not None:
+            result = self.complete_json(prompt, result, schema)
+        self.cache.set(cache_key, result)
+        return result
+    
+    def request_json(self, prompt):
+        logger.debug("Sending Gemini request", extra={'prompt': redact(prompt)})
+        with self.admission.slot(), STAGE_SECONDS.time(stage='gemini_call'):
+            response_text = self.client.generate(prompt)
+        logger.debug("Gemini response received", extra={'response': redact(response_text)})
+        with STAGE_SECONDS.time(stage='json_parse'):
+            try:
+                result, repaired = parse_json_object(response_text)
+            except ValueError:
+                AI_OUTPUT.inc(outcome='unparseable')
+                raise
+        AI_OUTPUT.inc(outcome='repaired' if repaired else 'parsed')
+        return result
+    
+    def complete_json(self, prompt, result, schema):
+        """Validate ``result`` against ``schema``, re-prompting once for the
+        fields that are missing or malformed"""
+        cleaned, missing = schema.validate(result)
+        if not missing:
+            return cleaned
+        
+        logger.info("Re-prompting for invalid fields", extra={'fields': missing})
+        AI_OUTPUT.inc(outcome='reprompted')
         try:
-            print("\n=== AI ANALYSIS START ===")
-            
-            
-            responses_summary = []
-            for i, response in enumerate(session_data['responses']):
-                question = CAS_QUESTIONS[i]
-                transcription = response.get('transcription', {})
-                text = transcription.get('text', '')
-                has_content = self.speech_service.has_meaningful_content(transcription)
-                
-                print(f"\nQuestion {i+1}: {question}")
-                print(f"Raw transcription: \"{text}\"")
-                print(f"Has meaningful content: {has_content}")
-                
-                responses_summary.append({
-                    'question': question,
-                    'response': text if has_content else 'No meaningful speech detected',
-                    'has_content': has_content
-                })
-            
-            
-            prompt = self.create_analysis_prompt(responses_summary)
-            
-            print("\n=== WHAT AI RECEIVES ===")
-            print("Full interview summary sent to AI:")
-            print("----------------------------------------")
-            for item in responses_summary:
-                print(f"Q: {item['question']}")
-                print(f"A: {item['response']}")
-                print()
-            print("----------------------------------------")
+            retry = self.request_json(schema.repair_prompt(prompt, missing))
+        except Exception as e:
+            logger.warning("Re-prompt failed: %s", e)
+            retry = {}
+        fixed, still_missing = schema.validate({**result, **retry})
+        cleaned.update({name: fixed[name] for name in missing if name not in still_missing})
+        if still_missing:
+            AI_OUTPUT.inc(outcome='invalid')
+            error = SchemaError(still_missing)
+            error.partial = cleaned
+            raise error
+        return cleaned
+    
+    def analyze_answer(self, question, transcription):
+        """Score a single answer against the per-question rubric.
+        
+        Runs in the background as each answer arrives. Answers without
+        meaningful speech are scored locally without calling Gemini. Returns
+        None if the model call or its parsing fails."""
+        if not self.speech_service.has_meaningful_content(transcription):
+            reason = ((transcription or {}).get('prescreen') or {}).get('reason')
+            return {
+                'scores': {category: 0 for category in self.CATEGORIES},
+                'feedback': f'No meaningful speech detected ({reason})' if reason else 'No meaningful speech detected',
+                'hasContent': False
+            }
+        
+        try:
+            prompt = self.create_answer_prompt(question, transcription.get('text', ''))
+            result = self.generate_json(prompt, self.ANSWER_SCHEMA)
+            return {
+                'scores': result['scores'],
+                'feedback': result['feedback'],
+                'hasContent': True
+            }
+        except Exception as e:
+            logger.warning("Error scoring answer: %s", e)
+            return None
+    
+    def create_answer_prompt(self, question, response):
+        return f"""
+You are an expert CAS UK interview evaluator. Score this single interview answer.
+
+Question: {question}
+Response: {response}
+
+Score each category from 0 to 25 based only on this answer:
+- communication: clarity, structure and fluency
+- knowledge: knowledge of the course, university and UK study
+- motivation: genuine, specific reasons and goals
+- adaptability: ability to handle challenges and new environments
+
+Categories the question does not touch on should reflect whatever the answer
+does demonstrate; do not award points for content that is not there.
+
+Format your response as JSON with the following structure:
+{{
+  "scores": {{
+    "communication": number,
+    "knowledge": number,
+    "motivation": number,
+    "adaptability": number
+  }},
+  "feedback": "one or two sentences"
+}}
+
+Respond with the JSON object only, without markdown.
+"""
+    
+    def analyze_interview(self, session_data, fallback=True):
+        """Aggregate the per-answer scores and ask Gemini only for the final
+        synthesis (category feedback, strengths and recommendation).
+        
+        With ``fallback=False`` errors are raised instead of being answered
+        with the fallback scores; interviews without meaningful answers are
+        still scored without Gemini."""
+        try:
+            logger.info("AI analysis started")
             
-            # Get AI response
-            print("\nSending request to Gemini AI...")
-            response = self.model.generate_content(prompt)
-            ai_response = response.text
+            summary = self.summarize_interview(session_data)
+            if summary is None:
+                logger.info("No meaningful responses, skipping synthesis call")
+                return self.get_fallback_response(session_data)
             
-            print("\n=== AI RESPONSE ===")
-            print("Raw AI response:")
-            print("----------------------------------------")
-            print(ai_response)
-            print("----------------------------------------")
-
-            return self.parse_ai_response(ai_response)
+            synthesis = self.synthesize(*summary, fallback=fallback)
+            return self.build_analysis(summary[1], summary[2], synthesis)
             
+        except DeadlineExceeded as e:
+            if not fallback:
+                raise
+            logger.warning("AI analysis ran out of time: %s", e)
+            return self.get_fallback_response(session_data)
         except Exception as e:
-            print(f"Error in AI analysis: {e}")
+            if not fallback:
+                raise
+            logger.exception("Error in AI analysis: %s", e)
             return self.get_fallback_response(session_data)
     
-    def create_analysis_prompt(self, responses_summary):
+    def summarize_interview(self, session_data):
+        """Return (responses_summary, breakdown, overall_score) for a finished
+        interview, or None if no answer has meaningful content. Raises if an
+        answer cannot be scored."""
+        if self.client.breaker.state == 'open' and any(
+            r.get('answerAnalysis') is None for r in session_data.get('responses', [])
+        ):
+            # Unscored answers would each fail fast anyway
+            raise CircuitOpenError("Gemini circuit breaker is open")
+        
+        responses_summary = []
+        for response in session_data.get('responses', []):
+            question = response['question']
+            transcription = response.get('transcription', {})
+            has_content = self.speech_service.has_meaningful_content(transcription)
+            answer_analysis = response.get('answerAnalysis')
+            if answer_analysis is None:
+                # Scoring failed or never ran in the background
+                answer_analysis = self.analyze_answer(question, transcription)
+            if answer_analysis is None:
+                raise ValueError(f"Could not score answer to: {question}")
+            
+            responses_summary.append({
+                'question': question,
+                'response': transcription.get('text', '') if has_content else 'No meaningful speech detected',
+                'has_content': has_content,
+                'scores': answer_analysis['scores'],
+                'feedback': answer_analysis.get('feedback', '')
+            })
+        
+        if not any(item['has_content'] for item in responses_summary):
+            return None
+        
+        breakdown = {}
+        for category in self.CATEGORIES:
+            average = sum(item['scores'][category] for item in responses_summary) / len(responses_summary)
+            breakdown[category] = {'score': round(average), 'feedback': ''}
+        overall_score = sum(details['score'] for details in breakdown.values())
+        
+        logger.info("Aggregated per-answer scores", extra={'overallScore': overall_score})
+        return responses_summary, breakdown, overall_score
+    
+    def synthesize(self, responses_summary, breakdown, overall_score, draft=None, fallback=True):
+        """Ask Gemini for the wording of one interview's assessment.
+        
+        A ``draft`` (e.g. a partial entry from a batch answer) is completed
+        by asking only for its invalid fields instead of starting over.
+        With ``fallback=False`` errors are raised instead of being replaced
+        by the fallback wording."""
+        prompt = self.create_analysis_prompt(responses_summary, breakdown, overall_score)
+        try:
+            logger.debug("Sending synthesis request to Gemini")
+            if draft is not None:
+                synthesis = self.complete_json(prompt, draft, self.SYNTHESIS_SCHEMA)
+            else:
+                synthesis = self.generate_json(prompt, self.SYNTHESIS_SCHEMA)
+        except SchemaError as e:
+            if not fallback:
+                raise
+            # Keep the parts that were valid; only the rest is replaced
+            logger.warning("Incomplete synthesis, using fallback for: %s", ", ".join(e.missing))
+            synthesis = {**self.get_fallback_synthesis(responses_summary, overall_score), **e.partial}
+        except Exception as e:
+            if not fallback:
+                raise
+            # The scores are already known, so only the wording is lost
+            logger.warning("Error in synthesis call: %s", e)
+            return self.get_fallback_synthesis(responses_summary, overall_score)
+        
+        logger.info("AI analysis results", extra={
+            'strengths': len(synthesis['strengths']),
+            'improvements': len(synthesis['improvements']),
+            'recommendation': synthesis['recommendation'].get('decision', 'Unknown')
+        })
+        return synthesis
+    
+    def synthesize_batch(self, summaries):
+        """Synthesize several interviews with one Gemini request.
+        
+        ``summaries`` is a list of (responses_summary, breakdown,
+        overall_score) tuples; the syntheses are returned in the same order.
+        Entries with invalid fields are completed one by one, and interviews
+        missing from the answer are synthesized on their own."""
+        prompt = self.create_batch_analysis_prompt(summaries)
+        try:
+            logger.debug("Sending batch synthesis request to Gemini", extra={'interviews': len(summaries)})
+            results = self.generate_json(prompt).get('interviews', {})
+        except Exception as e:
+            logger.warning("Error in batch synthesis call: %s", e)
+            results = {}
+        
+        syntheses = []
+        for number, summary in enumerate(summaries, 1):
+            entry = results.get(str(number)) if isinstance(results, dict) else None
+            if not isinstance(entry, dict):
+                syntheses.append(self.synthesize(*summary))
+                continue
+            cleaned, missing = self.SYNTHESIS_SCHEMA.validate(entry)
+            syntheses.append(self.synthesize(*summary, draft=entry) if missing else cleaned)
+        return syntheses
+    
+    def build_analysis(self, breakdown, overall_score, synthesis):
+        breakdown = {category: dict(details) for category, details in breakdown.items()}
+        for category, details in breakdown.items():
+            details['feedback'] = synthesis.get('feedback', {}).get(category, '')
         
+        return {
+            'overallScore': overall_score,
+            'breakdown': breakdown,
+            'strengths': synthesis.get('strengths', []),
+            'improvements': synthesis.get('improvements', []),
+            'recommendation': synthesis.get('recommendation', {})
+        }
+    
+    def format_interview_summary(self, responses_summary, breakdown, overall_score):
         summary_text = "\n".join([
-            f"Question {i+1}: {item['question']}\nResponse: {item['response']}"
+            f"Question {i+1}: {item['question']}\nResponse: {item['response']}\n"
+            f"Scores: " + ", ".join(f"{category} {score}/25" for category, score in item['scores'].items())
+            + (f"\nNotes: {item['feedback']}" if item['feedback'] else "")
             for i, item in enumerate(responses_summary)
         ])
         
+        score_text = "\n".join(
+            f"- {category}: {details['score']}/25" for category, details in breakdown.items()
+        )
+        
+        return f"""Interview Summary:
+{summary_text}
+
+Final scores (already decided, do not change them):
+- overall: {overall_score}/100
+{score_text}"""
+    
+    def create_analysis_prompt(self, responses_summary, breakdown, overall_score):
         return f"""
-You are an expert CAS UK interview evaluator. Analyze the following interview responses and provide a comprehensive assessment.
+You are an expert CAS UK interview evaluator. Each answer below has already been
+scored. Write the final assessment for the whole interview.
 
-Interview Summary:
-{summary_text}
+{self.format_interview_summary(responses_summary, breakdown, overall_score)}
 
-CRITICAL SCORING GUIDELINES:
-- If the candidate provided no meaningful responses (only "No meaningful speech detected"), 
-  score them VERY LOW: 0-15 overall score
-- If responses are minimal or unclear, score 15-30 overall
-- Only score higher (30-100) if there are clear, meaningful responses with actual content
+{self.SYNTHESIS_INSTRUCTIONS}
 
-SCORING BREAKDOWN FOR SILENT/NO RESPONSE INTERVIEWS:
-- Communication Skills: 0-3 points (no communication demonstrated)
-- Knowledge: 0-3 points (no knowledge demonstrated)  
-- Motivation: 0-3 points (no motivation demonstrated)
-- Adaptability: 0-3 points (no adaptability demonstrated)
+Format your response as JSON with the following structure:
+{self.SYNTHESIS_FORMAT}
 
-For meaningful responses, analyze the actual content and use normal scoring (0-25 per category).
+Respond with the JSON object only, without markdown.
+"""
+    
+    def create_batch_analysis_prompt(self, summaries):
+        interviews_text = "\n\n".join(
+            f"=== Interview {number} ===\n{self.format_interview_summary(*summary)}"
+            for number, summary in enumerate(summaries, 1)
+        )
+        keys = ", ".join(f'"{number}"' for number in range(1, len(summaries) + 1))
+        
+        return f"""
+You are an expert CAS UK interview evaluator. Below are {len(summaries)} separate
+interviews with different candidates. Each answer has already been scored.
+Write the final assessment for each interview independently.
 
-Please provide:
-1. Overall Score (0-100) - Use guidelines above
-2. Breakdown scores for each category (0-25 each)
-3. Detailed feedback for each category based on the actual speech content
-4. Strengths identified (if any)
-5. Areas for improvement
-6. Final recommendation (Pass/Fail with confidence level)
+{interviews_text}
 
-Format your response as JSON with the following structure:
+For each interview:
+{self.SYNTHESIS_INSTRUCTIONS}
+
+Format your response as JSON with one entry per interview number ({keys}):
 {{
-  "overallScore": number,
-  "breakdown": {{
-    "communication": {{ "score": number, "feedback": "string" }},
-    "knowledge": {{ "score": number, "feedback": "string" }},
-    "motivation": {{ "score": number, "feedback": "string" }},
-    "adaptability": {{ "score": number, "feedback": "string" }}
-  }},
-  "strengths": ["string"],
-  "improvements": ["string"],
-  "recommendation": {{
-    "decision": "Pass" | "Fail",
-    "confidence": "High" | "Medium" | "Low",
-    "reasoning": "string"
+  "interviews": {{
+    "1": {self.SYNTHESIS_FORMAT.replace(chr(10), chr(10) + '    ')}
   }}
 }}
+
+Respond with the JSON object only, without markdown.
 """
     
-    def parse_ai_response(self, ai_response):
-        try:
-            start_idx = ai_response.find('{')
-            end_idx = ai_response.rfind('}') + 1
-            
-            if start_idx != -1 and end_idx != 0:
-                json_str = ai_response[start_idx:end_idx]
-                result = json.loads(json_str)
-                
-                print("\n=== AI ANALYSIS RESULTS ===")
-                print(f"✓ Overall Score: {result.get('overallScore', 0)}")
-                print("✓ Breakdown scores:")
-                for category, details in result.get('breakdown', {}).items():
-                    print(f"  - {category}: {details.get('score', 0)}/25 - \"{details.get('feedback', '')}\"")
-                print(f"✓ Recommendation: {result.get('recommendation', {}).get('decision', 'Unknown')}")
-                
-                return result
-            else:
-                raise ValueError("No JSON found in response")
-                
-        except Exception as e:
-            print(f"Error parsing AI response: {e}")
-            return self.get_fallback_response({})
+    def get_fallback_synthesis(self, responses_summary, overall_score):
+        FALLBACKS.inc(kind='synthesis')
+        return {
+            'feedback': {
+                category: "; ".join(item['feedback'] for item in responses_summary if item['feedback'])[:500]
+                for category in self.CATEGORIES
+            },
+            'strengths': ["Detailed synthesis unavailable - see per-question scores"],
+            'improvements': ["Detailed synthesis unavailable - see per-question scores"],
+            'recommendation': {
+                'decision': "Pass" if overall_score >= 50 else "Fail",
+                'confidence': "Low",
+                'reasoning': f"Based on aggregated per-question scores ({overall_score}/100)"
+            }
+        }
     
     def get_fallback_response(self, session_data):
-        print("\n=== USING FALLBACK RESPONSE ===")
+        logger.warning("Using fallback analysis response")
+        FALLBACKS.inc(kind='analysis')
         
 
         has_responses = session_data.get('responses', [])
@@ -0,0 +1,99 @@
+import os
+import time
+import threading
+import contextvars
+from config import ANALYSIS_BATCH_SIZE, ANALYSIS_BATCH_WAIT, ANALYSIS_TIMEOUT
+from structured_logging import get_logger
+import deadlines
+
+logger = get_logger(__name__)
+
+
+class AnalysisBatcher:
+    """Collects finished interviews for up to ``max_wait`` seconds and asks
+    Gemini for their final assessments in a single request.
+
+    Interviews arrive in bursts when a cohort finishes together; sending them
+    together shares the long instruction preamble and cuts API calls. A batch
+    is sent as soon as ``batch_size`` interviews are waiting. ``callback`` is
+    called with the analysis once it is ready, on the batcher's thread."""
+
+    def __init__(self, ai_service, batch_size=ANALYSIS_BATCH_SIZE, max_wait=ANALYSIS_BATCH_WAIT):
+        self.ai_service = ai_service
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.waiting = []
+        self.condition = threading.Condition()
+        self.thread = None
+        self.pid = None
+
+    def submit(self, session_data, callback):
+        with self.condition:
+            self._ensure_thread()
+            self.waiting.append((session_data, callback, contextvars.copy_context()))
+            self.condition.notify()
+
+    def pending(self):
+        with self.condition:
+            return len(self.waiting)
+
+    def _ensure_thread(self):
+        # Started on first use, so a batcher built in the gunicorn master
+        # before it forks gets its thread in the worker that uses it
+        if self.thread is None or self.pid != os.getpid():
+            self.thread = threading.Thread(target=self._run, name='analysis-batcher', daemon=True)
+            self.thread.start()
+            self.pid = os.getpid()
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                with deadlines.deadline(ANALYSIS_TIMEOUT):
+                    self._analyze(batch)
+            except Exception as e:
+                logger.exception("Batch analysis failed: %s", e)
+
+    def _next_batch(self):
+        with self.condition:
+            while not self.waiting:
+                self.condition.wait()
+            deadline = time.monotonic() + self.max_wait
+            while len(self.waiting) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            batch = self.waiting[:self.batch_size]
+            del self.waiting[:self.batch_size]
+            return batch
+
+    def _analyze(self, batch):
+        summarized = []
+        for session_data, callback, context in batch:
+            try:
+                summary = self.ai_service.summarize_interview(session_data)
+            except Exception as e:
+                logger.warning("Could not summarize session %s: %s", session_data.get('id'), e)
+                summary = None
+            if summary is None:
+                self._deliver(callback, context, self.ai_service.get_fallback_response(session_data))
+            else:
+                summarized.append((summary, callback, context))
+
+        if not summarized:
+            return
+        logger.info("Synthesizing interview batch", extra={'interviews': len(summarized)})
+        if len(summarized) == 1:
+            syntheses = [self.ai_service.synthesize(*summarized[0][0])]
+        else:
+            syntheses = self.ai_service.synthesize_batch([summary for summary, _, _ in summarized])
+
+        for (summary, callback, context), synthesis in zip(summarized, syntheses):
+            self._deliver(callback, context, self.ai_service.build_analysis(summary[1], summary[2], synthesis))
+
+    def _deliver(self, callback, context, analysis):
+        try:
+            context.run(callback, analysis)
+        except Exception as e:
+            logger.exception("Could not store batched analysis: %s", e)
@@ -1,92 +1,151 @@
-from flask import Flask
+from flask import Flask, Response, request, g, jsonify
 from flask_cors import CORS
-from config import FLASK_HOST, FLASK_PORT, FLASK_DEBUG
-from session_manager import SessionManager
-from speech_service import SpeechService
-from ai_service import AIService
-from routes import Routes
-import signal
-import sys
-
-app = Flask(__name__)
-
-# Simpler CORS configuration - allow all origins
-CORS(app)
-
-# Initialize services
-session_manager = SessionManager()
-speech_service = SpeechService()
-ai_service = AIService(speech_service)
-routes = Routes(session_manager, speech_service, ai_service)
-
-# Add CORS headers to all responses
-@app.after_request
-def after_request(response):
-    response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-    response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
-    return response
-
-# Add timeout handler
-def timeout_handler(signum, frame):
-    print("Request timeout - killing process")
-    sys.exit(1)
-
-# Set timeout for long operations (45 seconds)
-signal.signal(signal.SIGALRM, timeout_handler)
-
-# routes
-@app.route('/health', methods=['GET'])
-def health_check():
-    return {'status': 'healthy', 'message': 'CAS Interview System is running'}
-
-@app.route('/api/questions', methods=['GET'])
-def get_questions():
-    return routes.get_questions()
-
-@app.route('/api/start-interview', methods=['POST'])
-def start_interview():
-    return routes.start_interview()
-
-@app.route('/api/upload-audio', methods=['POST'])
-def upload_audio():
-    try:
-        # Set timeout for this request (45 seconds)
-        signal.alarm(45)
-        result = routes.upload_audio()
-        signal.alarm(0)  # Cancel timeout
-        return result
-    except Exception as e:
-        signal.alarm(0)  # Cancel timeout
-        print(f"Error in upload_audio route: {e}")
-        import traceback
-        traceback.print_exc()
-        return {'error': f'Upload failed: {str(e)}'}, 500
-
-@app.route('/api/test-upload', methods=['POST'])
-def test_upload():
-    try:
-        result = routes.test_upload()
-        return result
-    except Exception as e:
-        print(f"Error in test_upload route: {e}")
-        import traceback
-        traceback.print_exc()
-        return {'error': f'Test upload failed: {str(e)}'}, 500
-
-@app.route('/api/interview-result/<session_id>', methods=['GET'])
-def get_interview_result(session_id):
-    return routes.get_interview_result(session_id)
-
-@app.route('/api/interview-status/<session_id>', methods=['GET'])
-def get_interview_status(session_id):
-    return routes.get_interview_status(session_id)
-
-@app.route('/api/interview/<session_id>', methods=['DELETE'])
-def delete_interview(session_id):
-    return routes.delete_interview(session_id)
+from werkzeug.middleware.proxy_fix import ProxyFix
+from config import FLASK_HOST, FLASK_PORT, FLASK_DEBUG, MAX_CONTENT_LENGTH, REQUEST_TIMEOUT, TRUSTED_PROXY_HOPS
+from services import Services
+from upload_limits import AudioUploadRequest
+from structured_logging import get_logger, request_id_var
+from admission import Overloaded, client_var
+from metrics import (
+    REGISTRY, HTTP_REQUEST_SECONDS, ACTIVE_SESSIONS, STORED_SESSIONS, TRANSCRIPTION_QUEUE_PENDING, AUDIO_ARCHIVE_BYTES,
+    EVENT_STREAMS
+)
+import deadlines
+import startup
+import time
+import uuid
+
+logger = get_logger(__name__)
+
+
+def create_app(services=None):
+    """Application factory: ``gunicorn 'app:create_app()'``, see gunicorn.conf.py.
+    The services are available as ``app.extensions['cas']`` and are built
+    on first use, or all at once by ``warm()``."""
+    services = services if services is not None else Services()
+    app = Flask(__name__)
+    app.request_class = AudioUploadRequest
+    app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+    app.extensions['cas'] = services
+    if TRUSTED_PROXY_HOPS:
+        # remote_addr becomes the address the outermost trusted proxy saw
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS)
+
+    # Simpler CORS configuration - allow all origins
+    CORS(app)
+
+    # Gauges read services that are not built yet as empty rather than
+    # building them on a metrics scrape
+    ACTIVE_SESSIONS.set_function(
+        lambda: services.session_manager.store.count('active') if services.built('session_manager') else 0)
+    STORED_SESSIONS.set_function(
+        lambda: services.session_manager.store.count() if services.built('session_manager') else 0)
+    EVENT_STREAMS.set_function(lambda: services.event_bus.streams if services.built('event_bus') else 0)
+    TRANSCRIPTION_QUEUE_PENDING.set_function(
+        lambda: services.transcription_queue.pending if services.built('transcription_queue') else 0)
+    AUDIO_ARCHIVE_BYTES.set_function(
+        lambda: services.audio_archive.usage()['bytes']
+        if services.built('audio_archive') and services.audio_archive is not None else 0)
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+        g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+        request_id_var.set(g.request_id)
+        # Work is shared out fairly per client address (see TRUSTED_PROXY_HOPS)
+        client_var.set(request.remote_addr or '-')
+        # Checked cooperatively by long-running steps instead of a signal,
+        # so threaded and gevent workers can share a process
+        deadlines.start(REQUEST_TIMEOUT)
+        services.start()
+
+    @app.after_request
+    def record_request_latency(response):
+        if hasattr(g, 'request_started'):
+            endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - g.request_started,
+                endpoint=endpoint,
+                status=response.status_code
+            )
+        if hasattr(g, 'request_id'):
+            response.headers['X-Request-ID'] = g.request_id
+        return response
+
+    # Add CORS headers to all responses
+    @app.after_request
+    def after_request(response):
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+        response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
+        return response
+
+    @app.errorhandler(deadlines.DeadlineExceeded)
+    def deadline_exceeded(e):
+        logger.warning("Request ran past its deadline: %s", e)
+        return jsonify({'error': 'The request took too long, please retry'}), 504
+
+    @app.errorhandler(Overloaded)
+    def overloaded(e):
+        logger.warning("Request turned away: %s", e)
+        response = jsonify({'error': 'Server is busy, please retry shortly', 'retryAfter': e.retry_after})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 503
+
+    register_routes(app, services)
+    return app
+
+
+def register_routes(app, services):
+    routes = services.routes
+
+    @app.route('/health', methods=['GET'])
+    def health_check():
+        return {
+            'status': 'healthy',
+            'message': 'CAS Interview System is running',
+            'sessions': services.session_manager.get_occupancy(),
+            'caches': {
+                'transcriptions': services.speech_service.cache.stats() if services.built('speech_service') else None,
+                'analyses': services.ai_service.cache.stats() if services.built('ai_service') else None
+            },
+            'audioArchive': services.audio_archive.usage() if services.audio_archive is not None else None,
+            'lastSessionSweep': services.session_sweeper.last_sweep,
+            'admission': {
+                'transcription': services.transcription_queue.admission.stats()
+                if services.built('transcription_queue') else None,
+                'speech': services.speech_service.admission.stats() if services.built('speech_service') else None,
+                'gemini': services.ai_service.admission.stats() if services.built('ai_service') else None
+            },
+            'startup': startup.report()
+        }
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/api/questions', 'get_questions', routes.get_questions, methods=['GET'])
+    app.add_url_rule('/api/question-sets', 'get_question_sets', routes.get_question_sets, methods=['GET'])
+    app.add_url_rule('/api/start-interview', 'start_interview', routes.start_interview, methods=['POST'])
+    app.add_url_rule('/api/upload-audio', 'upload_audio', routes.upload_audio, methods=['POST'])
+    app.add_url_rule('/api/audio-stream', 'open_audio_stream', routes.open_audio_stream, methods=['POST'])
+    app.add_url_rule('/api/audio-stream/<stream_id>', 'get_audio_stream', routes.get_audio_stream, methods=['GET'])
+    app.add_url_rule('/api/audio-stream/<stream_id>/chunk', 'append_audio_chunk', routes.append_audio_chunk,
+                     methods=['POST'])
+    app.add_url_rule('/api/audio-stream/<stream_id>/finish', 'finish_audio_stream', routes.finish_audio_stream,
+                     methods=['POST'])
+    app.add_url_rule('/api/test-upload', 'test_upload', routes.test_upload, methods=['POST'])
+    app.add_url_rule('/api/interview-result/<session_id>', 'get_interview_result', routes.get_interview_result,
+                     methods=['GET'])
+    app.add_url_rule('/api/interview-status/<session_id>', 'get_interview_status', routes.get_interview_status,
+                     methods=['GET'])
+    app.add_url_rule('/api/interview-events/<session_id>', 'get_interview_events', routes.get_interview_events,
+                     methods=['GET'])
+    app.add_url_rule('/api/transcription-job/<job_id>', 'get_transcription_job', routes.get_transcription_job,
+                     methods=['GET'])
+    app.add_url_rule('/api/interview/<session_id>', 'delete_interview', routes.delete_interview, methods=['DELETE'])
+
 
 if __name__ == '__main__':
-    print("Starting CAS Interview System with Python Speech Recognition...")
-    print("Server will be available at http://localhost:5000")
-    app.run(debug=FLASK_DEBUG, host=FLASK_HOST, port=FLASK_PORT)
\ No newline at end of file
+    logger.info("Starting CAS Interview System at http://%s:%s", FLASK_HOST, FLASK_PORT)
+    create_app().run(debug=FLASK_DEBUG, host=FLASK_HOST, port=FLASK_PORT, threaded=True)
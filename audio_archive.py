@@ -0,0 +1,308 @@
+import os
+import time
+import shutil
+import hashlib
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+    UPLOAD_FOLDER, UPLOAD_CHUNK_BYTES, AUDIO_INDEX_PATH, AUDIO_TRANSCODE, AUDIO_OPUS_BITRATE,
+    AUDIO_RAW_RETENTION, AUDIO_RETENTION_DAYS, AUDIO_UNREFERENCED_TTL, AUDIO_ARCHIVE_MAX_MB
+)
+from sqlite_connections import ThreadConnections
+from structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+DAY = 24 * 60 * 60
+# A job hold outlives any job; older ones were left by a crashed worker
+HOLD_TTL = DAY
+
+
+class AudioArchive:
+    """Content-addressed storage for answer audio.
+
+    Each distinct recording is written once, as ``raw/ab/<sha256>.<ext>``
+    under UPLOAD_FOLDER, no matter how many answers or retries upload it.
+    A SQLite index tracks the sizes of every copy and which session answers
+    reference it, and is shared by all workers on the host. When ffmpeg is
+    available, a background thread transcodes each recording to
+    ``opus/ab/<sha256>.opus``.
+
+    Retention is applied by ``enforce_retention``:
+    - the raw upload is removed once transcribed (or after
+      AUDIO_RAW_RETENTION days), but only if an Opus copy exists and no
+      transcription job still holds it (identical uploads share it);
+    - recordings are removed after AUDIO_RETENTION_DAYS, or once no session
+      references them;
+    - the oldest transcribed audio is removed while the archive is larger
+      than AUDIO_ARCHIVE_MAX_MB."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS blobs (
+            hash TEXT PRIMARY KEY,
+            extension TEXT NOT NULL,
+            raw_size INTEGER,
+            compressed_size INTEGER,
+            created_at REAL NOT NULL,
+            transcribed_at REAL
+        );
+        CREATE TABLE IF NOT EXISTS refs (
+            session_id TEXT NOT NULL,
+            question_index INTEGER NOT NULL,
+            hash TEXT NOT NULL,
+            PRIMARY KEY (session_id, question_index)
+        );
+        CREATE TABLE IF NOT EXISTS holds (
+            job_id TEXT PRIMARY KEY,
+            hash TEXT NOT NULL,
+            created_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_refs_hash ON refs (hash);
+        CREATE INDEX IF NOT EXISTS idx_holds_hash ON holds (hash);
+        CREATE INDEX IF NOT EXISTS idx_blobs_created_at ON blobs (created_at);
+    """
+
+    def __init__(self, root=UPLOAD_FOLDER, index_path=AUDIO_INDEX_PATH, transcode=AUDIO_TRANSCODE,
+                 max_bytes=AUDIO_ARCHIVE_MAX_MB * 1024 * 1024):
+        self.root = os.path.abspath(root)
+        self.index_path = index_path
+        self.max_bytes = max_bytes
+        self.ffmpeg = shutil.which('ffmpeg') if transcode == 'opus' else None
+        self.transcoder = ThreadPoolExecutor(max_workers=1, thread_name_prefix='transcode')
+        os.makedirs(os.path.join(self.root, 'tmp'), exist_ok=True)
+        self._connection = ThreadConnections(index_path)
+        self._connection().executescript(self.SCHEMA)
+        if transcode == 'opus' and self.ffmpeg is None:
+            logger.warning("ffmpeg not found; archived audio is kept uncompressed")
+
+    def raw_path(self, audio_hash, extension):
+        return os.path.join(self.root, 'raw', audio_hash[:2], f"{audio_hash}.{extension}")
+
+    def compressed_path(self, audio_hash):
+        return os.path.join(self.root, 'opus', audio_hash[:2], f"{audio_hash}.opus")
+
+    def owns(self, path):
+        return os.path.abspath(path).startswith(self.root + os.sep)
+
+    @staticmethod
+    def hash_from_path(path):
+        return os.path.splitext(os.path.basename(path))[0]
+
+    def store(self, source, extension):
+        """Archive ``source`` (bytes or a readable file object) and return
+        (hash, path). Content that is already archived is not written again."""
+        extension = extension.lower().lstrip('.') or 'bin'
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.root, 'tmp'))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                chunks = [source] if isinstance(source, (bytes, bytearray)) else iter(
+                    lambda: source.read(UPLOAD_CHUNK_BYTES), b''
+                )
+                for chunk in chunks:
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+            audio_hash = digest.hexdigest()
+
+            row = self._connection().execute(
+                'SELECT extension, raw_size, compressed_size FROM blobs WHERE hash = ?', (audio_hash,)
+            ).fetchone()
+            if row is not None and row[1] is not None:
+                return audio_hash, self.raw_path(audio_hash, row[0])
+            already_compressed = row is not None and row[2] is not None
+
+            path = self.raw_path(audio_hash, extension)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+            self._connection().execute(
+                'INSERT INTO blobs (hash, extension, raw_size, created_at) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (hash) DO UPDATE SET extension = excluded.extension, raw_size = excluded.raw_size',
+                (audio_hash, extension, size, time.time())
+            )
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        if self.ffmpeg is not None and not already_compressed:
+            self.transcoder.submit(self._transcode, audio_hash, path)
+        return audio_hash, path
+
+    def locate(self, path):
+        """Return a readable file for an archived answer: the raw upload if
+        it is still there, otherwise its Opus copy (or None)"""
+        if path and os.path.exists(path):
+            return path
+        if path and self.owns(path):
+            compressed = self.compressed_path(self.hash_from_path(path))
+            if os.path.exists(compressed):
+                return compressed
+        return None
+
+    def add_reference(self, audio_hash, session_id, question_index):
+        self._connection().execute(
+            'INSERT OR REPLACE INTO refs (session_id, question_index, hash) VALUES (?, ?, ?)',
+            (session_id, question_index, audio_hash)
+        )
+
+    def hold(self, job_id, path):
+        """Keep the raw upload at ``path`` until ``release(job_id)``: a
+        transcription job is going to read it"""
+        if not self.owns(path):
+            return
+        self._connection().execute(
+            'INSERT OR REPLACE INTO holds (job_id, hash, created_at) VALUES (?, ?, ?)',
+            (job_id, self.hash_from_path(path), time.time())
+        )
+
+    def release(self, job_id):
+        self._connection().execute('DELETE FROM holds WHERE job_id = ?', (job_id,))
+
+    def mark_transcribed(self, path):
+        if not self.owns(path):
+            return
+        audio_hash = self.hash_from_path(path)
+        self._connection().execute(
+            'UPDATE blobs SET transcribed_at = ? WHERE hash = ? AND transcribed_at IS NULL',
+            (time.time(), audio_hash)
+        )
+        if AUDIO_RAW_RETENTION == 'transcribed':
+            self._drop_raw_if_compressed(audio_hash)
+
+    def release_session(self, session_id):
+        """Drop a session's references, deleting audio nothing else uses.
+        Returns the number of files deleted."""
+        conn = self._connection()
+        hashes = [row[0] for row in conn.execute('SELECT hash FROM refs WHERE session_id = ?', (session_id,))]
+        conn.execute('DELETE FROM refs WHERE session_id = ?', (session_id,))
+        deleted = 0
+        for audio_hash in set(hashes):
+            if conn.execute('SELECT 1 FROM refs WHERE hash = ? LIMIT 1', (audio_hash,)).fetchone() is None:
+                deleted += self._delete_blob(audio_hash)
+        return deleted
+
+    def enforce_retention(self, now=None):
+        """Apply the retention policies; returns the number of files deleted"""
+        now = now if now is not None else time.time()
+        conn = self._connection()
+        deleted = 0
+
+        # Holds left behind by workers that died mid-job
+        conn.execute('DELETE FROM holds WHERE created_at < ?', (now - HOLD_TTL,))
+
+        # Uploads never attached to an answer, e.g. from the test endpoint
+        for (audio_hash,) in conn.execute(
+            'SELECT hash FROM blobs WHERE created_at < ? AND hash NOT IN (SELECT hash FROM refs)',
+            (now - AUDIO_UNREFERENCED_TTL,)
+        ).fetchall():
+            deleted += self._delete_blob(audio_hash)
+
+        if AUDIO_RETENTION_DAYS > 0:
+            for (audio_hash,) in conn.execute(
+                'SELECT hash FROM blobs WHERE created_at < ?', (now - AUDIO_RETENTION_DAYS * DAY,)
+            ).fetchall():
+                deleted += self._delete_blob(audio_hash)
+
+        if AUDIO_RAW_RETENTION == 'transcribed':
+            # Raw copies that a job still held when they were transcribed
+            rows = conn.execute(
+                'SELECT hash FROM blobs WHERE raw_size IS NOT NULL AND compressed_size IS NOT NULL '
+                'AND transcribed_at IS NOT NULL'
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                'SELECT hash FROM blobs WHERE raw_size IS NOT NULL AND compressed_size IS NOT NULL '
+                'AND created_at < ?', (now - float(AUDIO_RAW_RETENTION) * DAY,)
+            ).fetchall()
+        for (audio_hash,) in rows:
+            deleted += self._drop_raw_if_compressed(audio_hash)
+
+        deleted += self._enforce_size_budget()
+        return deleted
+
+    def _enforce_size_budget(self):
+        # Oldest transcribed recordings go first: a raw copy that has an Opus
+        # copy, otherwise the recording. Untranscribed audio is never touched.
+        conn = self._connection()
+        deleted = 0
+        rows = conn.execute(
+            'SELECT hash, raw_size, compressed_size FROM blobs '
+            'WHERE transcribed_at IS NOT NULL ORDER BY created_at'
+        ).fetchall()
+        total = self.usage()['bytes']
+        for audio_hash, raw_size, compressed_size in rows:
+            if total <= self.max_bytes:
+                break
+            if raw_size is not None and compressed_size is not None:
+                deleted += self._drop_raw_if_compressed(audio_hash)
+                total -= raw_size
+            else:
+                deleted += self._delete_blob(audio_hash)
+                total -= (raw_size or 0) + (compressed_size or 0)
+        return deleted
+
+    def usage(self):
+        blobs, raw_bytes, compressed_bytes = self._connection().execute(
+            'SELECT COUNT(*), COALESCE(SUM(raw_size), 0), COALESCE(SUM(compressed_size), 0) FROM blobs'
+        ).fetchone()
+        return {
+            'recordings': blobs,
+            'bytes': raw_bytes + compressed_bytes,
+            'rawBytes': raw_bytes,
+            'compressedBytes': compressed_bytes,
+            'maxBytes': self.max_bytes
+        }
+
+    def _drop_raw_if_compressed(self, audio_hash):
+        row = self._connection().execute(
+            'SELECT extension, raw_size, compressed_size FROM blobs WHERE hash = ?', (audio_hash,)
+        ).fetchone()
+        if row is None or row[1] is None or row[2] is None:
+            return 0
+        if self._connection().execute('SELECT 1 FROM holds WHERE hash = ? LIMIT 1', (audio_hash,)).fetchone():
+            return 0
+        self._connection().execute('UPDATE blobs SET raw_size = NULL WHERE hash = ?', (audio_hash,))
+        return self._remove(self.raw_path(audio_hash, row[0]))
+
+    def _delete_blob(self, audio_hash):
+        conn = self._connection()
+        row = conn.execute('SELECT extension FROM blobs WHERE hash = ?', (audio_hash,)).fetchone()
+        if row is None:
+            return 0
+        conn.execute('DELETE FROM blobs WHERE hash = ?', (audio_hash,))
+        conn.execute('DELETE FROM refs WHERE hash = ?', (audio_hash,))
+        return self._remove(self.raw_path(audio_hash, row[0])) + self._remove(self.compressed_path(audio_hash))
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            return 1
+        except OSError:
+            return 0
+
+    def _transcode(self, audio_hash, raw_path):
+        target = self.compressed_path(audio_hash)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_target = f"{target}.{os.getpid()}.tmp"
+        try:
+            subprocess.run(
+                [self.ffmpeg, '-nostdin', '-loglevel', 'error', '-y', '-i', raw_path,
+                 '-ac', '1', '-c:a', 'libopus', '-b:a', AUDIO_OPUS_BITRATE, '-f', 'ogg', tmp_target],
+                check=True, timeout=300, capture_output=True
+            )
+            os.replace(tmp_target, target)
+            self._connection().execute(
+                'UPDATE blobs SET compressed_size = ? WHERE hash = ?', (os.path.getsize(target), audio_hash)
+            )
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.warning("Could not transcode %s to Opus: %s", audio_hash, e)
+            self._remove(tmp_target)
+            return
+
+        transcribed = self._connection().execute(
+            'SELECT transcribed_at FROM blobs WHERE hash = ?', (audio_hash,)
+        ).fetchone()
+        if AUDIO_RAW_RETENTION == 'transcribed' and transcribed and transcribed[0] is not None:
+            self._drop_raw_if_compressed(audio_hash)
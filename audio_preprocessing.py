@@ -0,0 +1,166 @@
+import io
+import math
+import wave
+import shutil
+import subprocess
+import importlib.util
+from pydub import AudioSegment
+
+# numpy is optional and only imported by NumpyPreprocessor, so the default
+# pydub path does not pay for loading it
+np = None
+
+TARGET_RATE = 16000
+
+
+def numpy_available():
+    return importlib.util.find_spec('numpy') is not None
+
+
+class NumpyPreprocessor:
+    """Decodes an answer into a float32 NumPy array and prepares it for
+    recognition: downmix to mono, polyphase resampling to 16 kHz and
+    16-bit PCM output.
+
+    PCM WAV is read directly; other formats are decoded by piping them
+    through ffmpeg, which writes 16 kHz mono samples to stdout (no temp
+    files), as the pydub path does. Only 16 kHz WAV, which needs no
+    resampling, is decoded faster than with pydub (see
+    benchmarks/preprocessing_benchmark.py), so this is opt-in
+    (AUDIO_PREPROCESSOR=numpy). Needs ``numpy``."""
+
+    def __init__(self, target_rate=TARGET_RATE, half_width=16):
+        global np
+        if not numpy_available():
+            raise RuntimeError("numpy is not installed")
+        import numpy as np
+        self.target_rate = target_rate
+        self.half_width = half_width
+        self.ffmpeg = shutil.which('ffmpeg')
+        self.filters = {}
+
+    def decode(self, audio_bytes, max_seconds=None):
+        """Return an un-normalized 16 kHz mono 16-bit AudioSegment"""
+        if audio_bytes[:4] == b'RIFF' and audio_bytes[8:12] == b'WAVE':
+            samples, rate = self._read_wav(audio_bytes, max_seconds)
+            samples = self.resample(samples, rate, self.target_rate)
+        else:
+            samples = self._ffmpeg_decode(audio_bytes, max_seconds)
+        return self.to_segment(samples)
+
+    def _read_wav(self, audio_bytes, max_seconds):
+        with wave.open(io.BytesIO(audio_bytes), 'rb') as wav:
+            channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+            frames = wav.getnframes()
+            if max_seconds is not None:
+                frames = min(frames, int(max_seconds * rate))
+            raw = wav.readframes(frames)
+
+        if width == 1:
+            samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+        elif width == 2:
+            samples = np.frombuffer(raw, dtype='<i2').astype(np.float32) / 32768.0
+        elif width == 3:
+            # Little-endian 24-bit: widen to int32 through the top three bytes
+            triples = np.frombuffer(raw[:len(raw) - len(raw) % 3], dtype=np.uint8).reshape(-1, 3)
+            widened = np.zeros((len(triples), 4), dtype=np.uint8)
+            widened[:, 1:] = triples
+            samples = widened.view('<i4').ravel().astype(np.float32) / 2147483648.0
+        elif width == 4:
+            samples = np.frombuffer(raw, dtype='<i4').astype(np.float32) / 2147483648.0
+        else:
+            raise ValueError(f"Unsupported WAV sample width: {width}")
+
+        if channels > 1:
+            # Summing column views is much faster than mean(axis=1) over
+            # the few interleaved channels
+            frames = samples[:len(samples) - len(samples) % channels].reshape(-1, channels)
+            mono = frames[:, 0].copy()
+            for channel in range(1, channels):
+                mono += frames[:, channel]
+            samples = mono * (1.0 / channels)
+        return samples, rate
+
+    def _ffmpeg_decode(self, audio_bytes, max_seconds):
+        if self.ffmpeg is None:
+            raise RuntimeError("ffmpeg is needed to decode compressed audio")
+        command = [self.ffmpeg, '-nostdin', '-loglevel', 'error', '-i', 'pipe:0']
+        if max_seconds is not None:
+            command += ['-t', str(max_seconds)]
+        command += ['-f', 's16le', '-ac', '1', '-ar', str(self.target_rate), 'pipe:1']
+        result = subprocess.run(command, input=audio_bytes, capture_output=True, check=True, timeout=120)
+        return np.frombuffer(result.stdout, dtype='<i2').astype(np.float32) / 32768.0
+
+    def resample(self, samples, rate, target_rate):
+        """Polyphase FIR resampling (Kaiser-windowed sinc).
+
+        Output samples ``up`` apart use the same filter phase and read input
+        windows ``down`` apart, so each of the ``up`` output streams is one
+        matrix-vector product over a strided view of the input."""
+        if rate == target_rate or not len(samples):
+            return samples
+        common = math.gcd(rate, target_rate)
+        up, down = target_rate // common, rate // common
+        phases, center = self._filter(up, down)
+        taps = phases.shape[1]
+
+        output_length = (len(samples) * up + down - 1) // down
+        padded = np.concatenate([np.zeros(taps, np.float32), samples, np.zeros(taps, np.float32)])
+        if up == 1:
+            return self._decimate(padded, phases[0], down, center, output_length)
+        # windows[i] is padded[i:i + taps]; phases are stored reversed to match
+        windows = np.lib.stride_tricks.sliding_window_view(padded, taps)
+        output = np.empty(output_length, dtype=np.float32)
+        for first in range(min(up, output_length)):
+            position = first * down + center
+            count = len(range(first, output_length, up))
+            start = position // up + 1
+            output[first::up] = windows[start:start + count * down:down] @ phases[position % up]
+        return output
+
+    def _decimate(self, padded, kernel, down, center, output_length):
+        # Integer ratios (48 or 32 kHz to 16 kHz): split the filter and the
+        # input into ``down`` interleaved branches so each branch is a plain
+        # convolution at the output rate
+        taps = len(kernel)
+        kernel = kernel[::-1]
+        output = np.zeros(output_length, dtype=np.float32)
+        for branch in range(down):
+            coefficients = kernel[branch::down]
+            offset = center - branch + taps
+            inputs = padded[offset % down::down]
+            first = offset // down
+            convolved = np.convolve(inputs, coefficients)
+            output += convolved[first:first + output_length]
+        return output
+
+    def _filter(self, up, down):
+        # Filter banks are reused for every clip at the same pair of rates
+        key = (up, down)
+        if key not in self.filters:
+            factor = max(up, down)
+            length = 2 * self.half_width * factor + 1
+            center = (length - 1) // 2
+            n = np.arange(length) - center
+            cutoff = 1.0 / factor
+            kernel = cutoff * np.sinc(cutoff * n) * np.kaiser(length, 5.0) * up
+            taps = -(-length // up)
+            padded = np.zeros(taps * up)
+            padded[:length] = kernel
+            # phases[p, j] = kernel[p + (taps - 1 - j) * up]
+            self.filters[key] = (padded.reshape(taps, up).T[:, ::-1].astype(np.float32).copy(), center)
+        return self.filters[key]
+
+    def normalize(self, segment, headroom_db=0.1):
+        """Peak-normalize a 16-bit mono segment (as AudioSegment.normalize).
+        The gain is applied in float32, so the samples are copied twice."""
+        samples = np.frombuffer(segment.raw_data, dtype='<i2')
+        peak = int(np.abs(samples.astype(np.int32)).max()) if len(samples) else 0
+        if peak == 0:
+            return segment
+        gain = 32768.0 * 10 ** (-headroom_db / 20) / peak
+        return self.to_segment(samples.astype(np.float32) * (gain / 32768.0))
+
+    def to_segment(self, samples):
+        pcm = np.clip(np.rint(samples * 32768.0), -32768, 32767).astype('<i2')
+        return AudioSegment(data=pcm.tobytes(), sample_width=2, frame_rate=self.target_rate, channels=1)
@@ -0,0 +1,92 @@
+import math
+import audioop
+
+
+def frame_levels(segment, frame_ms=30):
+    """Return the level of each ``frame_ms`` frame of a pydub AudioSegment in dBFS"""
+    frame_bytes = int(segment.frame_rate * frame_ms / 1000) * segment.frame_width
+    raw = segment.raw_data
+    max_amplitude = segment.max_possible_amplitude
+    levels = []
+    for offset in range(0, len(raw) - frame_bytes + 1, frame_bytes):
+        rms = audioop.rms(raw[offset:offset + frame_bytes], segment.sample_width)
+        levels.append(20 * math.log10(rms / max_amplitude) if rms else -float('inf'))
+    return levels
+
+
+def find_speech_chunks(segment, frame_ms=30, min_silence_ms=400, silence_offset_db=16,
+                       silence_floor_db=-50, max_chunk_ms=15000, padding_ms=200):
+    """Energy-based voice activity detection.
+
+    Frames quieter than the clip's average level minus ``silence_offset_db``
+    (but never louder than ``silence_floor_db``) count as silence. Speech
+    separated by at least ``min_silence_ms`` of silence forms separate
+    regions, which are packed into chunks of at most ``max_chunk_ms`` and
+    padded by ``padding_ms``. Returns ``(start_ms, end_ms)`` pairs, or an
+    empty list if no speech was found."""
+    levels = frame_levels(segment, frame_ms)
+    if not levels:
+        return []
+
+    threshold = max(silence_floor_db, segment.dBFS - silence_offset_db)
+    min_silence_frames = max(1, min_silence_ms // frame_ms)
+
+    # Contiguous speech regions, bridging gaps shorter than min_silence_ms
+    regions = []
+    silent_run = 0
+    for index, level in enumerate(levels):
+        if level > threshold:
+            start_ms, end_ms = index * frame_ms, (index + 1) * frame_ms
+            if regions and silent_run < min_silence_frames:
+                regions[-1][1] = end_ms
+            else:
+                regions.append([start_ms, end_ms])
+            silent_run = 0
+        else:
+            silent_run += 1
+
+    # Pack regions into chunks no longer than max_chunk_ms
+    chunks = []
+    for start_ms, end_ms in regions:
+        if chunks and end_ms - chunks[-1][0] <= max_chunk_ms:
+            chunks[-1][1] = end_ms
+            continue
+        while end_ms - start_ms > max_chunk_ms:
+            chunks.append([start_ms, start_ms + max_chunk_ms])
+            start_ms += max_chunk_ms
+        chunks.append([start_ms, end_ms])
+
+    duration_ms = len(segment)
+    return [
+        (max(0, start_ms - padding_ms), min(duration_ms, end_ms + padding_ms))
+        for start_ms, end_ms in chunks
+    ]
+
+
+def screen_speech(segment, min_duration_ms=1000, min_rms_db=-60, speech_db=-45,
+                  min_speech_ratio=0.03, frame_ms=30):
+    """Cheap check for whether a clip can contain an answer at all.
+
+    Unlike ``find_speech_chunks`` the thresholds are absolute, so the clip
+    must not have been normalized yet (normalizing turns a silent room into
+    loud noise). Returns a dict with the measurements, ``speech`` and, for
+    clips that fail, the ``reason``."""
+    levels = frame_levels(segment, frame_ms)
+    rms_db = segment.dBFS
+    speech_ratio = sum(1 for level in levels if level > speech_db) / len(levels) if levels else 0.0
+
+    if len(segment) < min_duration_ms:
+        reason = 'too short'
+    elif rms_db < min_rms_db:
+        reason = 'too quiet'
+    elif speech_ratio < min_speech_ratio:
+        reason = 'too little speech'
+    else:
+        reason = None
+    return {
+        'speech': reason is None,
+        'reason': reason,
+        'durationMs': len(segment),
+        'rmsDb': round(rms_db, 1) if rms_db != -float('inf') else None,
+        'speechRatio': round(speech_ratio, 3)
+    }
@@ -0,0 +1,373 @@
+"""Load test for the interview pipeline.
+
+Drives complete interviews (start-interview, one upload-audio per question,
+then polling interview-result) with a configurable number of concurrent
+candidates and reports p50/p95/p99 latency per endpoint and per pipeline
+stage, throughput and peak RSS. Results are written as JSON so that runs
+can be compared for regressions.
+
+In-process mode (the default) imports the app and swaps in the fake speech
+and Gemini backends with the requested latency, so no network access is
+needed and stage timings are collected. With --url the same interviews are
+driven against a running server; start it with SPEECH_BACKENDS=fake,
+AI_BACKEND=fake, CACHE_MAX_ENTRIES=0 and TRANSCRIPTION_PER_CLIENT=0 for
+comparable numbers (every simulated candidate comes from one address).
+Uploads turned away with 503 are retried after their Retry-After.
+
+    python benchmarks/pipeline_benchmark.py --interviews 20 --concurrency 5
+    python benchmarks/pipeline_benchmark.py --output run.json --compare baseline.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import resource
+import struct
+import sys
+import threading
+import time
+import urllib.request
+import urllib.error
+import uuid
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+QUESTION_COUNT = 10
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.m4a', '.ogg', '.webm')
+
+
+class Recorder:
+    """Thread-safe collection of latency samples keyed by name"""
+
+    def __init__(self):
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self.lock:
+            self.samples.setdefault(name, []).append(seconds)
+
+    @contextlib.contextmanager
+    def timed(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def summary(self):
+        with self.lock:
+            return {name: summarize(values) for name, values in sorted(self.samples.items())}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(values):
+    ordered = sorted(values)
+    return {
+        'count': len(ordered),
+        'mean': sum(ordered) / len(ordered),
+        'p50': percentile(ordered, 0.50),
+        'p95': percentile(ordered, 0.95),
+        'p99': percentile(ordered, 0.99),
+        'max': ordered[-1],
+    }
+
+
+def synthesize_answer(question_index, seconds):
+    """A WAV answer of tone bursts separated by pauses, so the silence
+    splitter and recognizers see something speech-like"""
+    rate = 16000
+    samples = []
+    burst = 0
+    while len(samples) < seconds * rate:
+        length = int(rate * (1.5 + (question_index + burst) % 3))
+        frequency = 180 + 40 * ((question_index + burst) % 5)
+        samples.extend(
+            int(6000 * math.sin(2 * math.pi * frequency * i / rate))
+            for i in range(length)
+        )
+        samples.extend([0] * int(rate * 0.6))
+        burst += 1
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(struct.pack(f'<{len(samples)}h', *samples))
+    return buffer.getvalue()
+
+
+def load_fixtures(directory, answer_seconds):
+    if directory:
+        names = sorted(n for n in os.listdir(directory) if n.lower().endswith(AUDIO_EXTENSIONS))
+        if not names:
+            raise SystemExit(f"No audio fixtures found in {directory}")
+        fixtures = []
+        for name in names:
+            with open(os.path.join(directory, name), 'rb') as f:
+                fixtures.append((name, f.read()))
+        return [fixtures[i % len(fixtures)] for i in range(QUESTION_COUNT)]
+    return [
+        (f"answer-{i}.wav", synthesize_answer(i, answer_seconds[i % len(answer_seconds)]))
+        for i in range(QUESTION_COUNT)
+    ]
+
+
+class InProcessClient:
+    def __init__(self, app):
+        self.app = app
+
+    def request(self, method, path, form=None, filename=None, audio=None):
+        client = self.app.test_client()
+        data = dict(form or {})
+        if audio is not None:
+            data['audio'] = (io.BytesIO(audio), filename)
+        response = client.open(path, method=method, data=data or None)
+        return response.status_code, response.get_json(silent=True)
+
+
+class HttpClient:
+    def __init__(self, base_url, timeout=120):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def request(self, method, path, form=None, filename=None, audio=None):
+        body = None
+        headers = {}
+        if form is not None or audio is not None:
+            boundary = uuid.uuid4().hex
+            parts = []
+            for key, value in (form or {}).items():
+                parts.append(
+                    f'--{boundary}\r\nContent-Disposition: form-data; name="{key}"\r\n\r\n{value}\r\n'.encode()
+                )
+            if audio is not None:
+                parts.append(
+                    f'--{boundary}\r\nContent-Disposition: form-data; name="audio"; filename="{filename}"\r\n'
+                    f'Content-Type: application/octet-stream\r\n\r\n'.encode() + audio + b'\r\n'
+                )
+            parts.append(f'--{boundary}--\r\n'.encode())
+            body = b''.join(parts)
+            headers['Content-Type'] = f'multipart/form-data; boundary={boundary}'
+        req = urllib.request.Request(self.base_url + path, data=body, method=method, headers=headers)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                return response.status, json.loads(response.read() or b'null')
+        except urllib.error.HTTPError as e:
+            try:
+                return e.code, json.loads(e.read() or b'null')
+            except ValueError:
+                return e.code, None
+
+
+def run_interview(client, fixtures, recorder, poll_interval, result_timeout, max_retry_wait):
+    started = time.perf_counter()
+    with recorder.timed('endpoint:start-interview'):
+        status, data = client.request('POST', '/api/start-interview')
+    if status != 200:
+        raise RuntimeError(f"start-interview returned {status}")
+    session_id = data['sessionId']
+
+    for index, (filename, audio) in enumerate(fixtures):
+        waited = 0
+        while True:
+            with recorder.timed('endpoint:upload-audio'):
+                status, data = client.request(
+                    'POST', '/api/upload-audio',
+                    form={'sessionId': session_id, 'questionIndex': str(index)},
+                    filename=filename, audio=audio
+                )
+            if status != 503 or waited >= max_retry_wait:
+                break
+            # Server busy: back off as long as it asks
+            retry_after = (data or {}).get('retryAfter') or 1
+            recorder.add('upload:retry-after', retry_after)
+            time.sleep(retry_after)
+            waited += retry_after
+        if status >= 400:
+            raise RuntimeError(f"upload-audio returned {status}: {data}")
+
+    uploaded = time.perf_counter()
+    deadline = uploaded + result_timeout
+    while True:
+        with recorder.timed('endpoint:interview-result'):
+            status, data = client.request('GET', f'/api/interview-result/{session_id}')
+        if status == 200:
+            break
+        if time.perf_counter() > deadline:
+            raise RuntimeError(f"No result for {session_id} after {result_timeout}s")
+        time.sleep(poll_interval)
+
+    finished = time.perf_counter()
+    recorder.add('interview:result-wait', finished - uploaded)
+    recorder.add('interview:total', finished - started)
+    client.request('DELETE', f'/api/interview/{session_id}')
+
+
+def instrument(recorder, speech_service, ai_service):
+    """Wrap the pipeline stages of the in-process services with timers"""
+    stages = [
+        (speech_service, 'decode_audio', 'stage:decode'),
+        (speech_service, 'split_speech', 'stage:segment'),
+        (speech_service, 'recognize_ranges', 'stage:recognize'),
+        (ai_service, 'analyze_answer', 'stage:analyze-answer'),
+        (ai_service, 'analyze_interview', 'stage:analyze'),
+    ]
+    for target, attribute, name in stages:
+        original = getattr(target, attribute)
+
+        def wrapper(*args, _original=original, _name=name, **kwargs):
+            with recorder.timed(_name):
+                return _original(*args, **kwargs)
+
+        setattr(target, attribute, wrapper)
+
+
+def build_in_process_client(args, recorder):
+    from app import create_app
+    from ai_service import FakeGenerativeModel
+    from gemini_client import GeminiClient
+    from result_cache import MemoryCache
+    from speech_backends import FakeBackend
+
+    app = create_app()
+    services = app.extensions['cas']
+    # Every simulated candidate shares the test client's address, so the
+    # per-client share would turn most of them away
+    services.transcription_queue.admission.per_client = 0
+    services.speech_service.backend = FakeBackend(
+        latency=args.recognizer_latency,
+        latency_per_second=args.recognizer_latency_per_second
+    )
+    services.ai_service.client = GeminiClient(FakeGenerativeModel(latency=args.ai_latency))
+    if not args.with_cache:
+        services.speech_service.cache = MemoryCache(max_entries=0)
+        services.ai_service.cache = MemoryCache(max_entries=0)
+    instrument(recorder, services.speech_service, services.ai_service)
+    return InProcessClient(app)
+
+
+def compare(current, baseline, max_regression):
+    """Print p95 changes against a baseline run; returns the regressed names"""
+    regressions = []
+    print(f"\n{'metric':<32}{'baseline p95':>14}{'current p95':>14}{'change':>10}")
+    for name, stats in current['latency'].items():
+        before = baseline.get('latency', {}).get(name)
+        if not before or not before.get('p95'):
+            continue
+        change = (stats['p95'] - before['p95']) / before['p95']
+        flag = ' !' if change > max_regression else ''
+        print(f"{name:<32}{before['p95'] * 1000:>12.1f}ms{stats['p95'] * 1000:>12.1f}ms{change:>+9.0%}{flag}")
+        if change > max_regression:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='Benchmark a running server instead of the in-process app')
+    parser.add_argument('--interviews', type=int, default=10, help='Number of complete interviews to run')
+    parser.add_argument('--concurrency', type=int, default=4, help='Interviews running at the same time')
+    parser.add_argument('--fixtures', help='Directory of audio files to upload (default: synthesized WAVs)')
+    parser.add_argument('--answer-seconds', type=float, nargs='+', default=[8, 20, 35],
+                        help='Lengths of the synthesized answers, cycled over the questions')
+    parser.add_argument('--recognizer-latency', type=float, default=0.3, help='Fake recognizer latency per call (s)')
+    parser.add_argument('--recognizer-latency-per-second', type=float, default=0.02,
+                        help='Extra fake recognizer latency per second of audio (s)')
+    parser.add_argument('--ai-latency', type=float, default=1.0, help='Fake Gemini latency per call (s)')
+    parser.add_argument('--with-cache', action='store_true', help='Keep the transcription and analysis caches enabled')
+    parser.add_argument('--poll-interval', type=float, default=0.25, help='Seconds between interview-result polls')
+    parser.add_argument('--result-timeout', type=float, default=300, help='Give up waiting for a result after this long')
+    parser.add_argument('--max-retry-wait', type=float, default=120,
+                        help='Give up retrying a busy (503) upload after waiting this long in total')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='Baseline JSON file to compare p95 latencies against')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='Fail when a p95 latency grows by more than this fraction of the baseline')
+    parser.add_argument('--verbose', action='store_true', help='Show the server log output')
+    args = parser.parse_args(argv)
+
+    recorder = Recorder()
+    fixtures = load_fixtures(args.fixtures, args.answer_seconds)
+    quiet = contextlib.nullcontext() if args.verbose or args.url else contextlib.redirect_stdout(io.StringIO())
+
+    errors = []
+    with quiet:
+        client = HttpClient(args.url) if args.url else build_in_process_client(args, recorder)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            futures = [
+                executor.submit(run_interview, client, fixtures, recorder, args.poll_interval, args.result_timeout,
+                                args.max_retry_wait)
+                for _ in range(args.interviews)
+            ]
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    errors.append(str(e))
+        elapsed = time.perf_counter() - started
+
+    completed = args.interviews - len(errors)
+    requests_made = sum(
+        stats['count'] for name, stats in recorder.summary().items() if name.startswith('endpoint:')
+    )
+    results = {
+        'timestamp': datetime.now().isoformat(),
+        'mode': 'http' if args.url else 'in-process',
+        'platform': platform.platform(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'elapsedSeconds': elapsed,
+        'completedInterviews': completed,
+        'errors': errors,
+        'throughput': {
+            'interviewsPerSecond': completed / elapsed if elapsed else None,
+            'requestsPerSecond': requests_made / elapsed if elapsed else None,
+        },
+        # ru_maxrss is in KiB on Linux; only meaningful for the in-process app
+        'peakRssMb': None if args.url else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'latency': recorder.summary(),
+    }
+
+    print(f"{completed}/{args.interviews} interviews in {elapsed:.1f}s "
+          f"({results['throughput']['interviewsPerSecond']:.2f} interviews/s, "
+          f"{results['throughput']['requestsPerSecond']:.1f} requests/s)")
+    if results['peakRssMb'] is not None:
+        print(f"Peak RSS: {results['peakRssMb']:.1f} MB")
+    print(f"\n{'metric':<32}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name, stats in results['latency'].items():
+        print(f"{name:<32}{stats['count']:>7}"
+              f"{stats['p50'] * 1000:>8.1f}ms{stats['p95'] * 1000:>8.1f}ms{stats['p99'] * 1000:>8.1f}ms")
+    for error in errors[:5]:
+        print(f"ERROR: {error}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    exit_code = 1 if errors else 0
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.max_regression)
+        if regressions:
+            print(f"\nRegressed beyond {args.max_regression:.0%}: {', '.join(regressions)}")
+            exit_code = 1
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""Compare the pydub and NumPy audio preprocessing paths.
+
+Runs SpeechService.decode_audio (decode, downmix, resample to 16 kHz and
+normalize) on the same files with each engine and reports per-file
+p50/p95 time, the speedup, and how far the NumPy output strays from the
+pydub output (RMS difference in dB relative to the signal). Without
+--fixtures, WAV answers are synthesized at common recording formats
+(44.1 kHz stereo, 48 kHz mono, 16 kHz mono).
+
+    python benchmarks/preprocessing_benchmark.py --repeat 20
+    python benchmarks/preprocessing_benchmark.py --fixtures answers/ --output preprocessing.json
+"""
+import argparse
+import io
+import json
+import math
+import os
+import struct
+import sys
+import time
+import wave
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('SPEECH_BACKENDS', 'fake')
+
+from pipeline_benchmark import AUDIO_EXTENSIONS, summarize
+
+
+def synthesize_wav(seconds, rate, channels):
+    """A gliding tone with pauses, interleaved over ``channels``"""
+    samples = []
+    for i in range(int(seconds * rate)):
+        t = i / rate
+        value = 0 if (t % 2.0) > 1.5 else int(8000 * math.sin(2 * math.pi * (150 + 40 * t) * t))
+        samples.extend([value] * channels)
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(struct.pack(f'<{len(samples)}h', *samples))
+    return buffer.getvalue()
+
+
+def load_fixtures(directory, seconds):
+    if directory:
+        names = sorted(n for n in os.listdir(directory) if n.lower().endswith(AUDIO_EXTENSIONS))
+        if not names:
+            raise SystemExit(f"No audio fixtures found in {directory}")
+        fixtures = []
+        for name in names:
+            with open(os.path.join(directory, name), 'rb') as f:
+                fixtures.append((name, f.read()))
+        return fixtures
+    return [
+        (f"{rate // 1000}k-{'stereo' if channels == 2 else 'mono'}-{seconds}s.wav",
+         synthesize_wav(seconds, rate, channels))
+        for rate, channels in ((44100, 2), (48000, 1), (16000, 1))
+    ]
+
+
+def time_engine(service, audio, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        segment = service.decode_audio(audio)
+        timings.append(time.perf_counter() - started)
+    return segment, summarize(timings)
+
+
+def difference_db(reference, candidate):
+    """RMS of the sample-wise difference relative to the reference's RMS"""
+    import numpy as np
+    a = np.frombuffer(reference.raw_data, dtype='<i2').astype(np.float64)
+    b = np.frombuffer(candidate.raw_data, dtype='<i2').astype(np.float64)
+    length = min(len(a), len(b))
+    if not length:
+        return None
+    signal = math.sqrt(np.mean(a[:length] ** 2)) or 1.0
+    error = math.sqrt(np.mean((a[:length] - b[:length]) ** 2))
+    return 20 * math.log10(error / signal) if error else -float('inf')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fixtures', help='Directory of audio files to preprocess (default: synthesized WAVs)')
+    parser.add_argument('--seconds', type=int, default=60, help='Length of synthesized answers')
+    parser.add_argument('--repeat', type=int, default=10, help='Runs per file and engine')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    from audio_preprocessing import numpy_available
+    from speech_service import SpeechService
+    if not numpy_available():
+        raise SystemExit("numpy is not installed; nothing to compare against")
+
+    engines = {
+        'pydub': SpeechService(preprocessor='pydub', prescreen=False),
+        'numpy': SpeechService(preprocessor='numpy', prescreen=False)
+    }
+    results = []
+    for name, audio in load_fixtures(args.fixtures, args.seconds):
+        # One untimed run each so filter design and imports are not counted
+        outputs = {engine: service.decode_audio(audio) for engine, service in engines.items()}
+        timings = {}
+        for engine, service in engines.items():
+            outputs[engine], timings[engine] = time_engine(service, audio, args.repeat)
+        results.append({
+            'file': name,
+            'bytes': len(audio),
+            'durationMs': len(outputs['pydub']),
+            'timings': timings,
+            'speedup': timings['pydub']['p50'] / timings['numpy']['p50'],
+            'differenceDb': difference_db(outputs['pydub'], outputs['numpy'])
+        })
+
+    print(f"{'file':32} {'pydub p50':>10} {'numpy p50':>10} {'speedup':>8} {'diff dB':>8}")
+    for result in results:
+        difference = result['differenceDb']
+        print(f"{result['file'][:32]:32} "
+              f"{result['timings']['pydub']['p50'] * 1000:8.1f}ms "
+              f"{result['timings']['numpy']['p50'] * 1000:8.1f}ms "
+              f"{result['speedup']:7.2f}x "
+              f"{difference if difference is not None else float('nan'):8.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'repeat': args.repeat, 'results': results}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -9,6 +9,7 @@ import './App.css';
 function App() {
   const [sessionId, setSessionId] = useState(null);
   const [interviewData, setInterviewData] = useState(null);
+  const [questionSetId, setQuestionSetId] = useState(null);
 
   useEffect(() => {
     // Check if there's a saved session
@@ -17,6 +18,7 @@ function App() {
       const session = JSON.parse(savedSession);
       console.log('Loading saved session:', session.sessionId);
       setSessionId(session.sessionId);
+      setQuestionSetId(session.questionSetId || null);
       setInterviewData(session.data);
     }
   }, []);
@@ -24,20 +26,28 @@ function App() {
   const startNewInterview = async () => {
     try {
       console.log('Starting new interview...');
+      // A question set can be picked with ?set=<id>; the server default otherwise
+      const requestedSet = new URLSearchParams(window.location.search).get('set');
       const response = await fetch(getApiUrl('/api/start-interview'), {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
         },
+        body: JSON.stringify(requestedSet ? { questionSetId: requestedSet } : {}),
       });
       
       const data = await response.json();
+      if (!response.ok) {
+        throw new Error(data.error || 'Failed to start interview');
+      }
       console.log('Interview started, session ID:', data.sessionId);
       setSessionId(data.sessionId);
+      setQuestionSetId(data.questionSetId);
       
       // Save session to localStorage
       localStorage.setItem('interviewSession', JSON.stringify({
         sessionId: data.sessionId,
+        questionSetId: data.questionSetId,
         data: null
       }));
       
@@ -50,6 +60,7 @@ function App() {
   const clearSession = () => {
     console.log('Clearing session');
     setSessionId(null);
+    setQuestionSetId(null);
     setInterviewData(null);
     localStorage.removeItem('interviewSession');
   };
@@ -58,6 +69,7 @@ function App() {
     setInterviewData(data);
     localStorage.setItem('interviewSession', JSON.stringify({
       sessionId,
+      questionSetId,
       data
     }));
   };
@@ -85,6 +97,7 @@ function App() {
               sessionId ? (
                 <Interview 
                   sessionId={sessionId}
+                  questionSetId={questionSetId}
                   onInterviewComplete={handleInterviewComplete}
                   onInterviewCancelled={handleInterviewCancelled}
                 />
@@ -3,7 +3,7 @@ import { useNavigate } from 'react-router-dom';
 import { FaMicrophone, FaMicrophoneSlash, FaPlay, FaPause, FaStop, FaTimes, FaVolumeUp, FaVolumeMute } from 'react-icons/fa';
 import { getApiUrl } from '../config';
 
-const Interview = ({ sessionId, onInterviewComplete, onInterviewCancelled }) => {
+const Interview = ({ sessionId, questionSetId, onInterviewComplete, onInterviewCancelled }) => {
   const navigate = useNavigate();
   const [questions, setQuestions] = useState([]);
   const [currentQuestionIndex, setCurrentQuestionIndex] = useState(0);
@@ -23,6 +23,9 @@ const Interview = ({ sessionId, onInterviewComplete, onInterviewCancelled }) =>
   const timerRef = useRef(null);
   const audioRef = useRef(null);
   const speechRef = useRef(null);
+  const streamIdRef = useRef(null);
+  const chunkSeqRef = useRef(0);
+  const chunkChainRef = useRef(Promise.resolve());
 
   useEffect(() => {
     fetchQuestions();
@@ -116,7 +119,8 @@ const Interview = ({ sessionId, onInterviewComplete, onInterviewCancelled }) =>
 
   const fetchQuestions = async () => {
     try {
-      const response = await fetch(getApiUrl('/api/questions'));
+      const query = questionSetId ? `?set=${encodeURIComponent(questionSetId)}` : '';
+      const response = await fetch(getApiUrl(`/api/questions${query}`));
       const data = await response.json();
       setQuestions(data.questions);
     } catch (error) {
@@ -125,14 +129,59 @@ const Interview = ({ sessionId, onInterviewComplete, onInterviewCancelled }) =>
     }
   };
 
+  // Open a server-side stream so the answer is transcribed while it is recorded.
+  // If this fails the answer is uploaded in one piece when it is submitted.
+  const openAudioStream = async () => {
+    streamIdRef.current = null;
+    chunkSeqRef.current = 0;
+    chunkChainRef.current = Promise.resolve();
+    try {
+      const response = await fetch(getApiUrl('/api/audio-stream'), {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ sessionId, questionIndex: currentQuestionIndex })
+      });
+      if (response.ok) {
+        const data = await response.json();
+        streamIdRef.current = data.streamId;
+      }
+    } catch (error) {
+      console.error('Error opening audio stream:', error);
+    }
+  };
+
+  const sendAudioChunk = (chunk) => {
+    const streamId = streamIdRef.current;
+    if (!streamId) return;
+    const seq = chunkSeqRef.current++;
+    // Chunks are sent one at a time so they arrive in order
+    chunkChainRef.current = chunkChainRef.current.then(async () => {
+      if (streamIdRef.current !== streamId) return;
+      try {
+        const response = await fetch(getApiUrl(`/api/audio-stream/${streamId}/chunk?seq=${seq}`), {
+          method: 'POST',
+          body: chunk
+        });
+        if (!response.ok) {
+          streamIdRef.current = null;
+        }
+      } catch (error) {
+        console.error('Error streaming audio chunk:', error);
+        streamIdRef.current = null;
+      }
+    });
+  };
+
   const startRecording = async () => {
     try {
       const stream = await navigator.mediaDevices.getUserMedia({ audio: true });
       mediaRecorderRef.current = new MediaRecorder(stream);
       audioChunksRef.current = [];
+      await openAudioStream();
 
       mediaRecorderRef.current.ondataavailable = (event) => {
         audioChunksRef.current.push(event.data);
+        sendAudioChunk(event.data);
       };
 
       mediaRecorderRef.current.onstop = () => {
@@ -141,7 +190,8 @@ const Interview = ({ sessionId, onInterviewComplete, onInterviewCancelled }) =>
         stream.getTracks().forEach(track => track.stop());
       };
 
-      mediaRecorderRef.current.start();
+      // Emit a chunk every second so it can be streamed to the server
+      mediaRecorderRef.current.start(1000);
       setIsRecording(true);
       setRecordingTime(0);
       setError(null);
@@ -210,6 +260,28 @@ const Interview = ({ sessionId, onInterviewComplete, onInterviewCancelled }) =>
     setShowCancelConfirm(false);
   };
 
+  const finishAudioStream = async () => {
+    await chunkChainRef.current;
+    const streamId = streamIdRef.current;
+    streamIdRef.current = null;
+    if (!streamId) return null;
+    try {
+      const finish = () => fetch(getApiUrl(`/api/audio-stream/${streamId}/finish`), { method: 'POST' });
+      let response = await finish();
+      if (response.status === 503) {
+        // The stream is kept when the server is busy: finish it once more
+        // after Retry-After before falling back to uploading the recording
+        const retryAfter = Number(response.headers.get('Retry-After')) || 1;
+        await new Promise((resolve) => setTimeout(resolve, Math.min(retryAfter, 10) * 1000));
+        response = await finish();
+      }
+      return response.ok ? await response.json() : null;
+    } catch (error) {
+      console.error('Error finishing audio stream:', error);
+      return null;
+    }
+  };
+
   const uploadAudio = async () => {
     if (!audioBlob) return;
 
@@ -217,10 +289,23 @@ const Interview = ({ sessionId, onInterviewComplete, onInterviewCancelled }) =>
     setError(null);
 
     try {
+      const streamed = await finishAudioStream();
+      if (streamed && streamed.success) {
+        if (streamed.isComplete) {
+          setIsAnalyzing(true);
+          await waitForAnalysis();
+        } else {
+          setCurrentQuestionIndex(streamed.nextQuestionIndex);
+          setAudioBlob(null);
+          setRecordingTime(0);
+        }
+        return;
+      }
+
       const formData = new FormData();
-      formData.append('audio', audioBlob, 'recording.wav');
       formData.append('sessionId', sessionId);
       formData.append('questionIndex', currentQuestionIndex.toString());
+      formData.append('audio', audioBlob, 'recording.wav');
 
       console.log('Uploading audio with sessionId:', sessionId, 'questionIndex:', currentQuestionIndex);
       console.log('Audio blob size:', audioBlob.size);
@@ -229,7 +314,9 @@ const Interview = ({ sessionId, onInterviewComplete, onInterviewCancelled }) =>
       const controller = new AbortController();
       const timeoutId = setTimeout(() => controller.abort(), 45000);
 
-      const response = await fetch(getApiUrl('/api/upload-audio'), {
+      // The query string lets the server reject a bad session before the audio is sent
+      const uploadParams = new URLSearchParams({ sessionId, questionIndex: currentQuestionIndex.toString() });
+      const response = await fetch(getApiUrl(`/api/upload-audio?${uploadParams}`), {
         method: 'POST',
         body: formData,
         signal: controller.signal
@@ -276,28 +363,52 @@ const Interview = ({ sessionId, onInterviewComplete, onInterviewCancelled }) =>
   };
 
   const waitForAnalysis = async () => {
-    // Poll for results
-    const pollInterval = setInterval(async () => {
-      try {
-        const response = await fetch(getApiUrl(`/api/interview-result/${sessionId}`));
-        if (response.ok) {
-          const data = await response.json();
-          clearInterval(pollInterval);
-          setIsAnalyzing(false);
-          onInterviewComplete(data);
-          navigate('/results');
-        }
-      } catch (error) {
-        console.error('Error polling for results:', error);
-      }
-    }, 2000);
+    // The server pushes the result over server-sent events as soon as the
+    // analysis is stored; EventSource reconnects by itself if the stream drops
+    const events = new EventSource(getApiUrl(`/api/interview-events/${sessionId}`));
 
     // Timeout after 30 seconds
-    setTimeout(() => {
-      clearInterval(pollInterval);
+    const timeoutId = setTimeout(() => {
+      events.close();
       setIsAnalyzing(false);
       setError('Analysis is taking longer than expected. Please check results page.');
     }, 30000);
+
+    // An answer that could not be processed is not recorded; go back to
+    // that question so the candidate can answer it again
+    const redoQuestion = (questionIndex) => {
+      events.close();
+      clearTimeout(timeoutId);
+      setIsAnalyzing(false);
+      setCurrentQuestionIndex(questionIndex);
+      setAudioBlob(null);
+      setRecordingTime(0);
+      setError(`Your answer to question ${questionIndex + 1} could not be processed. Please record it again.`);
+    };
+
+    events.addEventListener('status', (event) => {
+      const failed = Object.entries(JSON.parse(event.data).transcriptions || {})
+        .find(([, entry]) => entry.status === 'failed');
+      if (failed) {
+        redoQuestion(parseInt(failed[0], 10));
+      }
+    });
+
+    events.addEventListener('job-failed', (event) => {
+      redoQuestion(JSON.parse(event.data).questionIndex);
+    });
+
+    events.addEventListener('result', (event) => {
+      events.close();
+      clearTimeout(timeoutId);
+      setIsAnalyzing(false);
+      onInterviewComplete(JSON.parse(event.data));
+      navigate('/results');
+    });
+
+    events.onerror = () => {
+      console.error('Interview event stream interrupted, reconnecting');
+    };
   };
 
   const formatTime = (seconds) => {
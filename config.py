@@ -21,5 +21,165 @@ CAS_QUESTIONS = [
     "How do you stay organized and manage your time?"
 ]
 
+# Question sets: CAS_QUESTIONS is the built-in 'general' set; more sets (per
+# university or visa route) are read once at startup from QUESTION_BANK_PATH,
+# see question_sets.example.json. Clients may cache the served question lists
+# for QUESTION_CACHE_MAX_AGE seconds.
+QUESTION_BANK_PATH = os.getenv('QUESTION_BANK_PATH', 'question_sets.json')
+DEFAULT_QUESTION_SET = os.getenv('DEFAULT_QUESTION_SET', 'general')
+QUESTION_CACHE_MAX_AGE = int(os.getenv('QUESTION_CACHE_MAX_AGE', 5 * 60))
+
 UPLOAD_FOLDER = 'uploads'
-ALLOWED_AUDIO_EXTENSIONS = {'wav', 'mp3', 'm4a', 'ogg', 'webm'} 
\ No newline at end of file
+ALLOWED_AUDIO_EXTENSIONS = {'wav', 'mp3', 'm4a', 'ogg', 'webm'}
+
+# Upload limits: answers larger or longer than this are rejected. Uploads are
+# kept in memory up to UPLOAD_SPOOL_BYTES and spooled to a temp file beyond
+# that, then copied to UPLOAD_FOLDER in UPLOAD_CHUNK_BYTES pieces.
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_MB', 25)) * 1024 * 1024
+MAX_ANSWER_SECONDS = int(os.getenv('MAX_ANSWER_SECONDS', 5 * 60))
+UPLOAD_SPOOL_BYTES = int(os.getenv('UPLOAD_SPOOL_BYTES', 512 * 1024))
+UPLOAD_CHUNK_BYTES = int(os.getenv('UPLOAD_CHUNK_BYTES', 64 * 1024))
+# Whole request bodies, allowing for the multipart form around the audio
+MAX_CONTENT_LENGTH = MAX_UPLOAD_BYTES + 64 * 1024
+
+# Deadlines (seconds): a request still running after REQUEST_TIMEOUT is
+# answered with 504. Each background transcription job (recognition and answer
+# scoring) gets JOB_TIMEOUT and each final analysis ANALYSIS_TIMEOUT; speech
+# recognition and Gemini calls shorten their timeouts to the time left.
+REQUEST_TIMEOUT = float(os.getenv('REQUEST_TIMEOUT', 45))
+JOB_TIMEOUT = float(os.getenv('JOB_TIMEOUT', 180))
+ANALYSIS_TIMEOUT = float(os.getenv('ANALYSIS_TIMEOUT', 120))
+
+# Background transcription jobs: at most TRANSCRIPTION_MAX_PENDING accepted
+# answers (running or waiting) and TRANSCRIPTION_PER_CLIENT per client address
+# (0 for no limit); further uploads get 503 with Retry-After
+TRANSCRIPTION_WORKERS = int(os.getenv('TRANSCRIPTION_WORKERS', 2))
+TRANSCRIPTION_MAX_PENDING = int(os.getenv('TRANSCRIPTION_MAX_PENDING', 50))
+TRANSCRIPTION_PER_CLIENT = int(os.getenv('TRANSCRIPTION_PER_CLIENT', 20))
+
+# Clients are told apart by address. Behind reverse proxies, set
+# TRUSTED_PROXY_HOPS to how many of them append to X-Forwarded-For (1 on
+# Render); the header is ignored otherwise, since clients can forge it.
+TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', 0))
+
+# Admission control: recognitions and Gemini requests in flight per process,
+# and how many more may wait for a slot before work is turned away. Waiting
+# work is served round-robin across clients. Retry-After is capped at
+# ADMISSION_MAX_RETRY_AFTER seconds.
+SPEECH_MAX_IN_FLIGHT = int(os.getenv('SPEECH_MAX_IN_FLIGHT', 4))
+SPEECH_MAX_QUEUE = int(os.getenv('SPEECH_MAX_QUEUE', 16))
+AI_MAX_IN_FLIGHT = int(os.getenv('AI_MAX_IN_FLIGHT', os.getenv('GEMINI_MAX_CONCURRENCY', 4)))
+AI_MAX_QUEUE = int(os.getenv('AI_MAX_QUEUE', 32))
+ADMISSION_MAX_RETRY_AFTER = int(os.getenv('ADMISSION_MAX_RETRY_AFTER', 60))
+
+# Session storage: 'memory' (single worker) or 'sqlite' (shared between workers)
+SESSION_STORE = os.getenv('SESSION_STORE', 'memory')
+SESSION_DB_PATH = os.getenv('SESSION_DB_PATH', 'data/sessions.db')
+
+# Interview progress events pushed to clients over server-sent events:
+# 'memory' (single worker) or 'sqlite' (shared between workers, follows
+# SESSION_STORE by default). Events are kept EVENT_RETENTION seconds so a
+# reconnecting client can catch up; an event stream is closed after
+# EVENT_STREAM_SECONDS (clients reconnect) and sends a keepalive comment every
+# EVENT_KEEPALIVE seconds. EVENT_POLL_INTERVAL is how often a stream checks the
+# shared database for events published by other workers.
+EVENT_BUS = os.getenv('EVENT_BUS', SESSION_STORE)
+EVENT_DB_PATH = os.getenv('EVENT_DB_PATH', 'data/events.db')
+EVENT_RETENTION = int(os.getenv('EVENT_RETENTION', 60 * 60))
+EVENT_STREAM_SECONDS = int(os.getenv('EVENT_STREAM_SECONDS', 120))
+EVENT_KEEPALIVE = float(os.getenv('EVENT_KEEPALIVE', 15))
+EVENT_POLL_INTERVAL = float(os.getenv('EVENT_POLL_INTERVAL', 0.5))
+
+# Session eviction (seconds); abandoned sessions and their uploads are removed
+SESSION_IDLE_TTL = int(os.getenv('SESSION_IDLE_TTL', 60 * 60))
+SESSION_MAX_AGE = int(os.getenv('SESSION_MAX_AGE', 24 * 60 * 60))
+SESSION_MAX_COUNT = int(os.getenv('SESSION_MAX_COUNT', 1000))
+SESSION_SWEEP_INTERVAL = int(os.getenv('SESSION_SWEEP_INTERVAL', 60))
+
+# Transcription and analysis result caches: 'memory' (per worker) or 'disk' (shared)
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory')
+CACHE_DIR = os.getenv('CACHE_DIR', 'data/cache')
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 5000))
+CACHE_TTL = int(os.getenv('CACHE_TTL', 7 * 24 * 60 * 60))
+
+# Keep a copy of each uploaded answer in UPLOAD_FOLDER (transcription runs in memory)
+PERSIST_UPLOADS = os.getenv('PERSIST_UPLOADS', 'true').lower() == 'true'
+
+# Audio archive: each recording is stored once per content hash in
+# UPLOAD_FOLDER and transcoded to Opus in the background when ffmpeg is
+# available ('none' keeps only the upload). Raw uploads are removed once
+# transcribed, or after AUDIO_RAW_RETENTION days if set to a number, but only
+# when an Opus copy exists. All audio is removed after AUDIO_RETENTION_DAYS
+# (0 keeps it while its session exists) and the oldest transcribed audio
+# goes first when the archive grows past AUDIO_ARCHIVE_MAX_MB.
+AUDIO_INDEX_PATH = os.getenv('AUDIO_INDEX_PATH', 'data/audio_index.db')
+AUDIO_TRANSCODE = os.getenv('AUDIO_TRANSCODE', 'opus')
+AUDIO_OPUS_BITRATE = os.getenv('AUDIO_OPUS_BITRATE', '24k')
+AUDIO_RAW_RETENTION = os.getenv('AUDIO_RAW_RETENTION', 'transcribed')
+AUDIO_RETENTION_DAYS = float(os.getenv('AUDIO_RETENTION_DAYS', 30))
+AUDIO_UNREFERENCED_TTL = int(os.getenv('AUDIO_UNREFERENCED_TTL', 60 * 60))
+AUDIO_ARCHIVE_MAX_MB = int(os.getenv('AUDIO_ARCHIVE_MAX_MB', 1024))
+
+# Long answers are split on silence and the chunks recognized concurrently;
+# set TRANSCRIPTION_CHUNKING=false to send each answer in a single request
+TRANSCRIPTION_CHUNKING = os.getenv('TRANSCRIPTION_CHUNKING', 'true').lower() == 'true'
+CHUNK_WORKERS = int(os.getenv('CHUNK_WORKERS', 4))
+CHUNK_MIN_AUDIO_MS = int(os.getenv('CHUNK_MIN_AUDIO_MS', 10000))
+CHUNK_MIN_SILENCE_MS = int(os.getenv('CHUNK_MIN_SILENCE_MS', 400))
+CHUNK_MAX_MS = int(os.getenv('CHUNK_MAX_MS', 15000))
+
+# Audio decoding and resampling: 'pydub' uses AudioSegment; 'numpy' (needs
+# numpy, which requirements.txt does not install) reads WAV into a NumPy
+# array and resamples it itself, 'auto' picks numpy when installed. Opt-in:
+# benchmarks/preprocessing_benchmark.py only shows it faster for 16 kHz WAV,
+# and compressed uploads are decoded by ffmpeg either way.
+AUDIO_PREPROCESSOR = os.getenv('AUDIO_PREPROCESSOR', 'pydub')
+
+# Pre-screen: before normalizing or calling the recognizer, answers shorter
+# than PRESCREEN_MIN_DURATION_MS, quieter overall than PRESCREEN_MIN_RMS_DB, or
+# with fewer than PRESCREEN_MIN_SPEECH_RATIO of their frames louder than
+# PRESCREEN_SPEECH_DB (all dBFS, measured before normalizing) are marked silent
+PRESCREEN_ENABLED = os.getenv('PRESCREEN_ENABLED', 'true').lower() == 'true'
+PRESCREEN_MIN_DURATION_MS = int(os.getenv('PRESCREEN_MIN_DURATION_MS', 1000))
+PRESCREEN_MIN_RMS_DB = float(os.getenv('PRESCREEN_MIN_RMS_DB', -60))
+PRESCREEN_SPEECH_DB = float(os.getenv('PRESCREEN_SPEECH_DB', -45))
+PRESCREEN_MIN_SPEECH_RATIO = float(os.getenv('PRESCREEN_MIN_SPEECH_RATIO', 0.03))
+
+# Speech recognition backends, tried in order: google, vosk, whisper, fake
+SPEECH_BACKENDS = os.getenv('SPEECH_BACKENDS', 'google')
+VOSK_MODEL_PATH = os.getenv('VOSK_MODEL_PATH', 'models/vosk')
+WHISPER_MODEL_SIZE = os.getenv('WHISPER_MODEL_SIZE', 'base.en')
+FAKE_RECOGNIZER_LATENCY = float(os.getenv('FAKE_RECOGNIZER_LATENCY', 0.0))
+
+# Streaming uploads: answers transcribed while they are being recorded
+STREAM_WORKERS = int(os.getenv('STREAM_WORKERS', 2))
+STREAM_CHUNK_MAX_MS = int(os.getenv('STREAM_CHUNK_MAX_MS', 5000))
+STREAM_IDLE_TTL = int(os.getenv('STREAM_IDLE_TTL', 10 * 60))
+STREAM_MAX_BYTES = int(os.getenv('STREAM_MAX_BYTES', MAX_UPLOAD_BYTES))
+
+# Analysis backend: 'gemini', or 'fake' for load testing without network access
+AI_BACKEND = os.getenv('AI_BACKEND', 'gemini')
+FAKE_AI_LATENCY = float(os.getenv('FAKE_AI_LATENCY', 0.0))
+
+# Gemini calls: per-attempt timeout, retries of transient errors, in-flight
+# limit per process, and the circuit breaker that stops calling after rate
+# limits or repeated failures
+GEMINI_TIMEOUT = float(os.getenv('GEMINI_TIMEOUT', 30))
+GEMINI_MAX_RETRIES = int(os.getenv('GEMINI_MAX_RETRIES', 2))
+GEMINI_BACKOFF_BASE = float(os.getenv('GEMINI_BACKOFF_BASE', 0.5))
+GEMINI_BACKOFF_MAX = float(os.getenv('GEMINI_BACKOFF_MAX', 8))
+GEMINI_MAX_CONCURRENCY = int(os.getenv('GEMINI_MAX_CONCURRENCY', 4))
+GEMINI_CIRCUIT_FAILURES = int(os.getenv('GEMINI_CIRCUIT_FAILURES', 5))
+GEMINI_CIRCUIT_COOLDOWN = float(os.getenv('GEMINI_CIRCUIT_COOLDOWN', 60))
+
+# Batch analysis: finished interviews are synthesized together, up to
+# ANALYSIS_BATCH_SIZE per Gemini request, waiting at most ANALYSIS_BATCH_WAIT
+# seconds for a batch to fill. A batch size of 1 sends each one on its own.
+ANALYSIS_BATCH_SIZE = int(os.getenv('ANALYSIS_BATCH_SIZE', 1))
+ANALYSIS_BATCH_WAIT = float(os.getenv('ANALYSIS_BATCH_WAIT', 2.0))
+
+# Logging: level, 'json' or 'text' output, and the fraction of transcripts
+# and prompts logged in full (the rest are redacted to a length summary)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+LOG_TRANSCRIPT_SAMPLE_RATE = float(os.getenv('LOG_TRANSCRIPT_SAMPLE_RATE', 0.0))
@@ -0,0 +1,58 @@
+import time
+import contextlib
+from contextvars import ContextVar
+
+# Absolute time.monotonic() deadline of the current request or job, if any
+_deadline = ContextVar('deadline', default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Raised when the current request or background job runs out of time"""
+
+
+def start(seconds):
+    """Give the current context a deadline ``seconds`` from now (None or 0
+    for no deadline), replacing any inherited one"""
+    return _deadline.set(time.monotonic() + seconds if seconds else None)
+
+
+@contextlib.contextmanager
+def deadline(seconds):
+    token = start(seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    """Seconds left before the deadline, or None without a deadline"""
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+def check(stage):
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(f"Deadline exceeded before {stage}")
+
+
+def timeout(default, stage):
+    """``default`` shortened to the time left; raises DeadlineExceeded if
+    there is none"""
+    check(stage)
+    left = remaining()
+    return default if left is None else min(default, left)
+
+
+def bind(fn):
+    """Wrap ``fn`` so it runs under the caller's deadline on another thread"""
+    at = _deadline.get()
+
+    def run(*args, **kwargs):
+        token = _deadline.set(at)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _deadline.reset(token)
+    return run
@@ -0,0 +1,185 @@
+import json
+import time
+import threading
+from collections import deque
+from sqlite_connections import ThreadConnections
+from config import (
+    EVENT_BUS, EVENT_DB_PATH, EVENT_RETENTION, EVENT_STREAM_SECONDS, EVENT_KEEPALIVE, EVENT_POLL_INTERVAL
+)
+
+# Client reconnection delay sent at the start of each stream (milliseconds)
+RETRY_MS = 3000
+
+
+class EventBus:
+    """Interview progress events per session: 'transcription-ready',
+    'analysis-ready', 'job-failed' and the final 'result'.
+
+    Event ids increase, so a client that reconnects with Last-Event-ID is
+    sent exactly what it missed while events are retained."""
+
+    def __init__(self):
+        self.streams = 0
+        self.streams_lock = threading.Lock()
+
+    def publish(self, session_id, event_type, data):
+        """Record an event and wake the streams waiting for it; returns its id"""
+        raise NotImplementedError
+
+    def read(self, session_id, after_id, timeout):
+        """(id, type, data) of the session's events newer than ``after_id``,
+        waiting up to ``timeout`` seconds for the first one"""
+        raise NotImplementedError
+
+    def latest_id(self, session_id):
+        raise NotImplementedError
+
+    def prune(self, max_age=EVENT_RETENTION):
+        raise NotImplementedError
+
+    def stream(self, session_id, after_id, max_seconds=EVENT_STREAM_SECONDS, keepalive=EVENT_KEEPALIVE):
+        """Yield the session's events newer than ``after_id`` as server-sent
+        events until the 'result' event or ``max_seconds``, with a keepalive
+        comment while nothing happens"""
+        with self.streams_lock:
+            self.streams += 1
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            ends = time.monotonic() + max_seconds
+            while True:
+                remaining = ends - time.monotonic()
+                if remaining <= 0:
+                    return
+                events = self.read(session_id, after_id, min(keepalive, remaining))
+                if not events:
+                    yield ": keepalive\n\n"
+                    continue
+                for event_id, event_type, data in events:
+                    after_id = event_id
+                    yield format_event(event_type, data, event_id)
+                    if event_type == 'result':
+                        return
+        finally:
+            with self.streams_lock:
+                self.streams -= 1
+
+
+def format_event(event_type, data, event_id=None):
+    lines = [] if event_id is None else [f"id: {event_id}"]
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {json.dumps(data, default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+
+class MemoryEventBus(EventBus):
+    """Keeps the last ``max_events`` events of each session in this process;
+    for a single worker and for tests"""
+
+    def __init__(self, max_events=100):
+        super().__init__()
+        self.max_events = max_events
+        self.sessions = {}
+        self.next_id = 1
+        self.condition = threading.Condition()
+
+    def publish(self, session_id, event_type, data):
+        with self.condition:
+            event_id = self.next_id
+            self.next_id += 1
+            events = self.sessions.setdefault(session_id, deque(maxlen=self.max_events))
+            events.append((event_id, event_type, data, time.time()))
+            self.condition.notify_all()
+        return event_id
+
+    def read(self, session_id, after_id, timeout):
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while True:
+                events = [(event_id, event_type, data)
+                          for event_id, event_type, data, _ in self.sessions.get(session_id, ())
+                          if event_id > after_id]
+                remaining = deadline - time.monotonic()
+                if events or remaining <= 0:
+                    return events
+                self.condition.wait(remaining)
+
+    def latest_id(self, session_id):
+        with self.condition:
+            events = self.sessions.get(session_id)
+            return events[-1][0] if events else 0
+
+    def prune(self, max_age=EVENT_RETENTION):
+        cutoff = time.time() - max_age
+        with self.condition:
+            stale = [session_id for session_id, events in self.sessions.items() if events[-1][3] < cutoff]
+            for session_id in stale:
+                del self.sessions[session_id]
+        return len(stale)
+
+
+class SQLiteEventBus(EventBus):
+    """Events in a SQLite table shared by all workers. A stream is woken at
+    once by events published in its own process and finds those of other
+    workers within ``poll_interval``."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            type TEXT NOT NULL,
+            data TEXT NOT NULL,
+            created_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_events_session ON events (session_id, id);
+        CREATE INDEX IF NOT EXISTS idx_events_created_at ON events (created_at);
+    """
+
+    def __init__(self, db_path=EVENT_DB_PATH, poll_interval=EVENT_POLL_INTERVAL):
+        super().__init__()
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self.condition = threading.Condition()
+        self._connection = ThreadConnections(db_path)
+        self._connection().executescript(self.SCHEMA)
+
+    def publish(self, session_id, event_type, data):
+        cursor = self._connection().execute(
+            'INSERT INTO events (session_id, type, data, created_at) VALUES (?, ?, ?, ?)',
+            (session_id, event_type, json.dumps(data, default=str), time.time())
+        )
+        with self.condition:
+            self.condition.notify_all()
+        return cursor.lastrowid
+
+    def read(self, session_id, after_id, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            rows = self._connection().execute(
+                'SELECT id, type, data FROM events WHERE session_id = ? AND id > ? ORDER BY id',
+                (session_id, after_id)
+            ).fetchall()
+            remaining = deadline - time.monotonic()
+            if rows or remaining <= 0:
+                return [(event_id, event_type, json.loads(data)) for event_id, event_type, data in rows]
+            with self.condition:
+                self.condition.wait(min(self.poll_interval, remaining))
+
+    def latest_id(self, session_id):
+        row = self._connection().execute(
+            'SELECT MAX(id) FROM events WHERE session_id = ?', (session_id,)
+        ).fetchone()
+        return row[0] or 0
+
+    def prune(self, max_age=EVENT_RETENTION):
+        cursor = self._connection().execute(
+            'DELETE FROM events WHERE created_at < ?', (time.time() - max_age,)
+        )
+        return cursor.rowcount
+
+
+def create_event_bus(backend=EVENT_BUS):
+    if backend == 'memory':
+        return MemoryEventBus()
+    if backend == 'sqlite':
+        return SQLiteEventBus()
+    raise ValueError(f"Unknown event bus backend: {backend}")
@@ -0,0 +1,172 @@
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from google.api_core import exceptions as google_exceptions
+from config import (
+    GEMINI_TIMEOUT, GEMINI_MAX_RETRIES, GEMINI_BACKOFF_BASE, GEMINI_BACKOFF_MAX,
+    GEMINI_MAX_CONCURRENCY, GEMINI_CIRCUIT_FAILURES, GEMINI_CIRCUIT_COOLDOWN
+)
+from metrics import GEMINI_CALLS
+import deadlines
+from structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+# Errors worth retrying: the request may succeed if sent again shortly
+TRANSIENT_ERRORS = (
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.GatewayTimeout,
+    google_exceptions.BadGateway,
+    ConnectionError,
+)
+RATE_LIMIT_ERRORS = (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)
+
+
+class GeminiUnavailableError(Exception):
+    """Raised when a Gemini call cannot be made or did not finish in time"""
+
+
+class CircuitOpenError(GeminiUnavailableError):
+    """Raised without calling Gemini while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Stops calling Gemini for ``cooldown`` seconds after it rate-limits us
+    or fails ``failure_threshold`` times in a row. Once the cooldown is over
+    a single trial call is let through; its outcome closes or reopens the
+    circuit."""
+
+    def __init__(self, failure_threshold=GEMINI_CIRCUIT_FAILURES, cooldown=GEMINI_CIRCUIT_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self.lock:
+            if self.opened_at is None:
+                return 'closed'
+            if time.monotonic() - self.opened_at < self.cooldown:
+                return 'open'
+            return 'half-open'
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.cooldown or self.trial_in_flight:
+                return False
+            self.trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def cancel_trial(self):
+        """Let another trial call through when this one was never sent or
+        was abandoned without an outcome"""
+        with self.lock:
+            self.trial_in_flight = False
+
+    def record_failure(self, trip=False):
+        with self.lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if trip or self.failures >= self.failure_threshold or self.opened_at is not None:
+                if self.opened_at is None:
+                    logger.warning("Gemini circuit opened", extra={'failures': self.failures})
+                self.opened_at = time.monotonic()
+
+
+class GeminiClient:
+    """Calls ``model.generate_content`` on a bounded thread pool.
+
+    The model (and its HTTP connection) is shared by all calls. Each attempt
+    gets GEMINI_TIMEOUT seconds; transient errors are retried with jittered
+    exponential backoff, and at most GEMINI_MAX_CONCURRENCY requests are in
+    flight per process. A call that times out keeps its worker until the
+    library returns, so it still counts against the limit.
+
+    Within a request or job deadline, attempts are shortened to the time
+    left and DeadlineExceeded is raised once it runs out; that does not
+    count as a Gemini failure."""
+
+    def __init__(self, model, timeout=GEMINI_TIMEOUT, max_retries=GEMINI_MAX_RETRIES,
+                 max_concurrency=GEMINI_MAX_CONCURRENCY, breaker=None):
+        self.model = model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='gemini')
+        self.breaker = breaker or CircuitBreaker()
+
+    def generate(self, prompt):
+        """Return the response text for ``prompt``"""
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                GEMINI_CALLS.inc(outcome='circuit_open')
+                raise CircuitOpenError("Gemini circuit breaker is open")
+            try:
+                text = self._call(prompt, deadlines.timeout(self.timeout, 'calling Gemini'))
+            except deadlines.DeadlineExceeded:
+                GEMINI_CALLS.inc(outcome='deadline_exceeded')
+                self.breaker.cancel_trial()
+                raise
+            except RATE_LIMIT_ERRORS as e:
+                GEMINI_CALLS.inc(outcome='rate_limited')
+                self.breaker.record_failure(trip=True)
+                raise GeminiUnavailableError(f"Gemini rate limit: {e}") from e
+            except (GeminiUnavailableError, *TRANSIENT_ERRORS) as e:
+                GEMINI_CALLS.inc(outcome='transient_error')
+                self.breaker.record_failure()
+                if attempt == self.max_retries:
+                    raise GeminiUnavailableError(f"Gemini call failed after {attempt + 1} attempts: {e}") from e
+                delay = self._backoff(attempt)
+                left = deadlines.remaining()
+                if left is not None and delay >= left:
+                    raise deadlines.DeadlineExceeded("Deadline exceeded before retrying Gemini") from e
+                logger.info("Retrying Gemini call in %.2fs after: %s", delay, e)
+                time.sleep(delay)
+            except Exception:
+                # Gemini answered but the request was refused or the response
+                # unusable (invalid argument, blocked or empty candidate): not
+                # an outage, but a trial call must not stay in flight forever
+                GEMINI_CALLS.inc(outcome='error')
+                self.breaker.cancel_trial()
+                raise
+            else:
+                GEMINI_CALLS.inc(outcome='ok')
+                self.breaker.record_success()
+                return text
+
+    def _call(self, prompt, timeout):
+        if not self.slots.acquire(timeout=timeout):
+            if timeout < self.timeout:
+                raise deadlines.DeadlineExceeded("Deadline exceeded waiting for a free Gemini slot")
+            raise GeminiUnavailableError("Timed out waiting for a free Gemini slot")
+        try:
+            future = self.executor.submit(self.model.generate_content, prompt)
+        except BaseException:
+            self.slots.release()
+            raise
+        # The slot is freed when the request really ends, not when we stop waiting
+        future.add_done_callback(lambda _: self.slots.release())
+        try:
+            return future.result(timeout=timeout).text
+        except FutureTimeoutError:
+            if timeout < self.timeout:
+                raise deadlines.DeadlineExceeded("Deadline exceeded waiting for Gemini")
+            raise GeminiUnavailableError(f"Gemini call timed out after {self.timeout}s")
+
+    def _backoff(self, attempt):
+        # Full jitter keeps retries from concurrent interviews from lining up
+        return random.uniform(0, min(GEMINI_BACKOFF_MAX, GEMINI_BACKOFF_BASE * 2 ** attempt))
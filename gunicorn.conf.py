@@ -0,0 +1,62 @@
+"""Gunicorn settings for the interview API: ``gunicorn -c gunicorn.conf.py``.
+
+Requests are I/O-bound (uploads, status polling) while transcription and
+analysis run on background threads, so each worker serves many requests
+at once: with threads (gthread, the default) or with greenlets
+(GUNICORN_WORKER_CLASS=gevent, needs the ``gevent`` package). Time limits
+are enforced by the app itself: a request past REQUEST_TIMEOUT gets a 504
+and the worker carries on. Gunicorn's ``timeout`` only replaces workers
+that stop responding altogether.
+
+Each open progress stream (/api/interview-events) holds a gthread thread
+for up to EVENT_STREAM_SECONDS, so allow for waiting candidates when
+setting GUNICORN_THREADS.
+
+Sessions and audio streams live in the worker process unless
+SESSION_STORE=sqlite, so keep GUNICORN_WORKERS at 1 with the memory store.
+
+With preloading (the default for gthread) the master imports the app and builds the
+services once, then forks: workers start ready and share that memory
+copy-on-write. GUNICORN_PRELOAD=false has each worker build its services
+on first use instead.
+"""
+import gc
+import os
+from config import FLASK_PORT, REQUEST_TIMEOUT
+
+wsgi_app = 'app:create_app()'
+bind = f"0.0.0.0:{FLASK_PORT}"
+
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+# gevent patches threading only in the worker, too late for locks the
+# master built while preloading, so it defaults to building per worker
+preload_app = os.getenv('GUNICORN_PRELOAD', 'false' if worker_class == 'gevent' else 'true').lower() == 'true'
+workers = int(os.getenv('GUNICORN_WORKERS', 1))
+# gthread: request threads per worker; gevent: open connections per worker
+threads = int(os.getenv('GUNICORN_THREADS', 16))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 200))
+
+timeout = int(REQUEST_TIMEOUT) + 30
+graceful_timeout = 30
+keepalive = 5
+
+
+def when_ready(server):
+    if preload_app:
+        # Runs in the master after the app is loaded and before any worker
+        # is forked
+        server.app.wsgi().extensions['cas'].warm()
+        # Keep the garbage collector from touching (and so copying) the
+        # preloaded objects in every worker
+        gc.freeze()
+
+
+def post_worker_init(worker):
+    if worker_class == 'gevent':
+        # google-generativeai talks gRPC, which must be told to yield to
+        # gevent's hub instead of blocking the worker
+        try:
+            from grpc.experimental import gevent as grpc_gevent
+            grpc_gevent.init_gevent()
+        except ImportError:
+            worker.log.warning("grpc gevent support unavailable; Gemini calls will block the worker")
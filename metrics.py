@@ -0,0 +1,199 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+# Upper bounds in seconds, spanning fast parsing steps up to slow Gemini calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metric:
+    """Base class for metrics exported in the Prometheus text format.
+
+    Values live in the process that recorded them; with several gunicorn
+    workers each worker serves its own numbers from /metrics."""
+
+    type_name = None
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def _format_labels(self, key, extra=None):
+        pairs = list(zip(self.labels, key))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{label}="{_escape(value)}"' for label, value in pairs) + '}'
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+    def _samples(self):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type_name = 'counter'
+
+    def __init__(self, name, description, labels=()):
+        super().__init__(name, description, labels)
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def _samples(self):
+        with self.lock:
+            return [f"{self.name}{self._format_labels(key)} {value}" for key, value in sorted(self.values.items())]
+
+
+class Gauge(Metric):
+    """A value that goes up and down. ``set_function`` makes the gauge read
+    its value when /metrics is scraped, e.g. the current session count."""
+
+    type_name = 'gauge'
+
+    def __init__(self, name, description, labels=()):
+        super().__init__(name, description, labels)
+        self.values = {}
+        self.function = None
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def set_function(self, function):
+        self.function = function
+
+    def _samples(self):
+        if self.function is not None:
+            try:
+                return [f"{self.name} {self.function()}"]
+            except Exception as e:
+                logging.getLogger('cas.metrics').warning("Could not read gauge %s: %s", self.name, e)
+                return []
+        with self.lock:
+            return [f"{self.name}{self._format_labels(key)} {value}" for key, value in sorted(self.values.items())]
+
+
+class Histogram(Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, description, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.series = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            series = self.series.setdefault(key, {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0})
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][index] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self):
+        lines = []
+        with self.lock:
+            for key, series in sorted(self.series.items()):
+                for bound, bucket_count in zip(self.buckets, series['buckets']):
+                    lines.append(f"{self.name}_bucket{self._format_labels(key, ('le', bound))} {bucket_count}")
+                lines.append(f"{self.name}_bucket{self._format_labels(key, ('le', '+Inf'))} {series['count']}")
+                lines.append(f"{self.name}_sum{self._format_labels(key)} {series['sum']}")
+                lines.append(f"{self.name}_count{self._format_labels(key)} {series['count']}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+
+    def render(self):
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = Histogram(
+    'cas_stage_duration_seconds',
+    'Time spent in each stage of the interview pipeline',
+    ['stage']
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    'cas_http_request_duration_seconds',
+    'HTTP request latency by endpoint and status',
+    ['endpoint', 'status']
+)
+FALLBACKS = Counter(
+    'cas_fallbacks_total',
+    'Results replaced by a fallback because transcription or analysis failed',
+    ['kind']
+)
+GEMINI_CALLS = Counter(
+    'cas_gemini_calls_total',
+    'Gemini call attempts by outcome',
+    ['outcome']
+)
+PRESCREEN = Counter(
+    'cas_prescreen_total',
+    'Answers checked by the local pre-screen: speech, or the reason they were skipped as silent',
+    ['outcome']
+)
+AI_OUTPUT = Counter(
+    'cas_ai_output_total',
+    'Gemini answers by parse outcome: parsed, repaired (truncated JSON closed), unparseable, reprompted or invalid',
+    ['outcome']
+)
+ACTIVE_SESSIONS = Gauge('cas_active_sessions', 'Interview sessions that are still in progress')
+STORED_SESSIONS = Gauge('cas_sessions', 'Interview sessions held by the session store')
+AUDIO_ARCHIVE_BYTES = Gauge('cas_audio_archive_bytes', 'Disk space used by archived answer audio')
+TRANSCRIPTION_QUEUE_PENDING = Gauge('cas_transcription_queue_pending', 'Transcription jobs queued or running')
+ADMISSION_IN_FLIGHT = Gauge('cas_admission_in_flight', 'Work running on each admission-controlled resource', ['resource'])
+ADMISSION_QUEUED = Gauge('cas_admission_queued', 'Work waiting for a slot on each admission-controlled resource', ['resource'])
+ADMISSION_REJECTED = Counter(
+    'cas_admission_rejected_total',
+    'Work turned away because a resource was at capacity (queue_full) or a client had its share (client_limit)',
+    ['resource', 'reason']
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    'cas_admission_wait_seconds',
+    'Time admitted work waited for a slot',
+    ['resource']
+)
+EVENT_STREAMS = Gauge('cas_event_streams', 'Open server-sent event streams (each holds a request thread)')
+STARTUP_SECONDS = Gauge(
+    'cas_startup_seconds',
+    'Time this process spent importing each heavy dependency and building each service',
+    ['stage']
+)
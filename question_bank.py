@@ -0,0 +1,83 @@
+import os
+import json
+import hashlib
+from config import CAS_QUESTIONS, QUESTION_BANK_PATH, DEFAULT_QUESTION_SET
+from structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+
+def _serialize(payload):
+    """JSON body and strong ETag for a response that never changes while
+    the process runs"""
+    body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return body, hashlib.sha256(body).hexdigest()[:32]
+
+
+class QuestionSet:
+    def __init__(self, set_id, name, questions):
+        self.id = set_id
+        self.name = name
+        self.questions = tuple(questions)
+        self.body, self.etag = _serialize({'setId': set_id, 'name': name, 'questions': self.questions})
+
+    def __len__(self):
+        return len(self.questions)
+
+    def question(self, index):
+        if index < 0 or index >= len(self.questions):
+            raise ValueError("Invalid question index")
+        return self.questions[index]
+
+
+class QuestionBank:
+    """The interview question sets, loaded once at startup.
+
+    CAS_QUESTIONS is always available as the 'general' set. Further sets are
+    read from a JSON file of the form::
+
+        {"sets": [{"id": "oxford", "name": "University of Oxford",
+                   "questions": ["...", "..."]}]}
+
+    A set in the file with the id 'general' replaces the built-in one. The
+    serialized response for each set, and for the list of sets, is built
+    here once so routes only have to send it."""
+
+    def __init__(self, path=QUESTION_BANK_PATH, default_set=DEFAULT_QUESTION_SET):
+        self.sets = {'general': QuestionSet('general', 'General CAS interview', CAS_QUESTIONS)}
+        if path and os.path.exists(path):
+            self.sets.update(self._load(path))
+        if default_set not in self.sets:
+            raise ValueError(f"Default question set '{default_set}' is not defined")
+        self.default = self.sets[default_set]
+        self.catalogue_body, self.catalogue_etag = _serialize({
+            'defaultSetId': self.default.id,
+            'sets': [
+                {'id': question_set.id, 'name': question_set.name, 'totalQuestions': len(question_set)}
+                for question_set in self.sets.values()
+            ]
+        })
+        logger.info("Question bank loaded", extra={'questionSets': sorted(self.sets)})
+
+    @staticmethod
+    def _load(path):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        sets = {}
+        for entry in data.get('sets', []):
+            set_id = str(entry.get('id', '')).strip()
+            questions = [q.strip() for q in entry.get('questions', []) if isinstance(q, str) and q.strip()]
+            if not set_id or not questions:
+                raise ValueError(f"{path}: every question set needs an id and at least one question")
+            sets[set_id] = QuestionSet(set_id, entry.get('name') or set_id, questions)
+        return sets
+
+    def get(self, set_id=None):
+        """The set with ``set_id`` (the default set if None), or None"""
+        if set_id is None:
+            return self.default
+        return self.sets.get(set_id)
+
+    def for_session(self, session):
+        # Sessions created before question sets existed used the default set
+        return self.sets.get(session.get('question_set')) or self.default
@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from config import CACHE_BACKEND, CACHE_DIR, CACHE_MAX_ENTRIES, CACHE_TTL
+
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_text(text):
+    """Hash text after collapsing whitespace, so formatting-only prompt
+    differences share a cache entry"""
+    return hash_bytes(" ".join(text.split()).encode('utf-8'))
+
+
+class ResultCache:
+    """Content-addressed cache for JSON-serializable results"""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self._get(key)
+        with self.stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def stats(self):
+        with self.stats_lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': self.size()}
+
+    def size(self):
+        raise NotImplementedError
+
+
+class MemoryCache(ResultCache):
+    """Per-process LRU cache"""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL):
+        super().__init__(max_entries, ttl)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.time() - stored_at > self.ttl:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.time(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def size(self):
+        return len(self.entries)
+
+
+class DiskCache(ResultCache):
+    """One JSON file per key under ``directory``, shared by every worker on
+    the host. Files are written atomically via rename; expiry uses the file
+    modification time and the oldest files are pruned beyond ``max_entries``."""
+
+    PRUNE_EVERY = 100
+
+    def __init__(self, directory, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL):
+        super().__init__(max_entries, ttl)
+        self.directory = directory
+        self.writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _get(self, key):
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(value, f)
+            os.replace(temp_path, path)
+        except Exception:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+        self.writes += 1
+        if self.writes % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def _files(self):
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith('.json'):
+                    path = os.path.join(root, name)
+                    try:
+                        files.append((os.path.getmtime(path), path))
+                    except OSError:
+                        pass
+        return files
+
+    def prune(self):
+        files = sorted(self._files())
+        cutoff = time.time() - self.ttl
+        excess = len(files) - self.max_entries
+        for index, (mtime, path) in enumerate(files):
+            if mtime >= cutoff and index >= excess:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def size(self):
+        return len(self._files())
+
+
+def create_cache(name, backend=CACHE_BACKEND):
+    if backend == 'memory':
+        return MemoryCache()
+    if backend == 'disk':
+        return DiskCache(os.path.join(CACHE_DIR, name))
+    raise ValueError(f"Unknown cache backend: {backend}")
@@ -1,122 +1,265 @@
-from flask import request, jsonify
+from flask import request, jsonify, Response
+from werkzeug.exceptions import HTTPException
 import os
 from datetime import datetime
-from config import CAS_QUESTIONS, UPLOAD_FOLDER
-from session_manager import SessionManager
-from speech_service import SpeechService
-from ai_service import AIService
+from config import (
+    MAX_UPLOAD_BYTES, MAX_CONTENT_LENGTH, MAX_ANSWER_SECONDS, QUESTION_CACHE_MAX_AGE
+)
+from admission import Overloaded
+from transcription_errors import StreamNotFound, ChunkOutOfOrder, StreamTooLarge
+from metrics import STAGE_SECONDS
+from event_bus import format_event
+from upload_limits import allowed_audio_file, wav_duration
+import deadlines
+from structured_logging import get_logger
+
+logger = get_logger(__name__)
 
 class Routes:
-    def __init__(self, session_manager, speech_service, ai_service):
-        self.session_manager = session_manager
-        self.speech_service = speech_service
-        self.ai_service = ai_service
+    def __init__(self, services):
+        # Services are looked up when a route uses them, so serving the
+        # questions does not build the speech and AI services
+        self.services = services
+
+    session_manager = property(lambda self: self.services.session_manager)
+    speech_service = property(lambda self: self.services.speech_service)
+    ai_service = property(lambda self: self.services.ai_service)
+    transcription_queue = property(lambda self: self.services.transcription_queue)
+    streaming_transcriber = property(lambda self: self.services.streaming_transcriber)
+    audio_archive = property(lambda self: self.services.audio_archive)
+    event_bus = property(lambda self: self.services.event_bus)
     
     def get_questions(self):
-        """Get all interview questions"""
-        return jsonify({'questions': CAS_QUESTIONS})
+        """Get the questions of one set (?set=<id>, default set otherwise)"""
+        question_set = self.session_manager.question_bank.get(request.args.get('set'))
+        if question_set is None:
+            return jsonify({'error': 'Question set not found'}), 404
+        
+        return self._cacheable(question_set.body, question_set.etag)
+    
+    def get_question_sets(self):
+        """List the available question sets"""
+        question_bank = self.session_manager.question_bank
+        return self._cacheable(question_bank.catalogue_body, question_bank.catalogue_etag)
+    
+    def _cacheable(self, body, etag):
+        # Bodies are serialized once at startup; a matching If-None-Match
+        # gets a 304 without the body
+        response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = QUESTION_CACHE_MAX_AGE
+        return response.make_conditional(request)
     
     def start_interview(self):
-        """Start a new interview session"""
-        session_id = self.session_manager.create_session()
+        """Start a new interview session, optionally with a questionSetId"""
+        data = request.get_json(silent=True) or {}
+        question_set_id = data.get('questionSetId') or request.args.get('questionSetId')
+        try:
+            session_id = self.session_manager.create_session(question_set_id)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
+        question_set = self.session_manager.question_bank.get(question_set_id)
         return jsonify({
             'sessionId': session_id,
-            'currentQuestion': CAS_QUESTIONS[0],
-            'totalQuestions': len(CAS_QUESTIONS)
+            'questionSetId': question_set.id,
+            'currentQuestion': question_set.questions[0],
+            'totalQuestions': len(question_set)
         })
     
     def upload_audio(self):
-        """Upload and transcribe audio response"""
+        """Upload and transcribe audio response.
+        
+        Clients should pass sessionId and questionIndex in the query string
+        so they are checked before the request body is read; the form
+        fields are still accepted. The file itself is checked for extension
+        and size while it is parsed and never held in memory whole."""
         try:
-            print(f"\n=== UPLOAD AUDIO REQUEST ===")
-            print(f"Request method: {request.method}")
-            print(f"Request headers: {dict(request.headers)}")
-            print(f"Request form data keys: {list(request.form.keys())}")
-            print(f"Request files keys: {list(request.files.keys())}")
-            
-            session_id = request.form.get('sessionId')
-            question_index = int(request.form.get('questionIndex'))
+            if request.content_length is not None and request.content_length > MAX_CONTENT_LENGTH:
+                return jsonify({'error': f'Audio upload exceeds {MAX_UPLOAD_BYTES // (1024 * 1024)} MB'}), 413
             
-            print(f"Session ID: {session_id}")
-            print(f"Question index: {question_index}")
-            
-            if 'audio' not in request.files:
-                print("ERROR: No audio file provided")
-                return jsonify({'error': 'No audio file provided'}), 400
-            
-            audio_file = request.files['audio']
-            print(f"Audio file: {audio_file.filename}, size: {len(audio_file.read())}")
-            audio_file.seek(0)  # Reset file pointer
-            
-            # Validate session
-            session = self.session_manager.get_session(session_id)
-            if not session:
-                print(f"ERROR: Session not found: {session_id}")
-                return jsonify({'error': 'Session not found'}), 404
+            if 'sessionId' in request.args:
+                session_id = request.args.get('sessionId')
+                question_index = request.args.get('questionIndex')
+                rejected = self._validate_upload_target(session_id, question_index)
+                if rejected:
+                    return rejected
             
-            print(f"Session found: {session['id']}")
+            try:
+                files = request.files
+            except HTTPException as e:
+                logger.warning("Upload rejected while reading body: %s", e.description)
+                return jsonify({'error': e.description}), e.code
             
-            # Validate question index
-            if question_index < 0 or question_index >= len(CAS_QUESTIONS):
-                print(f"ERROR: Invalid question index: {question_index}")
-                return jsonify({'error': 'Invalid question index'}), 400
+            if 'sessionId' not in request.args:
+                session_id = request.form.get('sessionId')
+                question_index = request.form.get('questionIndex')
+                rejected = self._validate_upload_target(session_id, question_index)
+                if rejected:
+                    return rejected
+            question_index = int(question_index)
             
-            # Save audio file
-            filename = f"{session_id}-{audio_file.filename}"
-            filepath = os.path.join(UPLOAD_FOLDER, filename)
-            os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-            
-            print(f"Saving audio to: {filepath}")
-            audio_file.save(filepath)
-            print(f"Audio saved successfully, file size: {os.path.getsize(filepath)} bytes")
-            
-            # Transcribe audio using Google Speech Recognition
-            print("Starting transcription...")
-            transcription = self.speech_service.transcribe_audio(filepath)
-            print(f"Transcription completed: {transcription}")
+            if 'audio' not in files:
+                logger.warning("Upload rejected: no audio file provided")
+                return jsonify({'error': 'No audio file provided'}), 400
             
-            print(f"\n=== REAL-TIME TRANSCRIPTION FOR QUESTION {question_index + 1} ===")
-            print(f"Question: {CAS_QUESTIONS[question_index]}")
-            print(f"Transcribed text: \"{transcription.get('text', '')}\"")
-            print(f"Language: {transcription.get('language', 'unknown')}")
-            print(f"Has meaningful content: {self.speech_service.has_meaningful_content(transcription)}")
+            audio_file = files['audio']
+            if not allowed_audio_file(audio_file.filename):
+                return jsonify({'error': 'Unsupported audio format'}), 415
             
-            # Add response to session
-            print("Adding response to session...")
-            is_complete = self.session_manager.add_response(
-                session_id, 
-                question_index, 
-                filepath, 
-                transcription
-            )
-            print(f"Response added, interview complete: {is_complete}")
+            duration = wav_duration(audio_file.stream)
+            if duration is not None and duration > MAX_ANSWER_SECONDS:
+                logger.warning("Upload rejected: answer is %.0fs long", duration)
+                return jsonify({'error': f'Answers can be at most {MAX_ANSWER_SECONDS} seconds long'}), 413
             
-            if is_complete:
-                print("Interview complete, starting AI analysis...")
-                # Analyze the entire interview
-                analysis = self.ai_service.analyze_interview(session)
-                self.session_manager.set_analysis(session_id, analysis)
-                print("AI analysis completed")
+            # Archived uploads are copied to disk in chunks and transcribed
+            # from there; otherwise the (size-capped) bytes are queued
+            deadlines.check('storing the upload')
+            filepath = None
+            audio_bytes = None
+            if self.audio_archive is not None:
+                extension = os.path.splitext(audio_file.filename)[1]
+                with STAGE_SECONDS.time(stage='upload_save'):
+                    audio_hash, filepath = self.audio_archive.store(audio_file.stream, extension)
+                self.audio_archive.add_reference(audio_hash, session_id, question_index)
+                size = os.path.getsize(filepath)
+                logger.debug("Audio archived as %s", filepath)
+            else:
+                with STAGE_SECONDS.time(stage='upload_read'):
+                    audio_bytes = audio_file.read()
+                size = len(audio_bytes)
+            logger.info("Audio received", extra={
+                'sessionId': session_id,
+                'questionIndex': question_index,
+                'audioFilename': audio_file.filename,
+                'bytes': size
+            })
             
-            response_data = {
-                'success': True,
-                'nextQuestionIndex': question_index + 1,
-                'isComplete': is_complete,
-                'nextQuestion': CAS_QUESTIONS[question_index + 1] if not is_complete else None,
-                'transcription': transcription.get('text', ''),
-                'hasMeaningfulContent': self.speech_service.has_meaningful_content(transcription)
-            }
+            # Hand transcription off to the background queue; when it is
+            # full the app's Overloaded handler answers 503
+            job_id = self.transcription_queue.submit(session_id, question_index, filepath, audio_bytes)
             
-            print(f"Returning response: {response_data}")
-            return jsonify(response_data)
+            response_data = self._queued_response(session_id, question_index, job_id)
+            return jsonify(response_data), 202
             
+        except deadlines.DeadlineExceeded as e:
+            logger.warning("Upload abandoned: %s", e)
+            return jsonify({'error': 'The upload took too long, please retry'}), 504
+        except Overloaded:
+            raise
         except Exception as e:
-            print(f"ERROR in upload_audio: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Error in upload_audio: %s", e)
             return jsonify({'error': f'Failed to upload audio: {str(e)}'}), 500
     
+    def _validate_upload_target(self, session_id, question_index):
+        """Return an error response if the upload's session or question
+        index is invalid, else None"""
+        try:
+            question_index = int(question_index)
+        except (TypeError, ValueError):
+            logger.warning("Upload rejected: invalid question index %s", question_index)
+            return jsonify({'error': 'Invalid question index'}), 400
+        
+        question_set = self.session_manager.get_question_set(session_id)
+        if question_set is None:
+            logger.warning("Upload rejected: session not found", extra={'sessionId': session_id})
+            return jsonify({'error': 'Session not found'}), 404
+        
+        if question_index < 0 or question_index >= len(question_set):
+            logger.warning("Upload rejected: invalid question index %s", question_index)
+            return jsonify({'error': 'Invalid question index'}), 400
+        return None
+    
+    def _queued_response(self, session_id, question_index, job_id):
+        # All answers submitted; the result is ready once the queue has
+        # transcribed every answer and run the analysis. An answer whose
+        # job failed comes round again as the next question.
+        questions = self.session_manager.get_question_set(session_id).questions
+        next_index = self.session_manager.next_question_index(session_id, question_index)
+        is_complete = next_index is None
+        
+        return {
+            'success': True,
+            'jobId': job_id,
+            'status': 'queued',
+            'nextQuestionIndex': len(questions) if is_complete else next_index,
+            'isComplete': is_complete,
+            'nextQuestion': questions[next_index] if not is_complete else None
+        }
+    
+    def open_audio_stream(self):
+        """Open a stream for an answer that is uploaded while it is recorded"""
+        data = request.get_json(silent=True) or request.form
+        session_id = data.get('sessionId')
+        try:
+            question_index = int(data.get('questionIndex'))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Invalid question index'}), 400
+        
+        question_set = self.session_manager.get_question_set(session_id)
+        if question_set is None:
+            return jsonify({'error': 'Session not found'}), 404
+        
+        if question_index < 0 or question_index >= len(question_set):
+            return jsonify({'error': 'Invalid question index'}), 400
+        
+        # Turn the stream away up front rather than after the whole answer
+        # has been uploaded
+        self.transcription_queue.admission.check()
+        self.speech_service.admission.check()
+        
+        stream = self.streaming_transcriber.open(session_id, question_index)
+        return jsonify({'streamId': stream.id}), 201
+    
+    def append_audio_chunk(self, stream_id):
+        """Append the next recorded chunk; returns the partial transcript so far"""
+        try:
+            seq = int(request.args.get('seq', 0))
+            stream = self.streaming_transcriber.append(stream_id, seq, request.get_data())
+        except ValueError:
+            return jsonify({'error': 'Invalid chunk sequence number'}), 400
+        except StreamNotFound as e:
+            return jsonify({'error': str(e)}), 404
+        except ChunkOutOfOrder as e:
+            return jsonify({'error': str(e)}), 409
+        except StreamTooLarge as e:
+            return jsonify({'error': str(e)}), 413
+        
+        return jsonify(self.streaming_transcriber.status(stream))
+    
+    def get_audio_stream(self, stream_id):
+        """Get the partial transcript of an open stream"""
+        try:
+            stream = self.streaming_transcriber.get(stream_id)
+        except StreamNotFound as e:
+            return jsonify({'error': str(e)}), 404
+        
+        return jsonify(self.streaming_transcriber.status(stream))
+    
+    def finish_audio_stream(self, stream_id):
+        """Close a stream and queue the rest of its transcription"""
+        try:
+            stream = self.streaming_transcriber.get(stream_id, finished=True)
+            audio_bytes, transcribe = self.streaming_transcriber.finish(stream_id)
+        except StreamNotFound as e:
+            return jsonify({'error': str(e)}), 404
+        
+        filepath = None
+        if self.audio_archive is not None:
+            audio_hash, filepath = self.audio_archive.store(audio_bytes, stream.extension)
+            self.audio_archive.add_reference(audio_hash, stream.session_id, stream.question_index)
+        
+        # A 503 from a full queue leaves the stream to be finished again
+        job_id = self.transcription_queue.submit(
+            stream.session_id, stream.question_index, filepath, audio_bytes, transcribe=transcribe
+        )
+        self.streaming_transcriber.forget(stream_id)
+        
+        response_data = self._queued_response(stream.session_id, stream.question_index, job_id)
+        response_data['partialTranscription'] = stream.partial_text()
+        return jsonify(response_data), 202
+    
     def get_interview_result(self, session_id):
         """Get interview results"""
         result = self.session_manager.get_session_result(session_id)
@@ -125,6 +268,14 @@ class Routes:
         
         return jsonify(result)
     
+    def get_transcription_job(self, job_id):
+        """Get background transcription job status"""
+        job = self.transcription_queue.get_job(job_id)
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+        
+        return jsonify(job)
+    
     def get_interview_status(self, session_id):
         """Get interview status"""
         status = self.session_manager.get_session_status(session_id)
@@ -133,6 +284,43 @@ class Routes:
         
         return jsonify(status)
     
+    def get_interview_events(self, session_id):
+        """Server-sent events for one session: 'transcription-ready' and
+        'analysis-ready' per answer, 'job-failed', then 'result', after which
+        the stream ends. A new stream starts with a 'status' snapshot; a
+        reconnecting one (Last-Event-ID) gets the events it missed."""
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
+        opening = []
+        if last_event_id is None:
+            # Read before the snapshot so nothing published in between is lost
+            after_id = self.event_bus.latest_id(session_id)
+            status = self.session_manager.get_session_status(session_id)
+            if not status:
+                return jsonify({'error': 'Session not found'}), 404
+            opening.append(format_event('status', status))
+            result = self.session_manager.get_session_result(session_id) if status['analysisReady'] else None
+            if result is not None:
+                return self._event_stream(opening + [format_event('result', result)])
+        else:
+            try:
+                after_id = int(last_event_id)
+            except ValueError:
+                return jsonify({'error': 'Invalid Last-Event-ID'}), 400
+            if not self.session_manager.get_session_status(session_id):
+                return jsonify({'error': 'Session not found'}), 404
+
+        def events():
+            yield from opening
+            yield from self.event_bus.stream(session_id, after_id)
+        return self._event_stream(events())
+
+    def _event_stream(self, events):
+        response = Response(events, mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        # Tell nginx-style proxies not to buffer the stream
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
     def delete_interview(self, session_id):
         """Delete interview session"""
         if self.session_manager.delete_session(session_id):
@@ -141,41 +329,37 @@ class Routes:
             return jsonify({'error': 'Session not found'}), 404 
     
     def test_upload(self):
-        """Test endpoint - just save audio without transcription"""
+        """Test endpoint - just save audio without transcription.
+        
+        The file is archived under its content hash without a session, so
+        it is removed once AUDIO_UNREFERENCED_TTL has passed."""
         try:
-            print(f"\n=== TEST UPLOAD REQUEST ===")
-            print(f"Request method: {request.method}")
-            print(f"Request headers: {dict(request.headers)}")
-            print(f"Request form data keys: {list(request.form.keys())}")
-            print(f"Request files keys: {list(request.files.keys())}")
-            
             if 'audio' not in request.files:
-                print("ERROR: No audio file provided")
+                logger.warning("Test upload rejected: no audio file provided")
                 return jsonify({'error': 'No audio file provided'}), 400
             
             audio_file = request.files['audio']
-            print(f"Audio file: {audio_file.filename}, size: {len(audio_file.read())}")
-            audio_file.seek(0)  # Reset file pointer
-            
-            # Save audio file
-            filename = f"test-{audio_file.filename}"
-            filepath = os.path.join(UPLOAD_FOLDER, filename)
-            os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+            if self.audio_archive is None:
+                return jsonify({'error': 'Audio uploads are not being stored'}), 400
             
-            print(f"Saving audio to: {filepath}")
-            audio_file.save(filepath)
-            print(f"Audio saved successfully, file size: {os.path.getsize(filepath)} bytes")
+            audio_hash, filepath = self.audio_archive.store(
+                audio_file.stream, os.path.splitext(audio_file.filename)[1]
+            )
+            logger.info("Test audio saved", extra={'filepath': filepath, 'bytes': os.path.getsize(filepath)})
             
             return jsonify({
                 'success': True,
                 'message': 'Audio file saved successfully',
-                'filename': filename,
+                'filename': os.path.basename(filepath),
                 'filepath': filepath,
                 'size': os.path.getsize(filepath)
             })
             
+        except HTTPException as e:
+            return jsonify({'error': e.description}), e.code
+        except deadlines.DeadlineExceeded as e:
+            logger.warning("Test upload abandoned: %s", e)
+            return jsonify({'error': 'The upload took too long, please retry'}), 504
         except Exception as e:
-            print(f"ERROR in test_upload: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Error in test_upload: %s", e)
             return jsonify({'error': f'Test upload failed: {str(e)}'}), 500 
\ No newline at end of file
@@ -0,0 +1,215 @@
+"""Re-score stored interviews offline.
+
+Reads finished sessions from the SQLite session store and runs the current
+analysis (per-answer scoring and the final synthesis) on them again, e.g.
+after changing a prompt in AIService or the has_meaningful_content
+heuristic. Results are appended to a JSONL file, one line per session, as
+soon as each one finishes.
+
+Running the same command again resumes: sessions that already have a result
+in the output file are skipped, and sessions that failed are retried. A
+session fails when an answer cannot be scored or the synthesis call fails:
+the fallback analysis the app shows during a Gemini outage is never written
+as a result or back to the session.
+Stored transcriptions are reused; an answer is only transcribed again when
+its transcription is missing or failed (or with --retranscribe), and even
+then the transcription cache is checked before calling the recognizer.
+
+    python scripts/rescore_interviews.py --output rescored.jsonl --workers 8
+    python scripts/rescore_interviews.py --db data/sessions.db --output rescored.jsonl --update-sessions
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def finished_session_ids(output_path):
+    """Session ids that already have a result in the output file"""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # The last line of an interrupted run may be cut short
+                continue
+            if 'analysis' in record:
+                done.add(record['sessionId'])
+    return done
+
+
+class JsonlWriter:
+    """Appends one JSON record per line, flushed as soon as it is written"""
+
+    def __init__(self, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.file = open(path, 'a+', encoding='utf-8')
+        self.file.seek(0, os.SEEK_END)
+        if self.file.tell() > 0:
+            self.file.seek(self.file.tell() - 1)
+            if self.file.read(1) != '\n':
+                self.file.write('\n')
+        self.lock = threading.Lock()
+
+    def write(self, record):
+        line = json.dumps(record, default=str)
+        with self.lock:
+            self.file.write(line + '\n')
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class Rescorer:
+    def __init__(self, store, speech_service, ai_service, retranscribe=False,
+                 reuse_answer_scores=False, update_sessions=False, audio_archive=None):
+        self.store = store
+        self.speech_service = speech_service
+        self.ai_service = ai_service
+        self.retranscribe = retranscribe
+        self.reuse_answer_scores = reuse_answer_scores
+        self.update_sessions = update_sessions
+        self.audio_archive = audio_archive
+
+    def rescore(self, session_id):
+        # Offline reads and writes leave last_access alone, so rescoring does
+        # not keep sessions the app would have evicted as idle
+        session = self.store.get(session_id, touch=False)
+        if session is None:
+            raise KeyError(f"Session {session_id} no longer exists")
+
+        transcribed = 0
+        for response in session.get('responses', []):
+            audio_path = self._audio_file(response.get('audioPath'))
+            if audio_path and self._needs_transcription(response):
+                response['transcription'] = self.speech_service.transcribe_audio(audio_path)
+                transcribed += 1
+            if not self.reuse_answer_scores:
+                response['answerAnalysis'] = None
+
+        previous = session.get('analysis') or {}
+        analysis = self.ai_service.analyze_interview(session, fallback=False)
+        if self.update_sessions:
+            self.store.update(session_id, lambda stored: stored.update(analysis=analysis), touch=False)
+
+        return {
+            'sessionId': session_id,
+            'rescoredAt': datetime.now().isoformat(),
+            'retranscribed': transcribed,
+            'previousOverallScore': previous.get('overallScore'),
+            'previousDecision': previous.get('recommendation', {}).get('decision'),
+            'analysis': analysis
+        }
+
+    def _audio_file(self, audio_path):
+        # Archived raw uploads may have been replaced by their Opus copy
+        if self.audio_archive is not None:
+            return self.audio_archive.locate(audio_path)
+        return audio_path if audio_path and os.path.exists(audio_path) else None
+
+    def _needs_transcription(self, response):
+        transcription = response.get('transcription') or {}
+        return self.retranscribe or not transcription or 'error' in transcription
+
+
+def run(rescorer, session_ids, writer, workers):
+    """Rescore the sessions with ``workers`` threads, keeping only a few
+    sessions per worker loaded at a time. Returns (succeeded, failed)."""
+    succeeded = failed = 0
+    ids = iter(session_ids)
+    in_flight = {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='rescore') as executor:
+        while True:
+            while len(in_flight) < workers * 2:
+                session_id = next(ids, None)
+                if session_id is None:
+                    break
+                in_flight[executor.submit(rescorer.rescore, session_id)] = session_id
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                session_id = in_flight.pop(future)
+                try:
+                    writer.write(future.result())
+                    succeeded += 1
+                except Exception as e:
+                    writer.write({'sessionId': session_id, 'error': str(e), 'rescoredAt': datetime.now().isoformat()})
+                    failed += 1
+                total = succeeded + failed
+                if total % 10 == 0:
+                    print(f"{total} session(s) done, {failed} failed", file=sys.stderr)
+    return succeeded, failed
+
+
+def main(argv=None):
+    from config import SESSION_DB_PATH, PERSIST_UPLOADS
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=SESSION_DB_PATH, help='SQLite session store to read')
+    parser.add_argument('--output', required=True, help='JSONL file to append results to')
+    parser.add_argument('--workers', type=int, default=4, help='Sessions analyzed at the same time')
+    parser.add_argument('--status', default='completed',
+                        help="Only rescore sessions with this status ('all' for every session)")
+    parser.add_argument('--limit', type=int, help='Stop after this many sessions')
+    parser.add_argument('--retranscribe', action='store_true',
+                        help='Transcribe saved audio again instead of using stored transcriptions')
+    parser.add_argument('--reuse-answer-scores', action='store_true',
+                        help='Keep stored per-answer scores and only redo the final synthesis')
+    parser.add_argument('--update-sessions', action='store_true',
+                        help='Also replace the analysis stored with each session')
+    args = parser.parse_args(argv)
+
+    from session_store import SQLiteSessionStore
+    from speech_service import SpeechService
+    from ai_service import AIService
+    from audio_archive import AudioArchive
+
+    if not os.path.exists(args.db):
+        parser.error(f"No session store at {args.db}")
+    store = SQLiteSessionStore(args.db)
+    speech_service = SpeechService()
+    ai_service = AIService(speech_service)
+    rescorer = Rescorer(
+        store, speech_service, ai_service,
+        retranscribe=args.retranscribe,
+        reuse_answer_scores=args.reuse_answer_scores,
+        update_sessions=args.update_sessions,
+        audio_archive=AudioArchive(transcode='none') if PERSIST_UPLOADS else None
+    )
+
+    done = finished_session_ids(args.output)
+    session_ids = [
+        session_id
+        for session_id in store.list_ids(None if args.status == 'all' else args.status)
+        if session_id not in done
+    ]
+    if args.limit is not None:
+        session_ids = session_ids[:args.limit]
+    print(f"Rescoring {len(session_ids)} session(s), {len(done)} already done", file=sys.stderr)
+
+    writer = JsonlWriter(args.output)
+    started = time.perf_counter()
+    try:
+        succeeded, failed = run(rescorer, session_ids, writer, args.workers)
+    finally:
+        writer.close()
+    print(f"Rescored {succeeded} session(s), {failed} failed, in {time.perf_counter() - started:.1f}s",
+          file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
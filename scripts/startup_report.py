@@ -0,0 +1,80 @@
+"""Report what starting the API costs, per dependency.
+
+Starts a fresh interpreter with ``python -X importtime``, imports the app
+and builds every service (as the gunicorn master does when preloading),
+then adds up the import time of each top-level package (flask, pydub,
+google, numpy, ...) and prints them slowest first, followed by the app's
+own startup stages (see startup.py). Compare the JSON output between
+releases to catch a dependency that made cold starts slower.
+
+    python scripts/startup_report.py
+    python scripts/startup_report.py --top 10 --output startup.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter() - started
+app.create_app().extensions['cas'].warm()
+import startup
+print(json.dumps({'importApp': imported, 'total': time.perf_counter() - started, 'stages': startup.report()['stages']}))
+"""
+
+
+def parse_importtime(stderr):
+    """Self time in seconds per top-level package from -X importtime lines
+    such as ``import time:       341 |      82662 |     audio_preprocessing``"""
+    packages = defaultdict(float)
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        package = fields[2].strip().split('.')[0]
+        packages[package] += int(fields[0]) / 1e6
+    return packages
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--top', type=int, default=15, help='Packages to list')
+    parser.add_argument('--output', help='Write the report as JSON to this file')
+    args = parser.parse_args(argv)
+
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr[-2000:])
+        raise SystemExit("Starting the app failed")
+    app = json.loads(result.stdout.strip().splitlines()[-1])
+    packages = sorted(parse_importtime(result.stderr).items(), key=lambda item: item[1], reverse=True)
+
+    print(f"{'package':32} {'import':>10}")
+    for package, seconds in packages[:args.top]:
+        print(f"{package[:32]:32} {seconds * 1000:8.1f}ms")
+    print(f"\n{'stage':32} {'time':>10}")
+    print(f"{'import app':32} {app['importApp'] * 1000:8.1f}ms")
+    for stage in app['stages']:
+        print(f"{stage['stage'][:32]:32} {stage['seconds'] * 1000:8.1f}ms")
+    print(f"{'total (import and warm)':32} {app['total'] * 1000:8.1f}ms")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'packages': dict(packages), **app}, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+import os
+import threading
+from config import AI_BACKEND, ANALYSIS_BATCH_SIZE, PERSIST_UPLOADS, AUDIO_PREPROCESSOR
+from structured_logging import get_logger
+import startup
+
+logger = get_logger(__name__)
+
+# Third-party packages behind the services, imported one at a time by
+# Services.warm so the startup report shows what each one costs
+DEPENDENCIES = ('pydub', 'speech_recognition', 'google.api_core')
+if AUDIO_PREPROCESSOR != 'pydub':
+    DEPENDENCIES = ('numpy',) + DEPENDENCIES
+if AI_BACKEND != 'fake':
+    DEPENDENCIES += ('google.generativeai',)
+
+
+class service:
+    """A Services attribute that is built on first access, once: the build
+    runs under the container's lock since services depend on each other,
+    and is timed for the startup report"""
+
+    def __init__(self, build):
+        self.build = build
+        self.name = build.__name__
+
+    def __get__(self, services, owner=None):
+        if services is None:
+            return self
+        if self.name not in services.__dict__:
+            with services.lock:
+                if self.name not in services.__dict__:
+                    with startup.timed(f"build {self.name}"):
+                        services.__dict__[self.name] = self.build(services)
+        return services.__dict__[self.name]
+
+
+class Services:
+    """The services shared by all requests of one process, each built the
+    first time it is needed: importing the app and answering /health or
+    /api/questions does not load pydub, speech_recognition or Gemini.
+
+    Under ``gunicorn --preload`` the master calls ``warm`` before forking so
+    every worker shares the imported modules and built services copy-on-write.
+    Everything built here is fork-safe: thread pools create their threads on
+    first use, SQLite connections are opened per process, and the Gemini
+    client opens its connection on the first call. Background threads are
+    started per process by ``start``."""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.started_pid = None
+
+    def built(self, name):
+        return name in self.__dict__
+
+    @service
+    def audio_archive(self):
+        if not PERSIST_UPLOADS:
+            return None
+        from audio_archive import AudioArchive
+        return AudioArchive()
+
+    @service
+    def question_bank(self):
+        from question_bank import QuestionBank
+        return QuestionBank()
+
+    @service
+    def session_manager(self):
+        from session_manager import SessionManager
+        return SessionManager(audio_archive=self.audio_archive, question_bank=self.question_bank)
+
+    @service
+    def event_bus(self):
+        from event_bus import create_event_bus
+        return create_event_bus()
+
+    @service
+    def speech_service(self):
+        from speech_service import SpeechService
+        return SpeechService()
+
+    @service
+    def ai_service(self):
+        from ai_service import AIService
+        return AIService(self.speech_service)
+
+    @service
+    def analysis_batcher(self):
+        if ANALYSIS_BATCH_SIZE <= 1:
+            return None
+        from analysis_batcher import AnalysisBatcher
+        return AnalysisBatcher(self.ai_service)
+
+    @service
+    def transcription_queue(self):
+        from transcription_queue import TranscriptionQueue
+        return TranscriptionQueue(
+            self.session_manager, self.speech_service, self.ai_service,
+            analysis_batcher=self.analysis_batcher, audio_archive=self.audio_archive, event_bus=self.event_bus
+        )
+
+    @service
+    def streaming_transcriber(self):
+        from streaming_transcription import StreamingTranscriber
+        return StreamingTranscriber(self.speech_service)
+
+    @service
+    def routes(self):
+        from routes import Routes
+        return Routes(self)
+
+    @service
+    def session_sweeper(self):
+        from session_sweeper import SessionSweeper
+        return SessionSweeper(self.session_manager, audio_archive=self.audio_archive, event_bus=self.event_bus)
+
+    def warm(self):
+        """Import the heavy dependencies and build every service now, e.g.
+        in the gunicorn master before it forks the workers"""
+        for name in DEPENDENCIES:
+            startup.import_module(name)
+        for name, attribute in vars(Services).items():
+            if isinstance(attribute, service):
+                getattr(self, name)
+        self.speech_service.backend.preload()
+        logger.info("Services ready: %s", startup.summary())
+
+    def start(self):
+        """Start the background threads in this process. Cheap to call on
+        every request; after a fork each worker starts its own threads."""
+        if self.started_pid == os.getpid():
+            return
+        with self.lock:
+            if self.started_pid != os.getpid():
+                self.session_sweeper.start()
+                self.started_pid = os.getpid()
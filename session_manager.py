@@ -1,83 +1,245 @@
+import os
+import glob
+import time
 import uuid
+import threading
 from datetime import datetime
-from config import CAS_QUESTIONS
+from config import (
+    UPLOAD_FOLDER, SESSION_IDLE_TTL, SESSION_MAX_AGE, SESSION_MAX_COUNT
+)
+from session_store import create_session_store
+from question_bank import QuestionBank
+from structured_logging import get_logger
+
+logger = get_logger(__name__)
 
 class SessionManager:
-    def __init__(self):
-        self.sessions = {}
+    def __init__(self, store=None, idle_ttl=SESSION_IDLE_TTL, max_age=SESSION_MAX_AGE,
+                 max_sessions=SESSION_MAX_COUNT, audio_archive=None, question_bank=None):
+        self.store = store if store is not None else create_session_store()
+        self.question_bank = question_bank if question_bank is not None else QuestionBank()
+        self.audio_archive = audio_archive
+        self.idle_ttl = idle_ttl
+        self.max_age = max_age
+        self.max_sessions = max_sessions
+        self.stats_lock = threading.Lock()
+        self.eviction_stats = {'idle': 0, 'expired': 0, 'capacity': 0, 'filesDeleted': 0}
     
-    def create_session(self):
+    def create_session(self, question_set_id=None):
+        question_set = self.question_bank.get(question_set_id)
+        if question_set is None:
+            raise ValueError(f"Unknown question set: {question_set_id}")
+        
         session_id = str(uuid.uuid4())
-        self.sessions[session_id] = {
+        self.store.create({
             'id': session_id,
+            'question_set': question_set.id,
             'start_time': datetime.now(),
             'responses': [],
+            'transcriptions': {},
             'status': 'active'
-        }
+        })
+        if self.store.count() > self.max_sessions:
+            self.evict_over_capacity()
         return session_id
     
     def get_session(self, session_id):
-        return self.sessions.get(session_id)
+        return self.store.get(session_id)
     
-    def add_response(self, session_id, question_index, audio_path, transcription):
-        if session_id not in self.sessions:
-            raise ValueError("Session not found")
-        
-        if question_index < 0 or question_index >= len(CAS_QUESTIONS):
-            raise ValueError("Invalid question index")
-        
-        response_data = {
-            'question': CAS_QUESTIONS[question_index],
-            'audioPath': audio_path,
-            'transcription': transcription,
-            'timestamp': datetime.now()
-        }
-        
-        self.sessions[session_id]['responses'].append(response_data)
-        
-        is_complete = len(self.sessions[session_id]['responses']) == len(CAS_QUESTIONS)
-        
-        if is_complete:
-            self.sessions[session_id]['status'] = 'completed'
-            self.sessions[session_id]['end_time'] = datetime.now()
+    def get_question_set(self, session_id):
+        """The QuestionSet a session was started with, or None if the
+        session does not exist"""
+        session = self.store.get(session_id)
+        return self.question_bank.for_session(session) if session is not None else None
+    
+    def add_response(self, session_id, question_index, audio_path, transcription, answer_analysis=None,
+                     job_state=None):
+        """Record an answer; returns True once every question is answered.
+        ``job_state`` (status and details of the transcription job) is
+        written in the same store update."""
+        def apply(session):
+            question_set = self.question_bank.for_session(session)
+            response_data = {
+                'questionIndex': question_index,
+                'question': question_set.question(question_index),
+                'audioPath': audio_path,
+                'transcription': transcription,
+                'answerAnalysis': answer_analysis,
+                'timestamp': datetime.now()
+            }
+            
+            # Transcriptions finish out of order in the background, so keep
+            # responses sorted by question and replace re-submitted answers.
+            responses = [
+                r for r in session['responses']
+                if r.get('questionIndex') != question_index
+            ]
+            responses.append(response_data)
+            responses.sort(key=lambda r: r['questionIndex'])
+            session['responses'] = responses
+            if job_state is not None:
+                details = {key: value for key, value in job_state.items() if key != 'status'}
+                self._apply_transcription_state(session, question_index, job_state['status'], details)
+            
+            is_complete = len(responses) == len(question_set)
+            
+            if is_complete and session['status'] != 'completed':
+                session['status'] = 'completed'
+                session['end_time'] = datetime.now()
+            
+            return is_complete
         
-        return is_complete
+        try:
+            return self.store.update(session_id, apply)
+        except KeyError:
+            raise ValueError("Session not found")
+    
+    def set_transcription_state(self, session_id, question_index, state, **details):
+        """Record the background transcription state for one question. A
+        new job for the question (a resubmitted answer) starts a new entry."""
+        try:
+            self.store.update(
+                session_id, lambda session: self._apply_transcription_state(session, question_index, state, details)
+            )
+        except KeyError:
+            pass
+    
+    def _apply_transcription_state(self, session, question_index, state, details):
+        transcriptions = session.setdefault('transcriptions', {})
+        entry = transcriptions.get(str(question_index))
+        if entry is None or entry.get('jobId') != details.get('jobId', entry.get('jobId')):
+            entry = transcriptions[str(question_index)] = {}
+        entry.update(details)
+        entry['status'] = state
+        entry['updatedAt'] = datetime.now().isoformat()
+    
+    def get_transcription_job(self, job_id):
+        """The state of a background transcription job, read from the
+        session store so that any worker can answer for it; None once the
+        job is unknown or its answer was resubmitted"""
+        session_id, _, _ = job_id.rpartition('.')
+        session = self.store.get(session_id) if session_id else None
+        if session is None:
+            return None
+        for question_index, entry in session.get('transcriptions', {}).items():
+            if entry.get('jobId') == job_id:
+                return {'sessionId': session_id, 'questionIndex': int(question_index), **entry}
+        return None
+    
+    def next_question_index(self, session_id, question_index):
+        """The question to answer after ``question_index``: the next one
+        that has not been submitted, or whose job failed and must be
+        submitted again. None when every answer is in."""
+        session = self.store.get(session_id)
+        if session is None:
+            return None
+        transcriptions = session.get('transcriptions', {})
+        answered = {int(index) for index, entry in transcriptions.items() if entry.get('status') != 'failed'}
+        answered.add(question_index)
+        remaining = [index for index in range(len(self.question_bank.for_session(session))) if index not in answered]
+        # Carry on in order, then go back for any answer that failed
+        later = [index for index in remaining if index > question_index]
+        return (later or remaining or [None])[0]
     
     def set_analysis(self, session_id, analysis):
-        if session_id in self.sessions:
-            self.sessions[session_id]['analysis'] = analysis
+        def apply(session):
+            session['analysis'] = analysis
+        
+        try:
+            self.store.update(session_id, apply)
+        except KeyError:
+            pass
     
     def delete_session(self, session_id):
-        if session_id in self.sessions:
-            del self.sessions[session_id]
-            return True
-        return False
+        deleted = self.store.delete(session_id)
+        if deleted and self.audio_archive is not None:
+            self.audio_archive.release_session(session_id)
+        return deleted
     
     def get_session_status(self, session_id):
-        if session_id not in self.sessions:
+        session = self.store.get(session_id)
+        if session is None:
             return None
         
-        session = self.sessions[session_id]
+        question_set = self.question_bank.for_session(session)
         return {
             'sessionId': session['id'],
+            'questionSetId': question_set.id,
             'status': session['status'],
             'currentQuestion': len(session['responses']),
-            'totalQuestions': len(CAS_QUESTIONS),
+            'totalQuestions': len(question_set),
             'startTime': session['start_time'].isoformat(),
-            'endTime': session.get('end_time', '').isoformat() if session.get('end_time') else None
+            'endTime': session.get('end_time', '').isoformat() if session.get('end_time') else None,
+            'transcriptions': dict(sorted(
+                session.get('transcriptions', {}).items(),
+                key=lambda item: int(item[0])
+            )),
+            'analysisReady': session.get('analysis') is not None
         }
     
     def get_session_result(self, session_id):
-        if session_id not in self.sessions:
+        session = self.store.get(session_id)
+        if session is None:
             return None
         
-        session = self.sessions[session_id]
-        if session['status'] != 'completed':
+        if session['status'] != 'completed' or session.get('analysis') is None:
             return None
         
+        question_set = self.question_bank.for_session(session)
         return {
             'sessionId': session['id'],
             'analysis': session.get('analysis'),
             'duration': (session['end_time'] - session['start_time']).total_seconds(),
-            'totalQuestions': len(CAS_QUESTIONS)
-        } 
\ No newline at end of file
+            'questionSetId': question_set.id,
+            'totalQuestions': len(question_set)
+        }
+    
+    def evict_expired(self, now=None):
+        """Remove sessions past their idle or absolute TTL, then trim to capacity"""
+        now = now if now is not None else time.time()
+        expired = self.store.find_expired(now - self.idle_ttl, now - self.max_age)
+        for session_id, reason in expired:
+            self._evict(session_id, reason)
+        return len(expired) + self.evict_over_capacity()
+    
+    def evict_over_capacity(self):
+        overflow = self.store.count() - self.max_sessions
+        if overflow <= 0:
+            return 0
+        victims = self.store.least_recently_used(overflow)
+        for session_id in victims:
+            self._evict(session_id, 'capacity')
+        return len(victims)
+    
+    def _evict(self, session_id, reason):
+        session = self.store.pop(session_id)
+        if session is None:
+            return
+        # Archived audio may be shared with other answers, so the archive
+        # decides what to delete; older per-session files are removed here
+        deleted = self.audio_archive.release_session(session_id) if self.audio_archive is not None else 0
+        paths = {
+            r['audioPath'] for r in session.get('responses', [])
+            if r.get('audioPath') and not (self.audio_archive is not None and self.audio_archive.owns(r['audioPath']))
+        }
+        paths.update(glob.glob(os.path.join(UPLOAD_FOLDER, f"{glob.escape(session_id)}-*")))
+        for path in paths:
+            try:
+                os.remove(path)
+                deleted += 1
+            except OSError:
+                pass
+        with self.stats_lock:
+            self.eviction_stats[reason] += 1
+            self.eviction_stats['filesDeleted'] += deleted
+        logger.info("Evicted session", extra={'sessionId': session_id, 'reason': reason, 'filesDeleted': deleted})
+    
+    def get_occupancy(self):
+        with self.stats_lock:
+            evictions = dict(self.eviction_stats)
+        return {
+            'sessions': self.store.count(),
+            'activeSessions': self.store.count('active'),
+            'maxSessions': self.max_sessions,
+            'evictions': evictions
+        }
@@ -0,0 +1,273 @@
+import json
+import threading
+import time
+import copy
+from collections import OrderedDict
+from datetime import datetime
+from config import SESSION_STORE, SESSION_DB_PATH
+from sqlite_connections import ThreadConnections
+
+
+class SessionStore:
+    """Storage backend used by SessionManager.
+
+    Sessions are plain dicts. ``get`` always returns a copy, so callers must
+    go through ``update`` to change a stored session. Both ``get`` and
+    ``update`` refresh the session's last-access time used for eviction,
+    unless called with ``touch=False`` (e.g. by offline tools, which must not
+    keep idle sessions alive)."""
+
+    def create(self, session):
+        raise NotImplementedError
+
+    def get(self, session_id, touch=True):
+        raise NotImplementedError
+
+    def update(self, session_id, mutate, touch=True):
+        """Apply ``mutate(session)`` atomically and return its result.
+        Raises KeyError if the session does not exist."""
+        raise NotImplementedError
+
+    def delete(self, session_id):
+        raise NotImplementedError
+
+    def pop(self, session_id):
+        """Delete a session and return it, or None if it did not exist"""
+        raise NotImplementedError
+
+    def list_ids(self, status=None):
+        raise NotImplementedError
+
+    def count(self, status=None):
+        return len(self.list_ids(status))
+
+    def find_expired(self, idle_before, created_before):
+        """Return ``(session_id, reason)`` pairs for sessions last accessed
+        before ``idle_before`` or created before ``created_before`` (epoch
+        seconds)."""
+        raise NotImplementedError
+
+    def least_recently_used(self, limit):
+        """Return up to ``limit`` session ids, least recently accessed first"""
+        raise NotImplementedError
+
+
+class MemorySessionStore(SessionStore):
+    """Process-local store; only suitable for a single gunicorn worker"""
+
+    def __init__(self):
+        # Kept in access order, least recently used first
+        self.sessions = OrderedDict()
+        self.created_at = {}
+        self.last_access = {}
+        self.lock = threading.RLock()
+
+    def _touch(self, session_id):
+        self.sessions.move_to_end(session_id)
+        self.last_access[session_id] = time.time()
+
+    def create(self, session):
+        with self.lock:
+            self.sessions[session['id']] = copy.deepcopy(session)
+            self.created_at[session['id']] = time.time()
+            self._touch(session['id'])
+
+    def get(self, session_id, touch=True):
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                return None
+            if touch:
+                self._touch(session_id)
+            return copy.deepcopy(session)
+
+    def update(self, session_id, mutate, touch=True):
+        with self.lock:
+            if session_id not in self.sessions:
+                raise KeyError(session_id)
+            if touch:
+                self._touch(session_id)
+            return mutate(self.sessions[session_id])
+
+    def delete(self, session_id):
+        return self.pop(session_id) is not None
+
+    def pop(self, session_id):
+        with self.lock:
+            self.created_at.pop(session_id, None)
+            self.last_access.pop(session_id, None)
+            return self.sessions.pop(session_id, None)
+
+    def list_ids(self, status=None):
+        with self.lock:
+            return [
+                session_id for session_id, session in self.sessions.items()
+                if status is None or session['status'] == status
+            ]
+
+    def count(self, status=None):
+        if status is None:
+            return len(self.sessions)
+        return super().count(status)
+
+    def find_expired(self, idle_before, created_before):
+        with self.lock:
+            expired = []
+            for session_id in self.sessions:
+                if self.created_at[session_id] < created_before:
+                    expired.append((session_id, 'expired'))
+                elif self.last_access[session_id] < idle_before:
+                    expired.append((session_id, 'idle'))
+            return expired
+
+    def least_recently_used(self, limit):
+        with self.lock:
+            return list(self.sessions)[:max(0, limit)]
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _decode(obj):
+    if '__datetime__' in obj and len(obj) == 1:
+        return datetime.fromisoformat(obj['__datetime__'])
+    return obj
+
+
+class SQLiteSessionStore(SessionStore):
+    """Store shared by every worker on the host through a WAL-mode SQLite file.
+
+    Each session is one row holding the JSON document, with the id as primary
+    key and indexes on status and last access. A response, its job's
+    completed state, the status change and the end time are written together
+    in one transaction per ``update`` call."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            data TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            created_at REAL NOT NULL DEFAULT 0,
+            last_access REAL NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_sessions_status ON sessions (status);
+    """
+
+    # Columns added after the first release of the schema
+    MIGRATIONS = {
+        'created_at': 'ALTER TABLE sessions ADD COLUMN created_at REAL NOT NULL DEFAULT 0',
+        'last_access': 'ALTER TABLE sessions ADD COLUMN last_access REAL NOT NULL DEFAULT 0',
+    }
+
+    # Reads only refresh last_access when it is older than this many seconds,
+    # so status polling does not turn every GET into a write.
+    TOUCH_INTERVAL = 5
+
+    def __init__(self, db_path=SESSION_DB_PATH):
+        self.db_path = db_path
+        self._connection = ThreadConnections(db_path)
+        conn = self._connection()
+        conn.executescript(self.SCHEMA)
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(sessions)')}
+        for column, statement in self.MIGRATIONS.items():
+            if column not in columns:
+                conn.execute(statement)
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_last_access ON sessions (last_access)')
+
+    def create(self, session):
+        now = time.time()
+        self._connection().execute(
+            'INSERT OR REPLACE INTO sessions (id, status, data, updated_at, created_at, last_access) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (session['id'], session['status'], json.dumps(session, default=_encode),
+             datetime.now().isoformat(), now, now)
+        )
+
+    def get(self, session_id, touch=True):
+        conn = self._connection()
+        row = conn.execute(
+            'SELECT data, last_access FROM sessions WHERE id = ?', (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if touch and now - row[1] > self.TOUCH_INTERVAL:
+            conn.execute('UPDATE sessions SET last_access = ? WHERE id = ?', (now, session_id))
+        return json.loads(row[0], object_hook=_decode)
+
+    def update(self, session_id, mutate, touch=True):
+        conn = self._connection()
+        # BEGIN IMMEDIATE takes the write lock up front so concurrent
+        # read-modify-write cycles from other workers cannot interleave.
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT data, last_access FROM sessions WHERE id = ?', (session_id,)).fetchone()
+            if row is None:
+                raise KeyError(session_id)
+            session = json.loads(row[0], object_hook=_decode)
+            result = mutate(session)
+            conn.execute(
+                'UPDATE sessions SET status = ?, data = ?, updated_at = ?, last_access = ? WHERE id = ?',
+                (session['status'], json.dumps(session, default=_encode),
+                 datetime.now().isoformat(), time.time() if touch else row[1], session_id)
+            )
+            conn.execute('COMMIT')
+            return result
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def delete(self, session_id):
+        cursor = self._connection().execute('DELETE FROM sessions WHERE id = ?', (session_id,))
+        return cursor.rowcount > 0
+
+    def pop(self, session_id):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT data FROM sessions WHERE id = ?', (session_id,)).fetchone()
+            conn.execute('DELETE FROM sessions WHERE id = ?', (session_id,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return json.loads(row[0], object_hook=_decode) if row else None
+
+    def list_ids(self, status=None):
+        conn = self._connection()
+        if status is None:
+            rows = conn.execute('SELECT id FROM sessions').fetchall()
+        else:
+            rows = conn.execute('SELECT id FROM sessions WHERE status = ?', (status,)).fetchall()
+        return [row[0] for row in rows]
+
+    def count(self, status=None):
+        conn = self._connection()
+        if status is None:
+            return conn.execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+        return conn.execute('SELECT COUNT(*) FROM sessions WHERE status = ?', (status,)).fetchone()[0]
+
+    def find_expired(self, idle_before, created_before):
+        rows = self._connection().execute(
+            'SELECT id, created_at < ? FROM sessions WHERE created_at < ? OR last_access < ?',
+            (created_before, created_before, idle_before)
+        ).fetchall()
+        return [(row[0], 'expired' if row[1] else 'idle') for row in rows]
+
+    def least_recently_used(self, limit):
+        rows = self._connection().execute(
+            'SELECT id FROM sessions ORDER BY last_access LIMIT ?', (max(0, limit),)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+
+def create_session_store(backend=SESSION_STORE):
+    if backend == 'memory':
+        return MemorySessionStore()
+    if backend == 'sqlite':
+        return SQLiteSessionStore()
+    raise ValueError(f"Unknown session store backend: {backend}")
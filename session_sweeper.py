@@ -0,0 +1,46 @@
+import threading
+from datetime import datetime
+from config import SESSION_SWEEP_INTERVAL
+from structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+
+class SessionSweeper:
+    """Daemon thread that periodically evicts expired sessions, applies
+    the audio archive's retention policies and drops old interview events"""
+
+    def __init__(self, session_manager, interval=SESSION_SWEEP_INTERVAL, audio_archive=None, event_bus=None):
+        self.session_manager = session_manager
+        self.audio_archive = audio_archive
+        self.event_bus = event_bus
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.last_sweep = None
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name='session-sweeper', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def sweep(self):
+        evicted = self.session_manager.evict_expired()
+        if self.audio_archive is not None:
+            self.audio_archive.enforce_retention()
+        if self.event_bus is not None:
+            self.event_bus.prune()
+        self.last_sweep = datetime.now().isoformat()
+        return evicted
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.exception("Session sweep failed: %s", e)
@@ -0,0 +1,193 @@
+import json
+import time
+import hashlib
+import audioop
+import threading
+import speech_recognition as sr
+from config import SPEECH_BACKENDS, VOSK_MODEL_PATH, WHISPER_MODEL_SIZE, FAKE_RECOGNIZER_LATENCY
+from structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+# Offline models are loaded once per worker process and shared by its threads
+_models = {}
+_models_lock = threading.Lock()
+
+
+def _load_model(key, loader):
+    with _models_lock:
+        if key not in _models:
+            logger.info("Loading speech model: %s", key)
+            _models[key] = loader()
+        return _models[key]
+
+
+class RecognitionBackend:
+    """A speech-to-text engine.
+
+    ``recognize`` takes 16-bit mono ``sr.AudioData`` and returns the text. It
+    raises ``sr.UnknownValueError`` when the audio contains no recognizable
+    speech and ``sr.RequestError`` when the engine itself is unavailable."""
+
+    name = 'backend'
+
+    def recognize(self, audio_data):
+        raise NotImplementedError
+
+    def preload(self):
+        """Load what the engine needs up front, if that is fork-safe, so a
+        gunicorn master can load it once for all workers"""
+
+
+class GoogleBackend(RecognitionBackend):
+    name = 'google'
+
+    def __init__(self, recognizer=None, language='en-US'):
+        self.recognizer = recognizer or sr.Recognizer()
+        self.language = language
+
+    def recognize(self, audio_data):
+        return self.recognizer.recognize_google(audio_data, language=self.language)
+
+
+class VoskBackend(RecognitionBackend):
+    """Offline Kaldi recognition; needs the ``vosk`` package and a model
+    directory at VOSK_MODEL_PATH"""
+
+    name = 'vosk'
+
+    def __init__(self, model_path=VOSK_MODEL_PATH):
+        self.model_path = model_path
+
+    def _model(self):
+        try:
+            import vosk
+        except ImportError:
+            raise sr.RequestError("vosk is not installed")
+        try:
+            return _load_model(f"vosk:{self.model_path}", lambda: vosk.Model(self.model_path))
+        except Exception as e:
+            raise sr.RequestError(f"Could not load Vosk model: {e}")
+
+    def preload(self):
+        # The Kaldi model is read-only once loaded and starts no threads
+        try:
+            self._model()
+        except sr.RequestError as e:
+            logger.warning("Vosk model not preloaded: %s", e)
+
+    def recognize(self, audio_data):
+        model = self._model()
+        import vosk
+        recognizer = vosk.KaldiRecognizer(model, audio_data.sample_rate)
+        recognizer.AcceptWaveform(audio_data.get_raw_data(convert_width=2))
+        text = json.loads(recognizer.FinalResult()).get('text', '')
+        if not text:
+            raise sr.UnknownValueError()
+        return text
+
+
+class WhisperBackend(RecognitionBackend):
+    """Offline faster-whisper recognition on CPU; needs the ``faster-whisper``
+    package"""
+
+    name = 'whisper'
+
+    def __init__(self, model_size=WHISPER_MODEL_SIZE):
+        self.model_size = model_size
+
+    def _model(self):
+        try:
+            from faster_whisper import WhisperModel
+        except ImportError:
+            raise sr.RequestError("faster-whisper is not installed")
+        try:
+            return _load_model(
+                f"whisper:{self.model_size}",
+                lambda: WhisperModel(self.model_size, device='cpu', compute_type='int8')
+            )
+        except Exception as e:
+            raise sr.RequestError(f"Could not load Whisper model: {e}")
+
+    def recognize(self, audio_data):
+        model = self._model()
+        import numpy as np
+        samples = np.frombuffer(
+            audio_data.get_raw_data(convert_rate=16000, convert_width=2), dtype=np.int16
+        ).astype(np.float32) / 32768.0
+        segments, _ = model.transcribe(samples, language='en', beam_size=1)
+        text = " ".join(segment.text.strip() for segment in segments).strip()
+        if not text:
+            raise sr.UnknownValueError()
+        return text
+
+
+class FakeBackend(RecognitionBackend):
+    """Deterministic stand-in for load testing without network access.
+
+    Sleeps for ``latency`` seconds plus ``latency_per_second`` per second of
+    audio, then returns text derived from the audio bytes, so identical
+    audio always yields the same transcript. Silent audio raises
+    ``sr.UnknownValueError``."""
+
+    name = 'fake'
+
+    WORDS = ('I', 'want', 'to', 'study', 'in', 'the', 'UK', 'because', 'my',
+             'course', 'university', 'career', 'goals', 'are', 'clear', 'and')
+
+    def __init__(self, latency=FAKE_RECOGNIZER_LATENCY, latency_per_second=0.0):
+        self.latency = latency
+        self.latency_per_second = latency_per_second
+
+    def recognize(self, audio_data):
+        raw = audio_data.get_raw_data(convert_width=2)
+        duration = len(raw) / (2 * audio_data.sample_rate)
+        time.sleep(self.latency + self.latency_per_second * duration)
+        if not raw or audioop.rms(raw, 2) < 50:
+            raise sr.UnknownValueError()
+        digest = hashlib.sha256(raw).digest()
+        word_count = max(3, int(duration * 2))
+        return " ".join(self.WORDS[digest[i % len(digest)] % len(self.WORDS)] for i in range(word_count))
+
+
+class FallbackChain(RecognitionBackend):
+    """Tries each backend in order, moving on when one is unavailable.
+    A "no speech" result is final and is not retried on the next backend."""
+
+    def __init__(self, backends):
+        self.backends = backends
+        self.name = '+'.join(backend.name for backend in backends)
+
+    def recognize(self, audio_data):
+        last_error = None
+        for backend in self.backends:
+            try:
+                return backend.recognize(audio_data)
+            except sr.RequestError as e:
+                logger.warning("%s recognition unavailable: %s", backend.name, e)
+                last_error = e
+        raise last_error or sr.RequestError("No speech recognition backend configured")
+
+    def preload(self):
+        for backend in self.backends:
+            backend.preload()
+
+
+BACKENDS = {
+    'google': GoogleBackend,
+    'vosk': VoskBackend,
+    'whisper': WhisperBackend,
+    'fake': FakeBackend,
+}
+
+
+def create_backend(names=SPEECH_BACKENDS, recognizer=None):
+    """Build the backend (or fallback chain) for a comma-separated list of names"""
+    backends = []
+    for name in [n.strip() for n in names.split(',') if n.strip()]:
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown speech recognition backend: {name}")
+        backends.append(GoogleBackend(recognizer) if name == 'google' else BACKENDS[name]())
+    if len(backends) == 1:
+        return backends[0]
+    return FallbackChain(backends)
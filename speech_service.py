@@ -1,84 +1,278 @@
+import io
 import os
-import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pydub import AudioSegment
 import speech_recognition as sr
-from config import UPLOAD_FOLDER
+from config import (
+    UPLOAD_FOLDER, TRANSCRIPTION_CHUNKING, CHUNK_WORKERS, CHUNK_MIN_AUDIO_MS,
+    CHUNK_MIN_SILENCE_MS, CHUNK_MAX_MS, MAX_ANSWER_SECONDS, AUDIO_PREPROCESSOR, PRESCREEN_ENABLED,
+    PRESCREEN_MIN_DURATION_MS, PRESCREEN_MIN_RMS_DB, PRESCREEN_SPEECH_DB, PRESCREEN_MIN_SPEECH_RATIO,
+    SPEECH_MAX_IN_FLIGHT, SPEECH_MAX_QUEUE
+)
+from result_cache import create_cache, hash_bytes
+from audio_segmentation import find_speech_chunks, screen_speech
+from audio_preprocessing import NumpyPreprocessor, numpy_available
+from speech_backends import create_backend
+from admission import AdmissionController, Overloaded
+from transcription_errors import TranscriptionError
+from metrics import STAGE_SECONDS, FALLBACKS, PRESCREEN
+from structured_logging import get_logger, redact
+import deadlines
+
+logger = get_logger(__name__)
+
 
 class SpeechService:
-    def __init__(self):
-        print("Initializing Google Speech Recognition...")
+    def __init__(self, cache=None, chunking=TRANSCRIPTION_CHUNKING, backend=None, prescreen=PRESCREEN_ENABLED,
+                 preprocessor=AUDIO_PREPROCESSOR):
         self.recognizer = sr.Recognizer()
-        print("✓ Google Speech Recognition initialized successfully")
+        self.backend = backend if backend is not None else create_backend(recognizer=self.recognizer)
+        self.cache = cache if cache is not None else create_cache('transcriptions')
+        self.chunking = chunking
+        self.prescreen_enabled = prescreen
+        if preprocessor == 'numpy' or (preprocessor == 'auto' and numpy_available()):
+            self.preprocessor = NumpyPreprocessor()
+        else:
+            self.preprocessor = None
+        self.chunk_executor = ThreadPoolExecutor(max_workers=CHUNK_WORKERS, thread_name_prefix='recognize')
+        # Answers being recognized at once, across transcription jobs and streams
+        self.admission = AdmissionController('speech', SPEECH_MAX_IN_FLIGHT, SPEECH_MAX_QUEUE, typical_seconds=5)
+        logger.info("Speech recognition initialized with backend: %s, preprocessing: %s",
+                    self.backend.name, 'numpy' if self.preprocessor is not None else 'pydub')
+    
+    def decode_audio(self, audio_bytes, normalize=True):
+        """Decode, downmix to 16 kHz mono and normalize entirely in memory.
+        Audio past MAX_ANSWER_SECONDS is dropped so that formats whose
+        length is unknown until decoded cannot run up recognition time."""
+        with STAGE_SECONDS.time(stage='decode'):
+            segment = self._decode_audio(audio_bytes)
+        if len(segment) > MAX_ANSWER_SECONDS * 1000:
+            logger.warning("Answer is %.0fs long, transcribing the first %ss", len(segment) / 1000, MAX_ANSWER_SECONDS)
+            segment = segment[:MAX_ANSWER_SECONDS * 1000]
+        if normalize:
+            segment = self.normalize(segment)
+        return segment
+    
+    def normalize(self, segment):
+        with STAGE_SECONDS.time(stage='normalize'):
+            if self.preprocessor is not None:
+                return self.preprocessor.normalize(segment)
+            return segment.normalize()
     
-    def optimize_audio(self, audio_file_path):
+    def _decode_audio(self, audio_bytes):
+        if self.preprocessor is not None:
+            try:
+                return self.preprocessor.decode(audio_bytes, max_seconds=MAX_ANSWER_SECONDS)
+            except Exception as e:
+                logger.debug("NumPy decode failed, falling back to pydub: %s", e)
         try:
-            print("Optimizing audio for speech recognition...")
-            audio = AudioSegment.from_file(audio_file_path)
+            # ffmpeg resamples and downmixes while decoding from stdin, so no
+            # temp files are written
+            audio = AudioSegment.from_file(io.BytesIO(audio_bytes), parameters=["-ar", "16000", "-ac", "1"])
             audio = audio.set_frame_rate(16000)
             if audio.channels > 1:
                 audio = audio.set_channels(1)
-            audio = audio.normalize()
-            temp_optimized = tempfile.NamedTemporaryFile(delete=False, suffix='.wav')
-            audio.export(temp_optimized.name, format='wav', parameters=["-ar", "16000", "-ac", "1"])
             
-            print(f"✓ Audio optimized: {os.path.getsize(audio_file_path)} bytes → {os.path.getsize(temp_optimized.name)} bytes")
-            return temp_optimized.name
+            logger.debug("Audio decoded: %d bytes -> %d bytes PCM", len(audio_bytes), len(audio.raw_data))
+            return audio
             
         except Exception as e:
-            print(f"✗ Audio optimization failed: {e}")
-            return audio_file_path
+            logger.debug("pydub decode failed, reading audio directly: %s", e)
+            # Let speech_recognition read WAV/AIFF/FLAC input directly
+            with sr.AudioFile(io.BytesIO(audio_bytes)) as source:
+                audio_data = self.recognizer.record(source)
+            return AudioSegment(
+                data=audio_data.get_raw_data(convert_rate=16000, convert_width=2),
+                sample_width=2,
+                frame_rate=16000,
+                channels=1
+            )
+    
+    def optimize_audio(self, audio_bytes):
+        """Return recognizer-ready AudioData for the whole clip"""
+        return self.to_audio_data(self.decode_audio(audio_bytes))
     
-    def transcribe_audio(self, audio_file_path):
-        optimized_file = None
+    def to_audio_data(self, segment):
+        return sr.AudioData(segment.raw_data, segment.frame_rate, segment.sample_width)
+    
+    def transcribe_audio(self, audio):
+        """Transcribe raw audio bytes, or the file at the given path.
+        
+        Answers without recognizable speech are settled with a fallback
+        transcription; failures raise TranscriptionError, DeadlineExceeded
+        or Overloaded (recognition at capacity) instead, so that a failure
+        is never recorded as the candidate's answer."""
+        if isinstance(audio, (bytes, bytearray)):
+            audio_bytes = bytes(audio)
+            label = 'in-memory upload'
+        else:
+            with open(audio, 'rb') as f:
+                audio_bytes = f.read()
+            label = os.path.basename(audio)
         
+        cache_key = self.cache_key(audio_bytes)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            logger.info("Transcription cache hit for %s", label)
+            return cached
+        
+        transcription = self._transcribe(audio_bytes, label)
+        if 'error' not in transcription:
+            self.cache.set(cache_key, transcription)
+        return transcription
+    
+    def cache_key(self, audio_bytes):
+        # Retries and duplicate uploads of the same audio reuse the result;
+        # the backend name keeps results from different engines apart
+        return f"{hash_bytes(audio_bytes)}-{self.backend.name}"
+    
+    def screen_out(self, segment, label):
+        """The settled transcription of an un-normalized clip the pre-screen
+        finds silent, or None if it may hold speech and must be recognized"""
+        screen = self.prescreen(segment)
+        if screen is None or screen['speech']:
+            return None
+        logger.info("No speech in %s, skipping recognition", label, extra={'prescreen': screen})
+        transcription = self.get_fallback_transcription("No speech detected")
+        transcription['prescreen'] = screen
+        return transcription
+    
+    def _transcribe(self, audio_bytes, label):
         try:
-            print(f"\n=== TRANSCRIBING: {os.path.basename(audio_file_path)} ===")
-            print(f"Original file size: {os.path.getsize(audio_file_path)} bytes")
-            optimized_file = self.optimize_audio(audio_file_path)
+            logger.info("Transcribing %s", label, extra={'bytes': len(audio_bytes)})
+            started = time.perf_counter()
+            deadlines.check('decoding audio')
+            segment = self.decode_audio(audio_bytes, normalize=False)
             
-            print("Loading optimized audio file...")
-            print("Recognizing speech with Google Speech Recognition...")
+            # Silent answers are settled here, before normalizing and
+            # before any recognizer (network) call
+            screened = self.screen_out(segment, label)
+            if screened is not None:
+                return screened
             
-            # Load the audio file
-            with sr.AudioFile(optimized_file) as source:
-                # Read the audio data
-                audio_data = self.recognizer.record(source)
-                
-                # Recognize speech using Google's free speech recognition
-                text = self.recognizer.recognize_google(audio_data, language='en-US')
-                
-                if text:
-                    print(f"✓ Transcribed text: \"{text}\"")
-                    print(f"✓ Language: English")
-                    print(f"✓ Processing time: Google Speech Recognition")
-                    
-                    return {
-                        'text': text,
-                        'language': 'en',
-                        'confidence': 'high',
-                        'segments': [{'start': 0, 'end': len(text), 'text': text}]
-                    }
-                else:
-                    print("✗ No speech detected in audio")
-                    return self.get_fallback_transcription("No speech detected")
-                    
-        except sr.UnknownValueError:
-            print("✗ Speech not recognized - audio may be unclear or silent")
-            return self.get_fallback_transcription("Speech not recognized - please speak clearly")
-        except sr.RequestError as e:
-            print(f"✗ Google Speech Recognition service error: {e}")
-            return self.get_fallback_transcription("Speech recognition service unavailable")
+            segment = self.normalize(segment)
+            ranges = self.split_speech(segment)
+            if not ranges:
+                logger.info("No speech detected in %s", label)
+                return self.get_fallback_transcription("No speech detected")
+            
+            results = self.recognize_ranges(segment, ranges)
+            return self.build_transcription(ranges, results, time.perf_counter() - started)
+            
+        except (deadlines.DeadlineExceeded, Overloaded, TranscriptionError) as e:
+            logger.warning("Could not transcribe %s: %s", label, e)
+            raise
         except Exception as e:
-            print(f"✗ Error transcribing audio: {e}")
-            return self.get_fallback_transcription(f"Transcription error: {e}")
-        finally:
-            if optimized_file and optimized_file != audio_file_path:
-                try:
-                    os.unlink(optimized_file)
-                except:
-                    pass
+            logger.exception("Error transcribing %s: %s", label, e)
+            raise TranscriptionError(f"Transcription error: {e}") from e
+    
+    def prescreen(self, segment):
+        """Measure an un-normalized clip for speech; None when disabled"""
+        if not self.prescreen_enabled:
+            return None
+        with STAGE_SECONDS.time(stage='prescreen'):
+            screen = screen_speech(
+                segment,
+                min_duration_ms=PRESCREEN_MIN_DURATION_MS,
+                min_rms_db=PRESCREEN_MIN_RMS_DB,
+                speech_db=PRESCREEN_SPEECH_DB,
+                min_speech_ratio=PRESCREEN_MIN_SPEECH_RATIO
+            )
+        PRESCREEN.inc(outcome=screen['reason'] or 'speech')
+        return screen
+    
+    def split_speech(self, segment):
+        """Return the (start_ms, end_ms) ranges to recognize separately"""
+        if self.chunking and len(segment) > CHUNK_MIN_AUDIO_MS:
+            return find_speech_chunks(
+                segment,
+                min_silence_ms=CHUNK_MIN_SILENCE_MS,
+                max_chunk_ms=CHUNK_MAX_MS
+            )
+        return [(0, len(segment))]
+    
+    def recognize_ranges(self, segment, ranges):
+        """Recognize the ranges concurrently, returning (text, error) pairs in
+        order. Chunks not started before the caller's deadline are skipped."""
+        logger.debug("Recognizing %d chunk(s) with %s", len(ranges), self.backend.name)
+        recognize = deadlines.bind(self._recognize_chunk)
+        with self.admission.slot(), STAGE_SECONDS.time(stage='recognize'):
+            return list(self.chunk_executor.map(
+                lambda r: recognize(segment[r[0]:r[1]]),
+                ranges
+            ))
+    
+    def retry_failed(self, segment, ranges, results):
+        """Recognize again the ranges of an un-normalized clip whose earlier
+        recognition failed (service error or deadline), returning the
+        updated results"""
+        failed = [index for index, (_, error) in enumerate(results)
+                  if isinstance(error, (sr.RequestError, deadlines.DeadlineExceeded))]
+        if not failed:
+            return results
+        logger.info("Recognizing %d failed chunk(s) again", len(failed))
+        retried = self.recognize_ranges(self.normalize(segment), [ranges[index] for index in failed])
+        results = list(results)
+        for index, result in zip(failed, retried):
+            results[index] = result
+        return results
+    
+    def build_transcription(self, ranges, results, elapsed):
+        """Stitch per-range recognition results into a transcription.
+        
+        A range the recognizer could not be reached for, or did not get to
+        before the deadline, fails the whole answer: a transcript missing
+        part of it must not be stored or cached as the answer. Ranges with
+        no recognizable speech only lower the confidence."""
+        errors = [error for _, error in results if error]
+        if any(isinstance(error, deadlines.DeadlineExceeded) for error in errors):
+            raise deadlines.DeadlineExceeded("Transcription ran out of time")
+        unavailable = [error for error in errors if isinstance(error, sr.RequestError)]
+        if unavailable:
+            logger.error("Speech recognition service error on %d of %d chunk(s): %s",
+                         len(unavailable), len(ranges), unavailable[0])
+            raise TranscriptionError("Speech recognition service unavailable")
+        
+        segments = [
+            {'start': start_ms / 1000, 'end': end_ms / 1000, 'text': text}
+            for (start_ms, end_ms), (text, _) in zip(ranges, results)
+            if text
+        ]
+        text = " ".join(item['text'] for item in segments)
+        
+        if text:
+            logger.info("Transcription finished", extra={
+                'text': redact(text),
+                'chunks': len(ranges),
+                'processingTime': round(elapsed, 3)
+            })
+            
+            return {
+                'text': text,
+                'language': 'en',
+                'confidence': 'high' if len(segments) == len(ranges) else 'medium',
+                'segments': segments,
+                'processingTime': round(elapsed, 3)
+            }
+        
+        if errors:
+            logger.info("Speech not recognized - audio may be unclear or silent")
+            return self.get_fallback_transcription("Speech not recognized - please speak clearly")
+        logger.info("No speech detected in audio")
+        return self.get_fallback_transcription("No speech detected")
+    
+    def _recognize_chunk(self, segment):
+        """Recognize one chunk, returning (text, error)"""
+        try:
+            deadlines.check('recognizing a chunk')
+            text = self.backend.recognize(self.to_audio_data(segment))
+            return (text or '', None)
+        except (sr.UnknownValueError, sr.RequestError, deadlines.DeadlineExceeded) as e:
+            return ('', e)
     
     def get_fallback_transcription(self, error_msg):
+        FALLBACKS.inc(kind='transcription')
         return {
             'text': '',
             'language': 'unknown',
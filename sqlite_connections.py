@@ -0,0 +1,27 @@
+import os
+import sqlite3
+import threading
+
+
+class ThreadConnections:
+    """Connections to one WAL-mode SQLite file, shared by the session store,
+    the audio index and the event log.
+
+    Calling the object returns the current thread's connection, in autocommit
+    mode. There is one connection per thread and per process, so forked
+    gunicorn workers never share a handle opened by the master."""
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def __call__(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or getattr(self.local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
@@ -0,0 +1,73 @@
+"""Startup-time report: how long importing each heavy dependency and building
+each service took in this process.
+
+Stages are recorded as they happen (services are built lazily, or all at
+once by Services.warm under ``gunicorn --preload``), exported as the
+``cas_startup_seconds`` gauge and returned by /health. For a per-package
+breakdown of every import, see scripts/startup_report.py."""
+import os
+import sys
+import time
+import importlib
+import importlib.util
+import threading
+import contextlib
+from metrics import STARTUP_SECONDS
+
+_lock = threading.Lock()
+_stages = []
+# Time taken by stages nested in the one running on this thread
+_local = threading.local()
+
+
+def record(stage, seconds):
+    with _lock:
+        _stages.append((stage, seconds))
+    STARTUP_SECONDS.set(round(seconds, 6), stage=stage)
+
+
+@contextlib.contextmanager
+def timed(stage):
+    """Record the time spent in the block, less the stages nested inside it
+    (building the transcription queue builds the speech service first), so
+    each import or build is counted once"""
+    outer = getattr(_local, 'nested', None)
+    _local.nested = 0.0
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        record(stage, elapsed - _local.nested)
+        _local.nested = None if outer is None else outer + elapsed
+
+
+def import_module(name):
+    """Import ``name``, recording the time if this is its first import.
+    Returns None when the package is not installed."""
+    if name in sys.modules:
+        return sys.modules[name]
+    try:
+        if importlib.util.find_spec(name) is None:
+            return None
+    except ImportError:
+        return None
+    with timed(f"import {name}"):
+        return importlib.import_module(name)
+
+
+def report():
+    with _lock:
+        stages = list(_stages)
+    return {
+        'pid': os.getpid(),
+        'stages': [{'stage': stage, 'seconds': round(seconds, 4)} for stage, seconds in stages],
+        'totalSeconds': round(sum(seconds for _, seconds in stages), 4)
+    }
+
+
+def summary():
+    """One line for the log, slowest stages first"""
+    with _lock:
+        stages = sorted(_stages, key=lambda stage: stage[1], reverse=True)
+    return ", ".join(f"{stage} {seconds * 1000:.0f}ms" for stage, seconds in stages)
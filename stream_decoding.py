@@ -0,0 +1,195 @@
+import shutil
+import struct
+import audioop
+import threading
+import subprocess
+from pydub import AudioSegment
+from config import MAX_ANSWER_SECONDS
+
+RATE = 16000
+# Bytes of 16 kHz mono 16-bit PCM per millisecond
+BYTES_PER_MS = RATE * 2 // 1000
+
+
+class StreamDecoder:
+    """Decodes a recording that arrives in chunks into 16 kHz mono 16-bit
+    PCM, keeping what has been decoded so that each chunk is decoded once.
+    Audio past MAX_ANSWER_SECONDS is dropped, as in SpeechService."""
+
+    def __init__(self):
+        self.pcm = bytearray()
+        self.lock = threading.Lock()
+        self.max_bytes = MAX_ANSWER_SECONDS * 1000 * BYTES_PER_MS
+
+    def feed(self, data):
+        raise NotImplementedError
+
+    def close_input(self):
+        """No more chunks will be fed"""
+
+    def wait(self, timeout=None):
+        """Wait until everything fed has been decoded"""
+
+    def abort(self):
+        """Stop decoding and release any resources"""
+
+    def read(self, start_ms=0):
+        """Un-normalized AudioSegment of the audio decoded so far from ``start_ms``"""
+        start = start_ms * BYTES_PER_MS
+        with self.lock:
+            data = bytes(self.pcm[start:])
+        return AudioSegment(data=data, sample_width=2, frame_rate=RATE, channels=1)
+
+    def _append(self, pcm):
+        with self.lock:
+            self.pcm.extend(pcm[:max(0, self.max_bytes - len(self.pcm))])
+
+
+class WavStreamDecoder(StreamDecoder):
+    """PCM WAV: the header is read from the first chunk, then every later
+    byte is sample data and is converted as it arrives. The resampler state
+    is carried across chunks, so chunk boundaries are seamless."""
+
+    def __init__(self):
+        super().__init__()
+        self.pending = bytearray()
+        self.format = None
+        self.resample_state = None
+
+    def feed(self, data):
+        self.pending.extend(data)
+        if self.format is None:
+            header = parse_wav_header(self.pending)
+            if header is None:
+                return
+            channels, width, rate, data_offset = header
+            self.format = channels, width, rate
+            del self.pending[:data_offset]
+        channels, width, rate = self.format
+        usable = len(self.pending) - len(self.pending) % (channels * width)
+        frames = bytes(self.pending[:usable])
+        del self.pending[:usable]
+        if not frames:
+            return
+        if width == 1:
+            # 8-bit WAV samples are unsigned
+            frames = audioop.bias(frames, 1, -128)
+        if channels == 2:
+            frames = audioop.tomono(frames, width, 0.5, 0.5)
+        frames = audioop.lin2lin(frames, width, 2)
+        if rate != RATE:
+            frames, self.resample_state = audioop.ratecv(frames, 2, 1, rate, RATE, self.resample_state)
+        self._append(frames)
+
+
+def parse_wav_header(data):
+    """(channels, sample width, rate, offset of the sample data) of a PCM
+    WAV stream, or None while the header is incomplete. The data chunk's
+    size is ignored: recorders streaming WAV do not know it yet."""
+    if len(data) < 12:
+        return None
+    if data[:4] != b'RIFF' or data[8:12] != b'WAVE':
+        raise ValueError("Not a WAV stream")
+    offset = 12
+    fmt = None
+    while offset + 8 <= len(data):
+        chunk_id = bytes(data[offset:offset + 4])
+        size = struct.unpack('<I', data[offset + 4:offset + 8])[0]
+        if chunk_id == b'data':
+            if fmt is None:
+                raise ValueError("WAV data chunk before its format")
+            return fmt + (offset + 8,)
+        if offset + 8 + size > len(data):
+            return None
+        if chunk_id == b'fmt ':
+            audio_format, channels, rate = struct.unpack('<HHI', data[offset + 8:offset + 16])
+            bits = struct.unpack('<H', data[offset + 22:offset + 24])[0]
+            if audio_format not in (1, 0xFFFE) or channels not in (1, 2) or bits not in (8, 16, 24, 32):
+                raise ValueError("Unsupported WAV format")
+            fmt = (channels, bits // 8, rate)
+        # Chunks are padded to an even size
+        offset += 8 + size + size % 2
+    return None
+
+
+class FfmpegStreamDecoder(StreamDecoder):
+    """Compressed recordings (the browser's WebM/Opus): one ffmpeg process
+    per stream reads the chunks on stdin as they arrive and writes PCM to
+    stdout, which a reader thread collects. Probing is kept small so that
+    output starts after the first chunk rather than after megabytes."""
+
+    def __init__(self, ffmpeg):
+        super().__init__()
+        self.process = subprocess.Popen(
+            [ffmpeg, '-nostdin', '-loglevel', 'error', '-probesize', '32k', '-analyzeduration', '0',
+             '-i', 'pipe:0', '-f', 's16le', '-ac', '1', '-ar', str(RATE), 'pipe:1'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        self.reader = threading.Thread(target=self._read, name='stream-decode', daemon=True)
+        self.reader.start()
+
+    def _read(self):
+        while True:
+            data = self.process.stdout.read1(64 * 1024)
+            if not data:
+                return
+            self._append(data)
+
+    def feed(self, data):
+        self.process.stdin.write(data)
+        self.process.stdin.flush()
+
+    def close_input(self):
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+
+    def wait(self, timeout=None):
+        self.reader.join(timeout)
+        if self.reader.is_alive():
+            self.abort()
+            raise TimeoutError("ffmpeg did not finish decoding the stream")
+        self.process.wait()
+
+    def abort(self):
+        self.process.kill()
+        self.close_input()
+
+
+class BufferDecoder(StreamDecoder):
+    """Fallback for other formats when ffmpeg is not installed: decodes the
+    whole recording again on every read, as SpeechService would"""
+
+    def __init__(self, speech_service):
+        super().__init__()
+        self.speech_service = speech_service
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        self.buffer.extend(data)
+
+    def read(self, start_ms=0):
+        return self.speech_service.decode_audio(bytes(self.buffer), normalize=False)[start_ms:]
+
+
+def container_extension(first_chunk):
+    """File extension of a recording, from its first bytes: MediaRecorder
+    sends WebM from most browsers and MP4 from Safari"""
+    if first_chunk[:4] == b'RIFF' and first_chunk[8:12] == b'WAVE':
+        return 'wav'
+    if first_chunk[:4] == b'OggS':
+        return 'ogg'
+    if first_chunk[4:8] == b'ftyp':
+        return 'm4a'
+    return 'webm'
+
+
+def create_stream_decoder(first_chunk, speech_service):
+    """A decoder for the stream that starts with ``first_chunk``"""
+    if container_extension(first_chunk) == 'wav':
+        return WavStreamDecoder()
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is not None:
+        return FfmpegStreamDecoder(ffmpeg)
+    return BufferDecoder(speech_service)
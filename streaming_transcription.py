@@ -0,0 +1,265 @@
+import time
+import uuid
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+    CHUNK_MIN_SILENCE_MS, STREAM_CHUNK_MAX_MS, STREAM_WORKERS, STREAM_IDLE_TTL, STREAM_MAX_BYTES, JOB_TIMEOUT
+)
+from audio_segmentation import find_speech_chunks
+from transcription_errors import TranscriptionError, StreamError, StreamNotFound, ChunkOutOfOrder, StreamTooLarge
+from structured_logging import get_logger, redact
+import deadlines
+
+logger = get_logger(__name__)
+
+
+class AudioStream:
+    def __init__(self, session_id, question_index):
+        self.id = str(uuid.uuid4())
+        self.session_id = session_id
+        self.question_index = question_index
+        self.buffer = bytearray()
+        # Bytes of the buffer handed to the decoder so far
+        self.fed = 0
+        self.decoder = None
+        self.next_seq = 0
+        self.ranges = []
+        self.results = []
+        self.stable_until_ms = 0
+        self.updating = False
+        self.dirty = False
+        self.finished = False
+        # The recording as it was when finished
+        self.audio_bytes = None
+        self.last_activity = time.time()
+        self.lock = threading.Lock()
+        # Notified when a partial update ends
+        self.updated = threading.Condition(self.lock)
+
+    @property
+    def extension(self):
+        """File extension of the recording, from the same first bytes that
+        choose its decoder"""
+        from stream_decoding import container_extension
+        return container_extension(bytes(self.buffer[:12]))
+
+    def partial_text(self):
+        return " ".join(text for text, _ in self.results if text)
+
+
+class StreamingTranscriber:
+    """Transcribes an answer incrementally while it is still being recorded.
+
+    The client posts the recorder's audio chunks in order. Each chunk is
+    decoded once, as it arrives (see stream_decoding), and the audio after
+    the last recognized chunk is split on silence in the background,
+    packing speech into short chunks of at most STREAM_CHUNK_MAX_MS. Every
+    chunk that is followed by another one can no longer change, so it is
+    recognized straight away and added to the partial transcript. When the
+    answer is finished only the trailing chunk is left to recognize, after
+    the same pre-screen and transcription cache as an uploaded answer.
+
+    Streams live in the worker that opened them, so chunk uploads need
+    sticky routing when running more than one gunicorn worker."""
+
+    def __init__(self, speech_service, max_workers=STREAM_WORKERS):
+        self.speech_service = speech_service
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='stream')
+        self.streams = {}
+        self.lock = threading.Lock()
+
+    def open(self, session_id, question_index):
+        self._drop_idle_streams()
+        stream = AudioStream(session_id, question_index)
+        with self.lock:
+            self.streams[stream.id] = stream
+        logger.info("Opened audio stream", extra={'streamId': stream.id, 'questionIndex': question_index})
+        return stream
+
+    def get(self, stream_id, finished=False):
+        """The open stream, or with ``finished`` also one that is finished
+        but not yet forgotten"""
+        stream = self.streams.get(stream_id)
+        if stream is None or (stream.finished and not finished):
+            raise StreamNotFound("Stream not found")
+        return stream
+
+    def append(self, stream_id, seq, data):
+        """Append chunk ``seq`` and schedule a partial transcription.
+        Re-sent chunks are ignored; a gap in the sequence is an error."""
+        stream = self.get(stream_id)
+        with stream.lock:
+            if stream.finished:
+                raise StreamNotFound("Stream not found")
+            if seq < stream.next_seq:
+                return stream
+            if seq > stream.next_seq:
+                raise ChunkOutOfOrder(f"Expected chunk {stream.next_seq}, got {seq}")
+            if len(stream.buffer) + len(data) > STREAM_MAX_BYTES:
+                raise StreamTooLarge("Stream exceeds the maximum answer size")
+            stream.buffer.extend(data)
+            stream.next_seq += 1
+            stream.last_activity = time.time()
+            stream.dirty = True
+            if not stream.updating:
+                stream.updating = True
+                self.executor.submit(contextvars.copy_context().run, self._update, stream)
+        return stream
+
+    def status(self, stream):
+        with stream.lock:
+            return {
+                'streamId': stream.id,
+                'sessionId': stream.session_id,
+                'questionIndex': stream.question_index,
+                'receivedChunks': stream.next_seq,
+                'receivedBytes': len(stream.buffer),
+                'partialTranscription': stream.partial_text(),
+                'stableUntil': stream.stable_until_ms / 1000
+            }
+
+    def finish(self, stream_id):
+        """Close the stream and return its audio bytes and a callable that
+        completes the transcription (meant to run on the transcription queue).
+        
+        The finished stream is kept until ``forget``: if its job is turned
+        away, finishing it again returns the same recording."""
+        stream = self.get(stream_id, finished=True)
+        with stream.lock:
+            if not stream.finished:
+                stream.finished = True
+                stream.audio_bytes = bytes(stream.buffer)
+                # The update feeds the decoder the rest of the audio and ends its input
+                if not stream.updating:
+                    stream.updating = True
+                    self.executor.submit(contextvars.copy_context().run, self._update, stream)
+            stream.last_activity = time.time()
+            audio_bytes = stream.audio_bytes
+        return audio_bytes, lambda: self._finalize(stream, audio_bytes)
+
+    def forget(self, stream_id):
+        """Drop a finished stream once its transcription is queued"""
+        with self.lock:
+            self.streams.pop(stream_id, None)
+
+    def _update(self, stream):
+        while True:
+            with stream.lock:
+                finished = stream.finished
+                if not stream.dirty and not finished:
+                    stream.updating = False
+                    stream.updated.notify_all()
+                    return
+                stream.dirty = False
+                data = bytes(stream.buffer[stream.fed:])
+                stream.fed = len(stream.buffer)
+            try:
+                # Not bound by the deadline of the chunk upload that started it
+                with deadlines.deadline(JOB_TIMEOUT):
+                    self._feed(stream, data)
+                    if finished:
+                        if stream.decoder is not None:
+                            stream.decoder.close_input()
+                    else:
+                        self._recognize_stable(stream)
+            except Exception as e:
+                # Partial recordings may end mid-frame and fail to decode;
+                # the next chunk (or finish) will try again
+                logger.debug("Partial transcription of stream %s skipped: %s", stream.id, e)
+            if finished:
+                with stream.lock:
+                    stream.updating = False
+                    stream.updated.notify_all()
+                return
+
+    def _feed(self, stream, data):
+        if not data:
+            return
+        if stream.decoder is None:
+            # Imported here: it loads pydub, which creating the app must not
+            from stream_decoding import create_stream_decoder
+            stream.decoder = create_stream_decoder(data, self.speech_service)
+        stream.decoder.feed(data)
+
+    def _recognize_stable(self, stream):
+        start_ms, segment, ranges = self._pending_ranges(stream)
+        if not ranges and len(segment) > STREAM_CHUNK_MAX_MS:
+            # Silence since the last chunk: stop decoding it again and again
+            with stream.lock:
+                stream.stable_until_ms = start_ms + len(segment) - CHUNK_MIN_SILENCE_MS
+            return
+        # The last range may still grow as the candidate keeps talking
+        stable = ranges[:-1]
+        if not stable:
+            return
+        results = self.speech_service.recognize_ranges(segment, stable)
+        with stream.lock:
+            stream.ranges.extend((start_ms + start, start_ms + end) for start, end in stable)
+            stream.results.extend(results)
+            stream.stable_until_ms = start_ms + stable[-1][1]
+        logger.debug("Partial transcript updated", extra={'streamId': stream.id, 'text': redact(stream.partial_text())})
+
+    def _pending_ranges(self, stream):
+        """(start_ms, normalized audio from start_ms, speech ranges in it) for
+        the audio after the last recognized chunk"""
+        start_ms = stream.stable_until_ms
+        segment = self.speech_service.normalize(stream.decoder.read(start_ms))
+        ranges = find_speech_chunks(
+            segment,
+            min_silence_ms=CHUNK_MIN_SILENCE_MS,
+            max_chunk_ms=STREAM_CHUNK_MAX_MS
+        )
+        return start_ms, segment, ranges
+
+    def _finalize(self, stream, audio_bytes):
+        started = time.perf_counter()
+        label = f"stream {stream.id}"
+        cache_key = self.speech_service.cache_key(audio_bytes)
+        cached = self.speech_service.cache.get(cache_key)
+        if cached is not None:
+            logger.info("Transcription cache hit for %s", label)
+            return cached
+        # Failures propagate, as from SpeechService.transcribe_audio, so the
+        # job fails rather than recording them as the answer
+        # Let the last update feed the decoder, so its results are not lost
+        with stream.updated:
+            if not stream.updated.wait_for(lambda: not stream.updating, deadlines.remaining()):
+                raise deadlines.DeadlineExceeded("Deadline exceeded waiting for the stream's last update")
+        if stream.decoder is None:
+            return self.speech_service.get_fallback_transcription("No speech detected")
+        try:
+            stream.decoder.wait(deadlines.remaining())
+            full = stream.decoder.read()
+        except Exception as e:
+            raise TranscriptionError(f"Could not decode stream {stream.id}: {e}") from e
+        screened = self.speech_service.screen_out(full, label)
+        if screened is not None:
+            return screened
+        # Chunks whose recognition failed while recording get another try;
+        # a chunk that fails again fails the answer
+        stable_results = self.speech_service.retry_failed(full, stream.ranges, stream.results)
+        start_ms, segment, remaining = self._pending_ranges(stream)
+        results = self.speech_service.recognize_ranges(segment, remaining) if remaining else []
+
+        ranges = stream.ranges + [(start_ms + start, start_ms + end) for start, end in remaining]
+        if not ranges:
+            return self.speech_service.get_fallback_transcription("No speech detected")
+        transcription = self.speech_service.build_transcription(
+            ranges, stable_results + results, time.perf_counter() - started
+        )
+        transcription['streamed'] = True
+        if 'error' not in transcription:
+            self.speech_service.cache.set(cache_key, transcription)
+        return transcription
+
+    def _drop_idle_streams(self):
+        cutoff = time.time() - STREAM_IDLE_TTL
+        with self.lock:
+            idle = [stream for stream in self.streams.values() if stream.last_activity < cutoff]
+            for stream in idle:
+                stream.finished = True
+                del self.streams[stream.id]
+        for stream in idle:
+            if stream.decoder is not None:
+                stream.decoder.abort()
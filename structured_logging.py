@@ -0,0 +1,118 @@
+import os
+import json
+import queue
+import random
+import atexit
+import logging
+import logging.handlers
+import contextvars
+from datetime import datetime, timezone
+from config import LOG_LEVEL, LOG_FORMAT, LOG_TRANSCRIPT_SAMPLE_RATE
+
+# Correlation id of the request being handled; copied into background jobs
+request_id_var = contextvars.ContextVar('request_id', default=None)
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'request_id'}
+
+_listener = None
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamps records with the current request id. Attached to the queue
+    handler so it runs on the thread that logged, not the listener thread."""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        payload = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if getattr(record, 'request_id', None):
+            payload['requestId'] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                payload[key] = value
+        if record.exc_info:
+            payload['exception'] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s [%(name)s] %(message)s')
+
+    def format(self, record):
+        text = super().format(record)
+        if getattr(record, 'request_id', None):
+            text = f"{text} (request {record.request_id})"
+        return text
+
+
+class _PreservingQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # Keep the record's args and exc_info for the formatter on the
+        # listener thread instead of pre-formatting on the request thread
+        return record
+
+
+def configure_logging(level=LOG_LEVEL, log_format=LOG_FORMAT):
+    """Route the 'cas' loggers through a queue so formatting and stream
+    writes happen on a background listener thread. Safe to call twice."""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(JsonFormatter() if log_format == 'json' else TextFormatter())
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _PreservingQueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger('cas')
+    root.setLevel(level)
+    root.handlers = [queue_handler]
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_stop_listener)
+    # The listener thread does not survive fork (gunicorn --preload), so a
+    # child gets its own queue and listener
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=lambda: _restart_listener(queue_handler))
+
+
+def _restart_listener(queue_handler):
+    global _listener
+    log_queue = queue.SimpleQueue()
+    queue_handler.queue = log_queue
+    _listener = logging.handlers.QueueListener(log_queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def _stop_listener():
+    _listener.stop()
+
+
+def get_logger(name):
+    configure_logging()
+    return logging.getLogger(f'cas.{name}')
+
+
+def redact(text):
+    """Return transcript or prompt text for logging. Only a sampled fraction
+    (LOG_TRANSCRIPT_SAMPLE_RATE) is logged in full; the rest is summarized."""
+    if not text:
+        return text
+    if LOG_TRANSCRIPT_SAMPLE_RATE > 0 and random.random() < LOG_TRANSCRIPT_SAMPLE_RATE:
+        return text
+    return f"<redacted: {len(text)} chars, {len(text.split())} words>"
@@ -0,0 +1,8 @@
+import os
+import tempfile
+
+# Run in a scratch directory so the app's relative data paths (uploads/,
+# data/) stay out of the checkout, with the offline backends
+os.chdir(tempfile.mkdtemp(prefix='cas-tests-'))
+os.environ.setdefault('AI_BACKEND', 'fake')
+os.environ.setdefault('SPEECH_BACKENDS', 'fake')
@@ -0,0 +1,103 @@
+import pytest
+import deadlines
+from admission import AdmissionController, Overloaded
+
+
+def admit_all(controller, clients, started):
+    return [controller.admit(lambda ticket, name=name: started.append(name), client=name[0])
+            for name in clients]
+
+
+def test_waiting_work_is_served_round_robin_across_clients():
+    controller = AdmissionController('test', 1, 10)
+    started = []
+    tickets = admit_all(controller, ['a1', 'a2', 'a3', 'b1'], started)
+
+    tickets[0].release()
+    tickets[1].release()
+    assert started == ['a1', 'a2', 'b1']
+    # Releasing work still in line gives up its place
+    tickets[2].release()
+    tickets[3].release()
+
+    assert started == ['a1', 'a2', 'b1']
+    assert controller.stats()['inFlight'] == controller.stats()['queued'] == 0
+
+
+def test_client_over_its_share_is_turned_away():
+    controller = AdmissionController('test', 1, 10, per_client=2)
+    admit_all(controller, ['a1', 'a2'], [])
+
+    with pytest.raises(Overloaded, match='client_limit'):
+        controller.admit(lambda ticket: None, client='a')
+    controller.admit(lambda ticket: None, client='b')
+    assert controller.stats()['rejected'] == 1
+
+
+def test_full_queue_says_when_to_retry():
+    controller = AdmissionController('test', 1, 1, typical_seconds=4)
+    admit_all(controller, ['a1', 'b1'], [])
+
+    with pytest.raises(Overloaded, match='queue_full') as raised:
+        controller.check(client='c')
+    # The queued item and the next one each wait for the slot
+    assert raised.value.retry_after == 8
+
+
+def test_slot_not_granted_before_the_deadline_leaves_the_line():
+    controller = AdmissionController('test', 1, 10)
+    with controller.slot(client='a'):
+        with deadlines.deadline(0.05):
+            with pytest.raises(deadlines.DeadlineExceeded):
+                with controller.slot(client='b'):
+                    pass
+        assert controller.stats()['queued'] == 0
+
+    assert controller.stats()['inFlight'] == 0
+
+
+@pytest.fixture
+def turned_away(monkeypatch):
+    """An app whose transcription queue turns every stream away, recording
+    which client each attempt was for"""
+    import app
+    import admission
+
+    def make(proxy_hops=0):
+        monkeypatch.setattr(app, 'TRUSTED_PROXY_HOPS', proxy_hops)
+        flask_app = app.create_app()
+        clients = []
+
+        def check(client=None):
+            clients.append(admission.client_var.get())
+            raise Overloaded('transcription is at capacity (queue_full)', 9)
+        monkeypatch.setattr(flask_app.extensions['cas'].transcription_queue.admission, 'check', check)
+        return flask_app.test_client(), clients
+    return make
+
+
+def open_stream(client, headers=None):
+    session_id = client.post('/api/start-interview').json['sessionId']
+    return client.post('/api/audio-stream', json={'sessionId': session_id, 'questionIndex': 0}, headers=headers)
+
+
+def test_overloaded_request_gets_503_with_retry_after(turned_away):
+    client, _ = turned_away()
+
+    response = open_stream(client)
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '9'
+    assert response.json['retryAfter'] == 9
+
+
+def test_client_is_the_peer_unless_proxies_are_trusted(turned_away):
+    forged = {'X-Forwarded-For': '203.0.113.7, 198.51.100.2'}
+    client, clients = turned_away()
+    open_stream(client, forged)
+    proxied, proxied_clients = turned_away(proxy_hops=1)
+    open_stream(proxied, forged)
+
+    assert clients == ['127.0.0.1']
+    # One trusted proxy: only the hop it appended counts
+    assert proxied_clients == ['198.51.100.2']
@@ -0,0 +1,103 @@
+import json
+import pytest
+from ai_output import parse_json_object, Schema, SchemaError, score, text, text_list
+from ai_service import AIService, FakeResponse
+from gemini_client import GeminiClient
+from result_cache import MemoryCache
+
+
+def test_object_is_found_inside_fences_and_prose():
+    data, repaired = parse_json_object('Here you go:\n```json\n{"a": 1, "b": {"c": [2]}}\n```\nAnything else?')
+
+    assert data == {'a': 1, 'b': {'c': [2]}} and not repaired
+
+
+@pytest.mark.parametrize('answer, expected', [
+    ('{"a": 1, "b": "cut off mid-str', {'a': 1, 'b': 'cut off mid-str'}),
+    ('{"a": [1, 2', {'a': [1, 2]}),
+    ('{"a": 1, "b":', {'a': 1}),
+    ('{"a": {"x": 1}, "b": {"y": tr', {'a': {'x': 1}}),
+])
+def test_truncated_object_is_closed(answer, expected):
+    data, repaired = parse_json_object(answer)
+
+    assert data == expected and repaired
+
+
+@pytest.mark.parametrize('answer', ['', 'no json here', '[1, 2, 3]', '{not json} trailing'])
+def test_answer_without_an_object_is_rejected(answer):
+    with pytest.raises(ValueError):
+        parse_json_object(answer)
+
+
+SCHEMA = Schema({
+    'score': (score, 'number'),
+    'summary': (text, '"string"'),
+    'tips': (text_list, '["string"]'),
+}, defaults={'tips': []})
+
+
+def test_schema_cleans_values_and_reports_missing_fields():
+    cleaned, missing = SCHEMA.validate({'score': '31.6', 'summary': 7, 'tips': ['  keep going ', '']})
+
+    assert cleaned == {'score': 25, 'tips': ['keep going']}
+    assert missing == ['summary']
+
+
+def test_optional_field_falls_back_to_its_default():
+    cleaned, missing = SCHEMA.validate({'score': 3, 'summary': ' fine ', 'tips': []})
+
+    assert cleaned == {'score': 3, 'summary': 'fine', 'tips': []} and missing == []
+
+
+def test_repair_prompt_asks_only_for_missing_fields():
+    prompt = SCHEMA.repair_prompt('Rate the answer.', ['summary'])
+
+    assert prompt.startswith('Rate the answer.')
+    assert '"summary": "string"' in prompt and '"score"' not in prompt
+
+
+class ScriptedModel:
+    """Answers each prompt with the next scripted reply"""
+
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.prompts = []
+
+    def generate_content(self, prompt):
+        self.prompts.append(prompt)
+        return FakeResponse(self.replies.pop(0))
+
+
+def make_service(*replies):
+    model = ScriptedModel(*replies)
+    return AIService(speech_service=None, cache=MemoryCache(), client=GeminiClient(model)), model
+
+
+SCORES = {'communication': 20, 'knowledge': 18, 'motivation': 22, 'adaptability': 15}
+
+
+def test_missing_fields_are_reprompted_and_merged():
+    service, model = make_service(
+        json.dumps({'scores': {'communication': 20, 'knowledge': 18}, 'feedback': 'Clear answer'}),
+        json.dumps({'scores': SCORES}),
+    )
+
+    result = service.generate_json('Score this answer', AIService.ANSWER_SCHEMA)
+
+    assert result == {'scores': SCORES, 'feedback': 'Clear answer'}
+    assert len(model.prompts) == 2 and '"feedback"' not in model.prompts[1].split('incomplete')[1]
+
+
+def test_fields_still_invalid_after_reprompt_raise_with_the_valid_part():
+    service, model = make_service(
+        '{"scores": {"communication": 20}, "feedback": "Clear answer", "extra": "cut off',
+        'Sorry, I cannot help with that.',
+    )
+
+    with pytest.raises(SchemaError) as raised:
+        service.generate_json('Score this answer', AIService.ANSWER_SCHEMA)
+
+    assert raised.value.missing == ['scores']
+    assert raised.value.partial == {'feedback': 'Clear answer'}
+    assert len(model.prompts) == 2
@@ -0,0 +1,135 @@
+import json
+import re
+import threading
+from ai_service import AIService, FakeResponse
+from analysis_batcher import AnalysisBatcher
+from gemini_client import GeminiClient
+from result_cache import MemoryCache
+from speech_service import SpeechService
+
+SCORES = {'communication': 20, 'knowledge': 15, 'motivation': 18, 'adaptability': 12}
+
+
+def synthesis(tag):
+    return {
+        'feedback': {category: f'{tag} feedback' for category in AIService.CATEGORIES},
+        'strengths': [tag],
+        'improvements': ['More detail'],
+        'recommendation': {'decision': 'Pass', 'confidence': 'High', 'reasoning': tag},
+    }
+
+
+class BatchModel:
+    """Answers a batch prompt with ``batch_reply(candidates)``, given the
+    candidate of each interview in prompt order, and a single-interview
+    prompt with a synthesis naming its candidate"""
+
+    def __init__(self, batch_reply):
+        self.batch_reply = batch_reply
+        self.prompts = []
+        self.lock = threading.Lock()
+
+    def generate_content(self, prompt):
+        with self.lock:
+            self.prompts.append(prompt)
+        candidates = re.findall(r'^Response: My name is (\w+)', prompt, re.M)
+        if '"interviews"' in prompt:
+            return FakeResponse(self.batch_reply(candidates))
+        return FakeResponse(json.dumps(synthesis(f'single {candidates[0]}')))
+
+    def batch_prompts(self):
+        return [prompt for prompt in self.prompts if '"interviews"' in prompt]
+
+
+def full_batch(candidates):
+    return json.dumps({'interviews': {
+        str(number): synthesis(f'batch {candidate}') for number, candidate in enumerate(candidates, 1)
+    }})
+
+
+def make_batcher(batch_reply, batch_size=3):
+    model = BatchModel(batch_reply)
+    ai_service = AIService(SpeechService(cache=MemoryCache()), cache=MemoryCache(),
+                           client=GeminiClient(model, max_retries=0))
+    return AnalysisBatcher(ai_service, batch_size=batch_size, max_wait=10), model
+
+
+def interview(candidate, text=None):
+    return {'id': candidate, 'responses': [{
+        'question': 'Why this university?',
+        'transcription': {'text': text or f'My name is {candidate} and I chose the course for its research'},
+        'answerAnalysis': {'scores': SCORES, 'feedback': ''},
+    }]}
+
+
+def analyze_together(batcher, sessions):
+    """Submit the sessions from separate threads, as finishing interviews
+    do, and wait for every analysis"""
+    analyses = {}
+    delivered = threading.Semaphore(0)
+
+    def deliver(session_id, analysis):
+        analyses[session_id] = analysis
+        delivered.release()
+
+    threads = [threading.Thread(target=batcher.submit,
+                                args=(session, lambda analysis, session_id=session['id']: deliver(session_id, analysis)))
+               for session in sessions]
+    for thread in threads:
+        thread.start()
+    for _ in sessions:
+        assert delivered.acquire(timeout=10)
+    return analyses
+
+
+def test_concurrent_interviews_share_one_request_and_get_their_own_analysis():
+    batcher, model = make_batcher(full_batch)
+
+    analyses = analyze_together(batcher, [interview(name) for name in ('Ada', 'Ben', 'Cai')])
+
+    assert len(model.prompts) == len(model.batch_prompts()) == 1
+    assert {name: analysis['strengths'] for name, analysis in analyses.items()} == {
+        'Ada': ['batch Ada'], 'Ben': ['batch Ben'], 'Cai': ['batch Cai'],
+    }
+    assert analyses['Ben']['overallScore'] == sum(SCORES.values())
+
+
+def test_interviews_missing_or_invalid_in_the_batch_answer_are_completed_alone():
+    def partial_batch(candidates):
+        entries = json.loads(full_batch(candidates))['interviews']
+        del entries['2']
+        del entries['3']['recommendation']
+        return json.dumps({'interviews': entries})
+    batcher, model = make_batcher(partial_batch)
+
+    analyses = analyze_together(batcher, [interview(name) for name in ('Ada', 'Ben', 'Cai')])
+
+    candidates = re.findall(r'^Response: My name is (\w+)', model.batch_prompts()[0], re.M)
+    first, missing, invalid = candidates
+    assert analyses[first]['strengths'] == [f'batch {first}']
+    assert analyses[missing]['strengths'] == [f'single {missing}']
+    # Only the invalid field is asked for again; the valid ones are kept
+    assert analyses[invalid]['strengths'] == [f'batch {invalid}']
+    assert analyses[invalid]['recommendation']['reasoning'] == f'single {invalid}'
+    assert len(model.prompts) == 3
+
+
+def test_unreadable_batch_answer_falls_back_to_one_request_per_interview():
+    batcher, model = make_batcher(lambda candidates: 'The service is overloaded, try again later.')
+
+    analyses = analyze_together(batcher, [interview(name) for name in ('Ada', 'Ben', 'Cai')])
+
+    assert {name: analysis['strengths'] for name, analysis in analyses.items()} == {
+        'Ada': ['single Ada'], 'Ben': ['single Ben'], 'Cai': ['single Cai'],
+    }
+    assert len(model.prompts) == 4
+
+
+def test_interview_without_meaningful_answers_is_scored_without_gemini():
+    batcher, model = make_batcher(full_batch, batch_size=2)
+
+    analyses = analyze_together(batcher, [interview('Ada'), interview('Ben', text='um')])
+
+    assert analyses['Ben'] == batcher.ai_service.get_fallback_response(interview('Ben', text='um'))
+    assert analyses['Ada']['strengths'] == ['single Ada']
+    assert model.batch_prompts() == [] and len(model.prompts) == 1
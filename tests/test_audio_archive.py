@@ -0,0 +1,134 @@
+import io
+import os
+import time
+import pytest
+import audio_archive
+from audio_archive import AudioArchive, DAY
+
+
+@pytest.fixture
+def archive(tmp_path):
+    archive = AudioArchive(root=str(tmp_path / 'uploads'), index_path=str(tmp_path / 'audio_index.db'),
+                           transcode='none')
+    yield archive
+    archive.transcoder.shutdown()
+
+
+@pytest.fixture
+def transcoding(archive, monkeypatch):
+    """The archive with a stand-in ffmpeg that writes a smaller copy"""
+    def run(command, **kwargs):
+        with open(command[command.index('-i') + 1], 'rb') as source, open(command[-1], 'wb') as target:
+            target.write(source.read()[:4])
+    monkeypatch.setattr(audio_archive.subprocess, 'run', run)
+    archive.ffmpeg = 'ffmpeg'
+    return archive
+
+
+def files(archive):
+    return sorted(os.path.relpath(os.path.join(directory, name), archive.root)
+                  for directory, _, names in os.walk(archive.root) for name in names)
+
+
+def wait_for_transcoding(archive):
+    archive.transcoder.submit(lambda: None).result()
+
+
+def test_same_recording_is_stored_once(archive):
+    first_hash, first_path = archive.store(b'answer audio', 'WAV')
+    second_hash, second_path = archive.store(io.BytesIO(b'answer audio'), '.wav')
+    other_hash, _ = archive.store(b'another answer', 'wav')
+
+    assert (first_hash, first_path) == (second_hash, second_path) != (other_hash, _)
+    assert first_path == archive.raw_path(first_hash, 'wav')
+    assert len(files(archive)) == 2
+    assert archive.usage()['recordings'] == 2 and archive.usage()['rawBytes'] == 26
+
+
+def test_recording_is_deleted_with_the_last_session_using_it(archive):
+    audio_hash, path = archive.store(b'answer audio', 'wav')
+    archive.add_reference(audio_hash, 'session-a', 0)
+    archive.add_reference(audio_hash, 'session-b', 3)
+
+    assert archive.release_session('session-a') == 0
+    assert os.path.exists(path)
+    assert archive.release_session('session-b') == 1
+    assert not os.path.exists(path) and archive.usage()['recordings'] == 0
+
+
+def test_raw_upload_is_dropped_once_transcribed_and_compressed(transcoding):
+    audio_hash, path = transcoding.store(b'answer audio', 'webm')
+    wait_for_transcoding(transcoding)
+
+    transcoding.mark_transcribed(path)
+
+    assert not os.path.exists(path)
+    assert transcoding.locate(path) == transcoding.compressed_path(audio_hash)
+    assert transcoding.usage()['rawBytes'] == 0 and transcoding.usage()['compressedBytes'] == 4
+
+
+def test_raw_upload_without_a_compressed_copy_is_kept(archive):
+    _, path = archive.store(b'answer audio', 'webm')
+
+    archive.mark_transcribed(path)
+
+    assert archive.locate(path) == path
+    assert archive.locate(os.path.join(archive.root, 'raw', 'ff', 'ff00.webm')) is None
+
+
+def test_retention_removes_unreferenced_and_expired_recordings(archive):
+    kept_hash, kept = archive.store(b'recent answer', 'wav')
+    archive.add_reference(kept_hash, 'session', 0)
+    expired_hash, expired = archive.store(b'old answer', 'wav')
+    archive.add_reference(expired_hash, 'session', 1)
+    _, unreferenced = archive.store(b'test upload', 'wav')
+    archive._connection().execute('UPDATE blobs SET created_at = ? WHERE hash = ?',
+                                  (time.time() - audio_archive.AUDIO_RETENTION_DAYS * DAY - 1, expired_hash))
+
+    deleted = archive.enforce_retention(now=time.time() + audio_archive.AUDIO_UNREFERENCED_TTL + 1)
+
+    assert deleted == 2
+    assert os.path.exists(kept) and not os.path.exists(expired) and not os.path.exists(unreferenced)
+
+
+def test_size_budget_removes_the_oldest_transcribed_audio_first(archive):
+    paths = []
+    for number in range(3):
+        audio_hash, path = archive.store(bytes([number]) * 100, 'wav')
+        archive.add_reference(audio_hash, 'session', number)
+        archive._connection().execute('UPDATE blobs SET created_at = ? WHERE hash = ?', (number, audio_hash))
+        paths.append(path)
+    archive.mark_transcribed(paths[1])
+    archive.mark_transcribed(paths[2])
+    archive.max_bytes = 150
+
+    archive.enforce_retention(now=10)
+
+    # The oldest recording is not transcribed yet, so it is never removed
+    assert [os.path.exists(path) for path in paths] == [True, False, False]
+
+
+def test_held_raw_upload_is_kept_until_released(transcoding):
+    audio_hash, path = transcoding.store(b'answer audio', 'webm')
+    wait_for_transcoding(transcoding)
+    transcoding.hold('job-1', path)
+
+    transcoding.mark_transcribed(path)
+    assert os.path.exists(path)
+
+    transcoding.release('job-1')
+    transcoding.mark_transcribed(path)
+    assert not os.path.exists(path)
+
+
+def test_hold_left_by_a_dead_worker_expires(transcoding):
+    audio_hash, path = transcoding.store(b'answer audio', 'webm')
+    transcoding.add_reference(audio_hash, 'session', 0)
+    wait_for_transcoding(transcoding)
+    transcoding.hold('job-1', path)
+    transcoding.mark_transcribed(path)
+
+    transcoding.enforce_retention(now=time.time() + audio_archive.HOLD_TTL + 1)
+
+    assert not os.path.exists(path)
+    assert transcoding.locate(path) == transcoding.compressed_path(audio_hash)
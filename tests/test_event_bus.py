@@ -0,0 +1,140 @@
+import io
+import math
+import re
+import struct
+import threading
+import time
+import wave
+import pytest
+from event_bus import MemoryEventBus, SQLiteEventBus, format_event
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def bus(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryEventBus()
+    return SQLiteEventBus(str(tmp_path / 'events.db'), poll_interval=0.05)
+
+
+def test_events_after_an_id_are_read_in_order(bus):
+    first = bus.publish('a', 'transcription-ready', {'questionIndex': 0})
+    bus.publish('b', 'transcription-ready', {'questionIndex': 0})
+    last = bus.publish('a', 'analysis-ready', {'questionIndex': 0})
+
+    assert bus.read('a', 0, timeout=0) == [
+        (first, 'transcription-ready', {'questionIndex': 0}),
+        (last, 'analysis-ready', {'questionIndex': 0}),
+    ]
+    assert bus.read('a', first, timeout=0) == [(last, 'analysis-ready', {'questionIndex': 0})]
+    assert bus.latest_id('a') == last and bus.latest_id('unknown') == 0
+
+
+def test_waiting_reader_is_woken_by_a_publish(bus):
+    threading.Timer(0.1, bus.publish, ('a', 'result', {'overallScore': 60})).start()
+    started = time.monotonic()
+
+    events = bus.read('a', 0, timeout=5)
+
+    assert [event_type for _, event_type, _ in events] == ['result']
+    assert time.monotonic() - started < 2
+
+
+def test_other_workers_events_are_found_by_polling(tmp_path):
+    path = str(tmp_path / 'events.db')
+    reader, writer = SQLiteEventBus(path, poll_interval=0.05), SQLiteEventBus(path, poll_interval=0.05)
+    threading.Timer(0.1, writer.publish, ('a', 'job-failed', {'questionIndex': 2})).start()
+
+    events = reader.read('a', 0, timeout=5)
+
+    assert [(event_type, data) for _, event_type, data in events] == [('job-failed', {'questionIndex': 2})]
+
+
+def test_old_events_are_pruned(bus):
+    bus.publish('a', 'result', {})
+
+    assert bus.prune(max_age=60) == 0
+    assert bus.prune(max_age=-1) == 1
+    assert bus.read('a', 0, timeout=0) == []
+
+
+def test_stream_ends_with_the_result(bus):
+    bus.publish('a', 'analysis-ready', {'questionIndex': 0})
+    result = bus.publish('a', 'result', {'overallScore': 60})
+    bus.publish('a', 'analysis-ready', {'questionIndex': 1})
+
+    chunks = list(bus.stream('a', 0, max_seconds=5, keepalive=1))
+
+    assert chunks[0].startswith('retry: ')
+    assert chunks[-1] == format_event('result', {'overallScore': 60}, result)
+    assert len(chunks) == 3 and bus.streams == 0
+
+
+def test_stream_sends_keepalives_until_it_times_out(bus):
+    chunks = list(bus.stream('a', 0, max_seconds=0.3, keepalive=0.1))
+
+    assert chunks[1:] and set(chunks[1:]) == {': keepalive\n\n'}
+    assert bus.streams == 0
+
+
+@pytest.fixture
+def flask_app():
+    import app
+    return app.create_app()
+
+
+def gauge(client):
+    metrics = client.get('/metrics').get_data(as_text=True)
+    return float(re.search(r'^cas_event_streams (\S+)$', metrics, re.M).group(1))
+
+
+def test_disconnected_stream_is_no_longer_counted(flask_app):
+    client = flask_app.test_client()
+    session_id = client.post('/api/start-interview').json['sessionId']
+
+    response = client.get(f'/api/interview-events/{session_id}', buffered=False)
+    chunks = iter(response.response)
+    assert b'event: status' in next(chunks)
+    # Reading on enters the event bus stream
+    assert next(chunks).startswith(b'retry: ')
+    assert gauge(client) == 1
+
+    # The client goes away while the stream waits for events
+    response.close()
+    assert gauge(client) == 0
+
+
+def answer_audio(seed):
+    samples = [int(8000 * math.sin(i / (4 + seed))) for i in range(16000)]
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(16000)
+        wav.writeframes(struct.pack(f'<{len(samples)}h', *samples))
+    return buffer.getvalue()
+
+
+def test_answer_jobs_publish_progress_and_the_result(flask_app):
+    client = flask_app.test_client()
+    session_id = client.post('/api/start-interview').json['sessionId']
+    questions = len(client.get('/api/questions').json['questions'])
+
+    response = client.get(f'/api/interview-events/{session_id}', buffered=False)
+    for index in range(questions):
+        uploaded = client.post('/api/upload-audio', data={
+            'sessionId': session_id, 'questionIndex': str(index),
+            'audio': (io.BytesIO(answer_audio(index)), 'answer.wav')
+        })
+        assert uploaded.status_code == 202
+    text = b''.join(response.response).decode()
+    response.close()
+
+    events = re.findall(r'^event: (\S+)$', text, re.M)
+    assert events[0] == 'status' and events[-1] == 'result'
+    assert events.count('transcription-ready') == questions
+    assert events.count('analysis-ready') == questions
+    assert 'job-failed' not in events
+    # A client reconnecting after the second event is sent the rest
+    second = re.findall(r'^id: (\d+)$', text, re.M)[1]
+    replayed = client.get(f'/api/interview-events/{session_id}', headers={'Last-Event-ID': second})
+    assert re.findall(r'^event: (\S+)$', replayed.get_data(as_text=True), re.M) == events[3:]
@@ -0,0 +1,96 @@
+import pytest
+from google.api_core import exceptions as google_exceptions
+from gemini_client import GeminiClient, CircuitBreaker, CircuitOpenError, GeminiUnavailableError
+
+
+class Response:
+    def __init__(self, text):
+        self._text = text
+
+    @property
+    def text(self):
+        if isinstance(self._text, Exception):
+            raise self._text
+        return self._text
+
+
+class Model:
+    """Returns or raises the given outcomes in turn"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def generate_content(self, prompt):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, BaseException) and not isinstance(outcome, ValueError):
+            raise outcome
+        return Response(outcome)
+
+
+def make_client(model, **breaker_args):
+    breaker = CircuitBreaker(**{'failure_threshold': 2, 'cooldown': 0, **breaker_args})
+    client = GeminiClient(model, timeout=5, max_retries=1, max_concurrency=2, breaker=breaker)
+    client._backoff = lambda attempt: 0
+    return client
+
+
+def test_transient_errors_are_retried():
+    model = Model(google_exceptions.ServiceUnavailable('down'), 'ok')
+    client = make_client(model)
+
+    assert client.generate('prompt') == 'ok'
+    assert model.calls == 2
+    assert client.breaker.state == 'closed'
+
+
+def test_repeated_failures_open_the_circuit():
+    model = Model(*[google_exceptions.ServiceUnavailable('down')] * 2)
+    client = make_client(model, cooldown=60)
+
+    with pytest.raises(GeminiUnavailableError):
+        client.generate('prompt')
+    assert client.breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        client.generate('prompt')
+    assert model.calls == 2
+
+
+def test_rate_limit_trips_without_retrying():
+    model = Model(google_exceptions.ResourceExhausted('quota'))
+    client = make_client(model, cooldown=60)
+
+    with pytest.raises(GeminiUnavailableError):
+        client.generate('prompt')
+    assert model.calls == 1
+    assert client.breaker.state == 'open'
+
+
+def test_successful_trial_closes_the_circuit():
+    model = Model(google_exceptions.ResourceExhausted('quota'), 'ok')
+    client = make_client(model)
+
+    with pytest.raises(GeminiUnavailableError):
+        client.generate('prompt')
+    assert client.breaker.state == 'half-open'
+    assert client.generate('prompt') == 'ok'
+    assert client.breaker.state == 'closed'
+
+
+@pytest.mark.parametrize('error', [
+    ValueError('response has no text: candidate was blocked'),
+    google_exceptions.InvalidArgument('bad request'),
+    google_exceptions.PermissionDenied('no access'),
+])
+def test_non_transient_error_during_trial_lets_the_next_trial_through(error):
+    model = Model(google_exceptions.ResourceExhausted('quota'), error, 'ok')
+    client = make_client(model)
+
+    with pytest.raises(GeminiUnavailableError):
+        client.generate('prompt')
+    with pytest.raises(type(error)):
+        client.generate('prompt')
+    assert not client.breaker.trial_in_flight
+    assert client.generate('prompt') == 'ok'
+    assert client.breaker.state == 'closed'
@@ -0,0 +1,47 @@
+import json
+import pytest
+from question_bank import QuestionBank
+from services import Services
+
+
+def write_bank(path, questions):
+    path.write_text(json.dumps({'sets': [{'id': 'oxford', 'name': 'University of Oxford', 'questions': questions}]}))
+    return str(path)
+
+
+def client_for(bank_path):
+    import app
+    services = Services()
+    # Built up front, as the question_bank service would be on first use
+    services.__dict__['question_bank'] = QuestionBank(bank_path)
+    return app.create_app(services).test_client()
+
+
+@pytest.mark.parametrize('url', ['/api/questions', '/api/questions?set=oxford', '/api/question-sets'])
+def test_matching_etag_gets_304_without_a_body(tmp_path, url):
+    client = client_for(write_bank(tmp_path / 'bank.json', ['Why Oxford?']))
+    first = client.get(url)
+
+    repeated = client.get(url, headers={'If-None-Match': first.headers['ETag']})
+
+    assert first.status_code == 200 and first.get_data()
+    assert repeated.status_code == 304 and repeated.get_data() == b''
+    assert repeated.headers['ETag'] == first.headers['ETag']
+    assert 'max-age' in repeated.headers['Cache-Control']
+
+
+def test_etag_changes_with_the_questions(tmp_path):
+    path = tmp_path / 'bank.json'
+    old = client_for(write_bank(path, ['Why Oxford?']))
+    before = old.get('/api/questions?set=oxford')
+    sets_before = old.get('/api/question-sets')
+
+    client = client_for(write_bank(path, ['Why Oxford?', 'How will you fund your studies?']))
+    after = client.get('/api/questions?set=oxford', headers={'If-None-Match': before.headers['ETag']})
+    sets_after = client.get('/api/question-sets', headers={'If-None-Match': sets_before.headers['ETag']})
+
+    assert after.status_code == 200 and after.headers['ETag'] != before.headers['ETag']
+    assert after.json['questions'] == ['Why Oxford?', 'How will you fund your studies?']
+    assert sets_after.status_code == 200 and sets_after.headers['ETag'] != sets_before.headers['ETag']
+    # A set that did not change keeps its ETag
+    assert client.get('/api/questions').headers['ETag'] == old.get('/api/questions').headers['ETag']
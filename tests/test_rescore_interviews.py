@@ -0,0 +1,96 @@
+import importlib.util
+import os
+import pytest
+from google.api_core import exceptions as google_exceptions
+from ai_service import AIService, FakeGenerativeModel
+from gemini_client import GeminiClient, CircuitBreaker
+from result_cache import MemoryCache
+from session_store import MemorySessionStore, SQLiteSessionStore
+from speech_service import SpeechService
+
+spec = importlib.util.spec_from_file_location(
+    'rescore_interviews', os.path.join(os.path.dirname(__file__), '..', 'scripts', 'rescore_interviews.py')
+)
+rescore_interviews = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(rescore_interviews)
+
+
+class UnavailableModel:
+    def generate_content(self, prompt):
+        raise google_exceptions.ServiceUnavailable('down')
+
+
+class SynthesisUnavailableModel(FakeGenerativeModel):
+    """Scores answers but fails the final synthesis"""
+
+    def generate_content(self, prompt):
+        if '"scores"' not in prompt:
+            raise google_exceptions.ServiceUnavailable('down')
+        return super().generate_content(prompt)
+
+
+STORED_ANALYSIS = {'overallScore': 42, 'recommendation': {'decision': 'Fail'}}
+
+
+def make_rescorer(model, store=None):
+    speech_service = SpeechService(cache=MemoryCache())
+    client = GeminiClient(model, max_retries=0, breaker=CircuitBreaker(failure_threshold=100))
+    ai_service = AIService(speech_service, cache=MemoryCache(), client=client)
+    store = store or MemorySessionStore()
+    store.create({
+        'id': 'session-1',
+        'status': 'completed',
+        'analysis': dict(STORED_ANALYSIS),
+        'responses': [{
+            'question': 'Why this university?',
+            'transcription': {'text': 'I chose it for the course and the research on offer', 'language': 'en'},
+            'answerAnalysis': None
+        }]
+    })
+    return rescore_interviews.Rescorer(store, speech_service, ai_service, update_sessions=True), store
+
+
+def test_rescore_stores_the_new_analysis():
+    rescorer, store = make_rescorer(FakeGenerativeModel(latency=0))
+
+    result = rescorer.rescore('session-1')
+
+    assert result['previousOverallScore'] == 42
+    assert store.get('session-1')['analysis'] == result['analysis']
+    assert result['analysis']['strengths'] == ['Fake strength']
+
+
+@pytest.mark.parametrize('model', [UnavailableModel(), SynthesisUnavailableModel(latency=0)])
+def test_gemini_failure_fails_the_session_without_writing_the_fallback(model, tmp_path):
+    rescorer, store = make_rescorer(model)
+    output = tmp_path / 'rescored.jsonl'
+    writer = rescore_interviews.JsonlWriter(str(output))
+
+    succeeded, failed = rescore_interviews.run(rescorer, ['session-1'], writer, workers=1)
+    writer.close()
+
+    assert (succeeded, failed) == (0, 1)
+    assert store.get('session-1')['analysis'] == STORED_ANALYSIS
+    # Not done, so a resumed run retries it
+    assert rescore_interviews.finished_session_ids(str(output)) == set()
+
+
+@pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+def test_rescoring_leaves_the_last_access_time_alone(backend, tmp_path):
+    if backend == 'sqlite':
+        store = SQLiteSessionStore(str(tmp_path / 'sessions.db'))
+        last_access = lambda: store._connection().execute('SELECT last_access FROM sessions').fetchone()[0]
+    else:
+        store = MemorySessionStore()
+        last_access = lambda: store.last_access['session-1']
+    rescorer, store = make_rescorer(FakeGenerativeModel(latency=0), store)
+    before = last_access() - 3600
+    if backend == 'sqlite':
+        store._connection().execute('UPDATE sessions SET last_access = ?', (before,))
+    else:
+        store.last_access['session-1'] = before
+
+    rescorer.rescore('session-1')
+
+    assert last_access() == before
+    assert store.get('session-1', touch=False)['analysis']['strengths'] == ['Fake strength']
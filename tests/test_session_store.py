@@ -0,0 +1,107 @@
+import threading
+from datetime import datetime
+import pytest
+from session_manager import SessionManager
+from session_store import SQLiteSessionStore
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'sessions.db')
+
+
+def session(session_id, status='active', **fields):
+    return {'id': session_id, 'status': status, 'responses': [], **fields}
+
+
+def set_last_access(store, **times):
+    for session_id, last_access in times.items():
+        store._connection().execute('UPDATE sessions SET last_access = ? WHERE id = ?', (last_access, session_id))
+
+
+def test_write_is_seen_by_another_workers_connection(db_path):
+    writer, reader = SQLiteSessionStore(db_path), SQLiteSessionStore(db_path)
+    started = datetime(2024, 5, 1, 9, 30)
+    writer.create(session('a', start_time=started))
+
+    assert reader._connection().execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert reader.get('a')['start_time'] == started
+    reader.update('a', lambda stored: stored.update(status='completed'))
+    assert writer.get('a')['status'] == 'completed'
+
+
+def test_concurrent_updates_are_not_lost(db_path):
+    SQLiteSessionStore(db_path).create(session('a'))
+    workers, answers = 8, 20
+
+    def answer(worker):
+        # A store per thread, as in separate gunicorn workers
+        store = SQLiteSessionStore(db_path)
+        for number in range(answers):
+            store.update('a', lambda stored: stored['responses'].append(f'{worker}-{number}'))
+
+    threads = [threading.Thread(target=answer, args=(worker,)) for worker in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    responses = SQLiteSessionStore(db_path).get('a')['responses']
+    assert len(responses) == len(set(responses)) == workers * answers
+
+
+def test_failed_update_leaves_the_session_unchanged(db_path):
+    store = SQLiteSessionStore(db_path)
+    store.create(session('a'))
+
+    def fail(stored):
+        stored['status'] = 'completed'
+        raise ValueError('invalid answer')
+
+    with pytest.raises(ValueError):
+        store.update('a', fail)
+    with pytest.raises(KeyError):
+        store.update('missing', fail)
+    assert store.get('a')['status'] == 'active'
+
+
+def test_ids_and_counts_are_filtered_by_status(db_path):
+    store = SQLiteSessionStore(db_path)
+    for session_id, status in [('a', 'active'), ('b', 'completed'), ('c', 'completed')]:
+        store.create(session(session_id, status))
+    store.update('a', lambda stored: stored.update(status='completed'))
+    store.update('b', lambda stored: stored.update(status='analyzing'))
+
+    assert sorted(store.list_ids('completed')) == ['a', 'c']
+    assert store.list_ids('analyzing') == ['b'] and store.list_ids('active') == []
+    assert sorted(store.list_ids()) == ['a', 'b', 'c']
+    assert (store.count(), store.count('completed')) == (3, 2)
+
+
+def test_reads_keep_a_session_from_being_evicted_first(db_path):
+    store = SQLiteSessionStore(db_path)
+    for session_id in 'abc':
+        store.create(session(session_id))
+    set_last_access(store, a=100, b=200, c=300)
+
+    store.get('a')
+    # Reads without touch, e.g. by offline tools, do not count as access
+    store.get('b', touch=False)
+
+    assert store.least_recently_used(2) == ['b', 'c']
+    manager = SessionManager(store=store, max_sessions=2)
+    assert manager.evict_over_capacity() == 1
+    assert sorted(store.list_ids()) == ['a', 'c']
+    assert manager.get_occupancy()['evictions']['capacity'] == 1
+
+
+def test_idle_and_expired_sessions_are_found_by_their_times(db_path):
+    store = SQLiteSessionStore(db_path)
+    for session_id in 'abc':
+        store.create(session(session_id))
+    set_last_access(store, a=100, b=1000, c=1000)
+    store._connection().execute("UPDATE sessions SET created_at = 50 WHERE id = 'c'")
+
+    expired = store.find_expired(idle_before=500, created_before=60)
+
+    assert sorted(expired) == [('a', 'idle'), ('c', 'expired')]
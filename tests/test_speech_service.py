@@ -0,0 +1,115 @@
+import io
+import math
+import struct
+import threading
+import wave
+import pytest
+import speech_recognition as sr
+from admission import AdmissionController, Overloaded
+from metrics import STAGE_SECONDS
+from result_cache import MemoryCache
+from speech_backends import FakeBackend, RecognitionBackend
+import speech_service
+from speech_service import SpeechService, TranscriptionError
+
+
+class UnavailableBackend(RecognitionBackend):
+    name = 'unavailable'
+
+    def recognize(self, audio_data):
+        raise sr.RequestError('connection refused')
+
+
+class FlakyBackend(FakeBackend):
+    """Unreachable for the calls numbered in ``failing`` (from 1)"""
+
+    def __init__(self, failing):
+        super().__init__(latency=0)
+        self.failing = set(failing)
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def recognize(self, audio_data):
+        with self.lock:
+            self.calls += 1
+            call = self.calls
+        if call in self.failing:
+            raise sr.RequestError('connection reset')
+        return super().recognize(audio_data)
+
+
+def wav_bytes(seconds, amplitude=8000, rate=16000, pause_every=0):
+    """A tone; with ``pause_every`` a second of silence follows every
+    ``pause_every`` seconds of it"""
+    samples = []
+    for second in range(seconds):
+        quiet = pause_every and second % (pause_every + 1) == pause_every
+        samples += [0 if quiet else int(amplitude * math.sin(i / 5)) for i in range(rate)]
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(struct.pack(f'<{len(samples)}h', *samples))
+    return buffer.getvalue()
+
+
+def test_recognition_outage_raises_and_is_not_cached():
+    service = SpeechService(cache=MemoryCache(), backend=UnavailableBackend())
+    audio = wav_bytes(2)
+
+    with pytest.raises(TranscriptionError):
+        service.transcribe_audio(audio)
+    assert service.cache.get(service.cache_key(audio)) is None
+
+
+def test_answer_with_one_unreachable_chunk_fails_and_is_not_cached(monkeypatch):
+    monkeypatch.setattr(speech_service, 'CHUNK_MAX_MS', 4000)
+    service = SpeechService(cache=MemoryCache(), backend=FlakyBackend(failing={2}))
+    # Four bursts of speech, recognized as separate chunks
+    audio = wav_bytes(16, pause_every=3)
+
+    with pytest.raises(TranscriptionError):
+        service.transcribe_audio(audio)
+    assert service.backend.calls == 4
+    assert service.cache.get(service.cache_key(audio)) is None
+
+
+def test_recognition_at_capacity_raises_overloaded():
+    service = SpeechService(cache=MemoryCache(), backend=FakeBackend(latency=0))
+    service.admission = AdmissionController('speech', 1, 0)
+
+    with service.admission.slot():
+        with pytest.raises(Overloaded):
+            service.transcribe_audio(wav_bytes(2))
+
+
+def test_unreadable_audio_raises():
+    service = SpeechService(cache=MemoryCache(), backend=FakeBackend(latency=0))
+
+    with pytest.raises(TranscriptionError):
+        service.transcribe_audio(b'not audio at all')
+
+
+def test_silent_answer_is_settled_with_a_fallback():
+    service = SpeechService(cache=MemoryCache(), backend=FakeBackend(latency=0))
+
+    transcription = service.transcribe_audio(wav_bytes(2, amplitude=0))
+
+    assert transcription['text'] == '' and 'error' in transcription
+
+
+def stage_counts():
+    return {key: series['count'] for key, series in STAGE_SECONDS.series.items()}
+
+
+def test_each_preprocessing_step_is_timed_once():
+    service = SpeechService(cache=MemoryCache(), backend=FakeBackend(latency=0))
+    before = stage_counts()
+
+    service.transcribe_audio(wav_bytes(2))
+
+    observed = {key[0]: count - before.get(key, 0) for key, count in stage_counts().items()
+                if count != before.get(key, 0)}
+    assert observed['decode'] == observed['normalize'] == 1
+    assert 'optimize' not in observed
@@ -0,0 +1,23 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHECK = """
+import sys
+import app
+client = app.create_app().test_client()
+assert client.get('/health').status_code == 200
+assert client.get('/api/questions').status_code == 200
+print('loaded:', *(name for name in ('pydub', 'speech_recognition', 'numpy') if name in sys.modules))
+"""
+
+
+def test_app_starts_without_loading_audio_dependencies():
+    # A fresh interpreter: the other tests have imported them all already
+    result = subprocess.run([sys.executable, '-c', CHECK], capture_output=True, text=True, timeout=60,
+                            env={**os.environ, 'PYTHONPATH': ROOT})
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.splitlines()[-1] == 'loaded:'
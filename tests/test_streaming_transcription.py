@@ -0,0 +1,259 @@
+import io
+import math
+import struct
+import threading
+import wave
+import pytest
+import speech_recognition as sr
+import streaming_transcription
+from result_cache import MemoryCache
+from speech_backends import FakeBackend
+from speech_service import SpeechService, TranscriptionError
+from stream_decoding import WavStreamDecoder, container_extension
+from streaming_transcription import StreamingTranscriber, StreamNotFound, ChunkOutOfOrder, StreamTooLarge
+
+
+@pytest.fixture
+def transcriber():
+    transcriber = StreamingTranscriber(SpeechService(cache=MemoryCache(), backend=FakeBackend(latency=0)))
+    yield transcriber
+    transcriber.executor.shutdown(wait=True)
+
+
+def test_chunks_are_appended_in_order_and_resent_ones_ignored(transcriber):
+    stream = transcriber.open('session', 0)
+
+    transcriber.append(stream.id, 0, b'ab')
+    transcriber.append(stream.id, 1, b'cd')
+    transcriber.append(stream.id, 1, b'cd')
+
+    assert transcriber.status(stream)['receivedChunks'] == 2
+    assert bytes(stream.buffer) == b'abcd'
+
+
+def test_gap_in_the_sequence_is_rejected(transcriber):
+    stream = transcriber.open('session', 0)
+    transcriber.append(stream.id, 0, b'ab')
+
+    with pytest.raises(ChunkOutOfOrder):
+        transcriber.append(stream.id, 2, b'ef')
+
+
+def test_stream_over_the_size_limit_is_rejected(transcriber, monkeypatch):
+    monkeypatch.setattr(streaming_transcription, 'STREAM_MAX_BYTES', 3)
+    stream = transcriber.open('session', 0)
+    transcriber.append(stream.id, 0, b'ab')
+
+    with pytest.raises(StreamTooLarge):
+        transcriber.append(stream.id, 1, b'cd')
+
+
+def test_finished_and_unknown_streams_are_not_found(transcriber):
+    stream = transcriber.open('session', 0)
+    transcriber.finish(stream.id)
+
+    with pytest.raises(StreamNotFound):
+        transcriber.append(stream.id, 0, b'ab')
+    with pytest.raises(StreamNotFound):
+        transcriber.get('unknown')
+
+
+def test_errors_map_to_http_statuses(monkeypatch):
+    import app
+    monkeypatch.setattr(streaming_transcription, 'STREAM_MAX_BYTES', 3)
+    flask_app = app.create_app()
+    client = flask_app.test_client()
+    session_id = client.post('/api/start-interview').json['sessionId']
+    stream_id = client.post('/api/audio-stream', json={'sessionId': session_id, 'questionIndex': 0}).json['streamId']
+
+    assert client.post(f'/api/audio-stream/{stream_id}/chunk?seq=0', data=b'ab').status_code == 200
+    assert client.post(f'/api/audio-stream/{stream_id}/chunk?seq=5', data=b'c').status_code == 409
+    assert client.post(f'/api/audio-stream/{stream_id}/chunk?seq=1', data=b'cd').status_code == 413
+    assert client.post('/api/audio-stream/unknown/chunk?seq=0', data=b'ab').status_code == 404
+
+
+def wav_bytes(samples, rate=16000, channels=1):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(struct.pack(f'<{len(samples)}h', *samples))
+    return buffer.getvalue()
+
+
+def speech_like(seconds, rate=16000, pause_every=3):
+    """A tone with a second of silence after every ``pause_every`` seconds"""
+    samples = []
+    for second in range(seconds):
+        quiet = second % (pause_every + 1) == pause_every
+        samples += [0 if quiet else int(8000 * math.sin(i / 5)) for i in range(rate)]
+    return samples
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def test_wav_stream_decodes_each_chunk_once_to_the_same_audio():
+    data = wav_bytes(speech_like(3))
+    decoder = WavStreamDecoder()
+    # Odd sizes split the header and individual samples
+    for chunk in chunked(data, 997):
+        decoder.feed(chunk)
+
+    assert decoder.read().raw_data == data[44:]
+    assert decoder.read(1000).raw_data == data[44 + 32000:]
+
+
+def test_wav_stream_is_resampled_to_16k_mono():
+    decoder = WavStreamDecoder()
+    for chunk in chunked(wav_bytes([1000, -1000] * 44100, rate=44100, channels=2), 4096):
+        decoder.feed(chunk)
+
+    segment = decoder.read()
+    assert (segment.frame_rate, segment.channels, segment.sample_width) == (16000, 1, 2)
+    assert abs(len(segment) - 1000) <= 1
+
+
+def test_streamed_answer_is_transcribed_without_decoding_the_whole_buffer(transcriber, monkeypatch):
+    def decode_audio(*args, **kwargs):
+        raise AssertionError("the whole recording was decoded again")
+    monkeypatch.setattr(transcriber.speech_service, 'decode_audio', decode_audio)
+    data = wav_bytes(speech_like(12))
+    stream = transcriber.open('session', 0)
+    for seq, chunk in enumerate(chunked(data, 32000)):
+        transcriber.append(stream.id, seq, chunk)
+
+    audio_bytes, transcribe = transcriber.finish(stream.id)
+    transcription = transcribe()
+
+    assert transcription['streamed'] and transcription['text']
+    assert len(transcription['segments']) >= 3
+    # A repeat of the same recording comes from the transcription cache
+    assert transcriber.speech_service.cache.get(transcriber.speech_service.cache_key(audio_bytes)) == transcription
+
+
+def test_silent_stream_is_settled_by_the_prescreen(transcriber):
+    stream = transcriber.open('session', 0)
+    for seq, chunk in enumerate(chunked(wav_bytes([0] * 16000 * 3), 32000)):
+        transcriber.append(stream.id, seq, chunk)
+
+    _, transcribe = transcriber.finish(stream.id)
+    transcription = transcribe()
+
+    assert transcription['prescreen']['reason'] == 'too quiet'
+    assert transcription['text'] == ''
+
+
+class FlakyBackend(FakeBackend):
+    """Unreachable for the first ``failures`` calls"""
+
+    def __init__(self, failures):
+        super().__init__(latency=0)
+        self.failures = failures
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def recognize(self, audio_data):
+        with self.lock:
+            self.calls += 1
+            call = self.calls
+        if call <= self.failures:
+            raise sr.RequestError('connection reset')
+        return super().recognize(audio_data)
+
+
+def stream_and_finish(transcriber, data):
+    stream = transcriber.open('session', 0)
+    for seq, chunk in enumerate(chunked(data, 32000)):
+        transcriber.append(stream.id, seq, chunk)
+        # Let the partial transcript catch up, as it does while recording
+        with stream.updated:
+            stream.updated.wait_for(lambda: not stream.updating, 5)
+    return transcriber.finish(stream.id)
+
+
+def test_chunk_that_failed_while_recording_is_recognized_again():
+    backend = FlakyBackend(failures=1)
+    transcriber = StreamingTranscriber(SpeechService(cache=MemoryCache(), backend=backend))
+
+    _, transcribe = stream_and_finish(transcriber, wav_bytes(speech_like(12)))
+    transcription = transcribe()
+    transcriber.executor.shutdown(wait=True)
+
+    assert transcription['confidence'] == 'high'
+    assert backend.calls == len(transcription['segments']) + 1
+
+
+def test_chunk_that_keeps_failing_fails_the_streamed_answer():
+    backend = FlakyBackend(failures=100)
+    transcriber = StreamingTranscriber(SpeechService(cache=MemoryCache(), backend=backend))
+
+    audio_bytes, transcribe = stream_and_finish(transcriber, wav_bytes(speech_like(12)))
+    with pytest.raises(TranscriptionError):
+        transcribe()
+    transcriber.executor.shutdown(wait=True)
+
+    assert transcriber.speech_service.cache.get(transcriber.speech_service.cache_key(audio_bytes)) is None
+
+
+def test_finish_turned_away_by_a_full_queue_can_be_retried(monkeypatch):
+    import app
+    from transcription_queue import QueueFullError
+    flask_app = app.create_app()
+    queue = flask_app.extensions['cas'].transcription_queue
+    submit = queue.submit
+    submitted = []
+
+    def full_once(*args, **kwargs):
+        if not submitted:
+            submitted.append(None)
+            raise QueueFullError("Transcription queue is full", 3)
+        submitted.append(args[3])
+        return submit(*args, **kwargs)
+    monkeypatch.setattr(queue, 'submit', full_once)
+    client = flask_app.test_client()
+    session_id = client.post('/api/start-interview').json['sessionId']
+    stream_id = client.post('/api/audio-stream', json={'sessionId': session_id, 'questionIndex': 0}).json['streamId']
+    data = wav_bytes(speech_like(2))
+    client.post(f'/api/audio-stream/{stream_id}/chunk?seq=0', data=data)
+
+    rejected = client.post(f'/api/audio-stream/{stream_id}/finish')
+    retried = client.post(f'/api/audio-stream/{stream_id}/finish')
+
+    assert rejected.status_code == 503 and rejected.headers['Retry-After'] == '3'
+    assert retried.status_code == 202 and submitted[1] == data
+    assert client.post(f'/api/audio-stream/{stream_id}/finish').status_code == 404
+    queue.shutdown()
+
+
+@pytest.mark.parametrize('first_bytes, extension', [
+    (b'RIFF\x24\x00\x00\x00WAVEfmt ', 'wav'),
+    (b'\x1aE\xdf\xa3\x9fB\x86\x81\x01B\xf7\x81', 'webm'),
+    (b'OggS\x00\x02\x00\x00\x00\x00\x00\x00', 'ogg'),
+    (b'\x00\x00\x00\x1cftypisom\x00\x00', 'm4a'),
+])
+def test_recording_format_is_told_by_its_first_bytes(first_bytes, extension):
+    assert container_extension(first_bytes) == extension
+
+
+def test_finished_stream_is_archived_as_the_format_it_was_decoded_as(monkeypatch):
+    import app
+    flask_app = app.create_app()
+    queue = flask_app.extensions['cas'].transcription_queue
+    submit = queue.submit
+    archived = []
+
+    def record(*args, **kwargs):
+        archived.append(args[2])
+        return submit(*args, **kwargs)
+    monkeypatch.setattr(queue, 'submit', record)
+    client = flask_app.test_client()
+    session_id = client.post('/api/start-interview').json['sessionId']
+    stream_id = client.post('/api/audio-stream', json={'sessionId': session_id, 'questionIndex': 0}).json['streamId']
+    client.post(f'/api/audio-stream/{stream_id}/chunk?seq=0', data=wav_bytes(speech_like(2)))
+
+    assert client.post(f'/api/audio-stream/{stream_id}/finish').status_code == 202
+    assert archived[0].endswith('.wav')
+    queue.shutdown()
@@ -0,0 +1,223 @@
+import os
+import time
+import pytest
+
+import audio_archive
+
+from audio_archive import AudioArchive
+from admission import AdmissionController, Overloaded
+from ai_service import AIService, FakeGenerativeModel
+from gemini_client import GeminiClient
+from result_cache import MemoryCache
+from session_manager import SessionManager
+from session_store import SQLiteSessionStore
+from transcription_queue import TranscriptionQueue, QueueFullError
+
+
+class FakeSpeech:
+    """Transcribes every answer, or raises for the questions in ``failing``
+    (``error`` when given, else a crash)"""
+
+    def __init__(self, failing=(), error=None):
+        self.failing = set(failing)
+        self.error = error
+        self.admission = AdmissionController('speech', 1, 0)
+
+    def transcribe_audio(self, audio):
+        if audio in self.failing:
+            raise self.error or RuntimeError('recognizer crashed')
+        return {'text': f'my answer about {audio} and my plans to study', 'language': 'en'}
+
+    def has_meaningful_content(self, transcription):
+        return bool(transcription.get('text'))
+
+
+def make_queue(store, speech):
+    session_manager = SessionManager(store=store)
+    ai_service = AIService(speech, cache=MemoryCache(), client=GeminiClient(FakeGenerativeModel(latency=0)))
+    return TranscriptionQueue(session_manager, speech, ai_service, max_workers=1), session_manager
+
+
+def run(queue, session_id, question_index):
+    """Submit an answer and wait for its job; the audio path names the question"""
+    job_id = queue.submit(session_id, question_index, f'q{question_index}')
+    # One worker runs jobs in order, so this returns once the job is done
+    queue.executor.submit(lambda: None).result()
+    return job_id
+
+
+def test_job_state_is_shared_through_the_session_store(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+    queue, session_manager = make_queue(SQLiteSessionStore(path), FakeSpeech())
+    other_worker, _ = make_queue(SQLiteSessionStore(path), FakeSpeech())
+    session_id = session_manager.create_session()
+
+    job_id = run(queue, session_id, 0)
+    queue.shutdown()
+
+    job = other_worker.get_job(job_id)
+    assert job['status'] == 'completed'
+    assert job['sessionId'] == session_id and job['questionIndex'] == 0
+    assert other_worker.get_job(f'{session_id}.unknown') is None
+    assert other_worker.get_job('not-a-job') is None
+
+
+def test_failed_answer_is_not_recorded_and_can_be_resubmitted(tmp_path):
+    speech = FakeSpeech(failing={'q1'})
+    queue, session_manager = make_queue(SQLiteSessionStore(str(tmp_path / 'sessions.db')), speech)
+    session_id = session_manager.create_session()
+    questions = len(session_manager.get_question_set(session_id))
+
+    failed_job = run(queue, session_id, 1)
+    for index in [0] + list(range(2, questions)):
+        run(queue, session_id, index)
+
+    failed = queue.get_job(failed_job)
+    assert failed['status'] == 'failed'
+    # The client is told the answer failed, not how
+    assert failed['error'] == 'Could not process the answer'
+    assert session_manager.get_session(session_id)['status'] == 'active'
+    # Every other answer is in, so the failed one comes round again
+    assert session_manager.next_question_index(session_id, questions - 1) == 1
+
+    speech.failing.clear()
+    retry_job = run(queue, session_id, 1)
+    queue.shutdown()
+
+    assert queue.get_job(retry_job)['status'] == 'completed'
+    assert queue.get_job(failed_job) is None
+    assert session_manager.get_session(session_id)['status'] == 'completed'
+    assert session_manager.get_session_result(session_id) is not None
+
+
+def test_answer_and_completed_state_are_one_store_write(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / 'sessions.db'))
+    queue, session_manager = make_queue(store, FakeSpeech())
+    session_id = session_manager.create_session()
+    writes = []
+    update = store.update
+
+    def counting_update(session_id, mutate):
+        result = update(session_id, mutate)
+        session = store.get(session_id)
+        writes.append((session['transcriptions']['0']['status'], len(session['responses'])))
+        return result
+    store.update = counting_update
+
+    run(queue, session_id, 0)
+    queue.shutdown()
+
+    assert writes == [('queued', 0), ('processing', 0), ('analyzing', 0), ('completed', 1)]
+
+
+class FakeArchive:
+    def __init__(self):
+        self.transcribed = []
+
+    def hold(self, job_id, audio_path):
+        pass
+
+    def release(self, job_id):
+        pass
+
+    def locate(self, audio_path):
+        return audio_path
+
+    def mark_transcribed(self, audio_path):
+        self.transcribed.append(audio_path)
+
+
+def test_overloaded_recognition_fails_the_job_without_recording(tmp_path):
+    speech = FakeSpeech(failing={'q0'}, error=Overloaded('speech is at capacity', retry_after=7))
+    queue, session_manager = make_queue(SQLiteSessionStore(str(tmp_path / 'sessions.db')), speech)
+    queue.audio_archive = FakeArchive()
+    session_id = session_manager.create_session()
+
+    job_id = run(queue, session_id, 0)
+    queue.shutdown()
+
+    job = queue.get_job(job_id)
+    assert job['status'] == 'failed' and job['resubmit'] and job['retryAfter'] == 7
+    assert session_manager.get_session(session_id)['responses'] == []
+    # The upload is kept for the retry rather than released as transcribed
+    assert queue.audio_archive.transcribed == []
+
+
+def test_upload_is_turned_away_while_recognition_is_full(tmp_path):
+    speech = FakeSpeech()
+    queue, session_manager = make_queue(SQLiteSessionStore(str(tmp_path / 'sessions.db')), speech)
+    session_id = session_manager.create_session()
+
+    with speech.admission.slot():
+        with pytest.raises(QueueFullError):
+            queue.submit(session_id, 0, 'q0')
+    queue.shutdown()
+
+    assert session_manager.get_session(session_id).get('transcriptions', {}) == {}
+
+
+class ReadingSpeech(FakeSpeech):
+    """Reads each answer's file, recording which file it read"""
+
+    def __init__(self):
+        super().__init__()
+        self.read = []
+
+    def transcribe_audio(self, audio):
+        with open(audio, 'rb') as f:
+            content = f.read()
+        self.read.append(audio)
+        return {'text': f'my answer of {len(content)} bytes and my plans to study', 'language': 'en'}
+
+
+def test_identical_uploads_keep_their_shared_file_until_both_jobs_ran(tmp_path, monkeypatch):
+    def ffmpeg(command, **kwargs):
+        with open(command[-1], 'wb') as target:
+            target.write(b'opus')
+    monkeypatch.setattr(audio_archive.subprocess, 'run', ffmpeg)
+    archive = AudioArchive(root=str(tmp_path / 'uploads'), index_path=str(tmp_path / 'audio_index.db'),
+                           transcode='none')
+    archive.ffmpeg = 'ffmpeg'
+    speech = ReadingSpeech()
+    queue, session_manager = make_queue(SQLiteSessionStore(str(tmp_path / 'sessions.db')), speech)
+    queue.audio_archive = archive
+    session_id = session_manager.create_session()
+    # A retry of the same recording lands on the same archived file
+    audio_hash, path = archive.store(b'answer audio', 'wav')
+    assert archive.store(b'answer audio', 'wav') == (audio_hash, path)
+    archive.transcoder.submit(lambda: None).result()
+
+    # Both are queued before either runs
+    with queue.admission.slot():
+        jobs = [queue.submit(session_id, 0, path), queue.submit(session_id, 1, path)]
+    # The second job waits for admission rather than in the executor
+    deadline = time.monotonic() + 10
+    while queue.get_job(jobs[1])['status'] not in ('completed', 'failed') and time.monotonic() < deadline:
+        time.sleep(0.01)
+    queue.shutdown()
+    archive.transcoder.shutdown()
+
+    assert speech.read == [path, path]
+    assert queue.get_job(jobs[1])['status'] == 'completed'
+    # Released by the last job
+    assert archive.locate(path) == archive.compressed_path(audio_hash)
+
+
+
+def test_answer_whose_raw_upload_is_gone_is_read_from_its_compressed_copy(tmp_path):
+    archive = AudioArchive(root=str(tmp_path / 'uploads'), index_path=str(tmp_path / 'audio_index.db'),
+                           transcode='none')
+    speech = ReadingSpeech()
+    queue, session_manager = make_queue(SQLiteSessionStore(str(tmp_path / 'sessions.db')), speech)
+    queue.audio_archive = archive
+    session_id = session_manager.create_session()
+    audio_hash, path = archive.store(b'answer audio', 'wav')
+    os.makedirs(os.path.dirname(archive.compressed_path(audio_hash)))
+    os.replace(path, archive.compressed_path(audio_hash))
+
+    job_id = queue.submit(session_id, 0, path)
+    queue.shutdown()
+    archive.transcoder.shutdown()
+
+    assert speech.read == [archive.compressed_path(audio_hash)]
+    assert queue.get_job(job_id)['status'] == 'completed'
@@ -0,0 +1,94 @@
+import io
+import struct
+import wave
+import pytest
+import routes
+import streaming_transcription
+import upload_limits
+
+
+@pytest.fixture
+def client():
+    import app
+    return app.create_app().test_client()
+
+
+@pytest.fixture
+def session_id(client):
+    return client.post('/api/start-interview').json['sessionId']
+
+
+def wav_bytes(seconds):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(8000)
+        wav.writeframes(struct.pack('<h', 1000) * 8000 * seconds)
+    return buffer.getvalue()
+
+
+def upload(client, session_id, audio, filename='answer.wav'):
+    return client.post(f'/api/upload-audio?sessionId={session_id}&questionIndex=0',
+                       data={'audio': (io.BytesIO(audio), filename)})
+
+
+def queued(client, session_id):
+    return client.get(f'/api/interview-status/{session_id}').json['transcriptions']
+
+
+def test_file_growing_past_the_limit_is_rejected_while_parsed(client, session_id, monkeypatch):
+    monkeypatch.setattr(upload_limits, 'MAX_UPLOAD_BYTES', 4096)
+
+    response = upload(client, session_id, wav_bytes(2))
+
+    assert response.status_code == 413
+    assert 'exceeds' in response.json['error']
+    assert queued(client, session_id) == {}
+    # A file within the limit is still accepted
+    monkeypatch.setattr(upload_limits, 'MAX_UPLOAD_BYTES', len(wav_bytes(2)))
+    assert upload(client, session_id, wav_bytes(2)).status_code == 202
+
+
+def test_request_over_the_body_limit_is_rejected_before_it_is_read(client, session_id, monkeypatch):
+    monkeypatch.setattr(routes, 'MAX_CONTENT_LENGTH', 1024)
+    monkeypatch.setattr(upload_limits.AudioUploadRequest, '_get_file_stream',
+                        lambda *args, **kwargs: pytest.fail('the body was parsed'))
+
+    response = upload(client, session_id, wav_bytes(1))
+
+    assert response.status_code == 413
+    assert queued(client, session_id) == {}
+
+
+def test_answer_longer_than_allowed_is_rejected(client, session_id, monkeypatch):
+    monkeypatch.setattr(routes, 'MAX_ANSWER_SECONDS', 1)
+
+    response = upload(client, session_id, wav_bytes(2))
+
+    assert response.status_code == 413
+    assert response.json['error'] == 'Answers can be at most 1 seconds long'
+
+
+@pytest.mark.parametrize('filename', ['answer.exe', 'answer', 'answer.wav.php'])
+def test_unsupported_file_type_is_rejected_before_its_content_is_read(client, session_id, filename, monkeypatch):
+    monkeypatch.setattr(upload_limits, 'CappedFile', lambda *args: pytest.fail('the file was read'))
+
+    response = upload(client, session_id, wav_bytes(1), filename)
+
+    assert response.status_code == 415
+    assert 'wav' in response.json['error']
+    assert queued(client, session_id) == {}
+
+
+def test_stream_past_its_byte_limit_rejects_the_chunk_and_keeps_the_rest(client, session_id, monkeypatch):
+    monkeypatch.setattr(streaming_transcription, 'STREAM_MAX_BYTES', 6)
+    stream_id = client.post('/api/audio-stream', json={'sessionId': session_id, 'questionIndex': 0}).json['streamId']
+
+    assert client.post(f'/api/audio-stream/{stream_id}/chunk?seq=0', data=b'abcd').status_code == 200
+    rejected = client.post(f'/api/audio-stream/{stream_id}/chunk?seq=1', data=b'efg')
+    assert client.post(f'/api/audio-stream/{stream_id}/chunk?seq=1', data=b'ef').status_code == 200
+
+    assert rejected.status_code == 413 and 'maximum answer size' in rejected.json['error']
+    status = client.get(f'/api/audio-stream/{stream_id}').json
+    assert (status['receivedChunks'], status['receivedBytes']) == (2, 6)
@@ -0,0 +1,25 @@
+"""Errors raised by speech recognition and audio streams. Kept apart from
+speech_service and streaming_transcription so that routes can handle them
+without importing pydub or speech_recognition at startup."""
+
+
+class TranscriptionError(Exception):
+    """Raised when an answer could not be transcribed (recognizer error,
+    unreadable audio). Unlike silence this settles nothing: the answer
+    should be submitted again."""
+
+
+class StreamError(Exception):
+    """Base class for errors in handling an audio stream"""
+
+
+class StreamNotFound(StreamError):
+    """The stream is unknown, finished or was dropped as idle"""
+
+
+class ChunkOutOfOrder(StreamError):
+    """A chunk arrived before the ones preceding it"""
+
+
+class StreamTooLarge(StreamError):
+    """The stream's audio would exceed STREAM_MAX_BYTES"""
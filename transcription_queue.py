@@ -0,0 +1,226 @@
+import uuid
+import contextvars
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+    TRANSCRIPTION_WORKERS, TRANSCRIPTION_MAX_PENDING, TRANSCRIPTION_PER_CLIENT, JOB_TIMEOUT, ANALYSIS_TIMEOUT
+)
+from admission import AdmissionController, Overloaded
+from transcription_errors import TranscriptionError
+from structured_logging import get_logger, redact
+import deadlines
+
+logger = get_logger(__name__)
+
+
+class QueueFullError(Overloaded):
+    """Raised when too many transcription jobs are already waiting"""
+
+
+class TranscriptionQueue:
+    """Runs transcription, per-answer scoring and the final AI analysis on a
+    bounded thread pool so that upload requests can return as soon as the
+    audio is saved. Progress is published to ``event_bus``, if given, for
+    clients following the session's event stream.
+
+    Job state is kept with the session (see SessionManager.
+    set_transcription_state), so every worker sharing the session store can
+    report it. A job that fails records no answer: the question stays open
+    and the client submits it again.
+
+    Jobs are admitted by an AdmissionController: ``max_pending`` in total
+    and ``per_client`` per client, started round-robin across clients as
+    workers free up."""
+
+    def __init__(self, session_manager, speech_service, ai_service,
+                 max_workers=TRANSCRIPTION_WORKERS, max_pending=TRANSCRIPTION_MAX_PENDING,
+                 per_client=TRANSCRIPTION_PER_CLIENT, analysis_batcher=None, audio_archive=None, event_bus=None):
+        self.session_manager = session_manager
+        self.speech_service = speech_service
+        self.ai_service = ai_service
+        self.analysis_batcher = analysis_batcher
+        self.audio_archive = audio_archive
+        self.event_bus = event_bus
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='transcribe')
+        self.admission = AdmissionController(
+            'transcription', max_workers, max(0, max_pending - max_workers), per_client, typical_seconds=10
+        )
+
+    @property
+    def pending(self):
+        stats = self.admission.stats()
+        return stats['inFlight'] + stats['queued']
+
+    def submit(self, session_id, question_index, audio_path, audio_bytes=None, transcribe=None):
+        """Queue an answer for transcription. ``transcribe`` replaces the
+        default SpeechService call, e.g. to finish a streamed answer."""
+        try:
+            self.admission.check()
+            # A job that cannot get a recognizer would only fail once it runs
+            self.speech_service.admission.check()
+        except Overloaded as e:
+            raise QueueFullError("Transcription queue is full", e.retry_after) from e
+        # The session id leads the job id so the job can be looked up by id alone
+        job_id = f"{session_id}.{uuid.uuid4().hex}"
+        self.session_manager.set_transcription_state(
+            session_id, question_index, 'queued', jobId=job_id, submittedAt=datetime.now().isoformat()
+        )
+        if self.audio_archive is not None and audio_path:
+            # Identical uploads share one archived file; keep it for this job
+            self.audio_archive.hold(job_id, audio_path)
+        # Run under the submitting request's context so job logs keep its
+        # request id and the admission controller knows its client
+        context = contextvars.copy_context()
+        try:
+            self.admission.admit(lambda ticket: self.executor.submit(
+                context.run, self._run_job, ticket, job_id, session_id, question_index, audio_path, audio_bytes,
+                transcribe
+            ))
+        except Overloaded as e:
+            # Filled up since the check above
+            self._release_audio(job_id)
+            self._fail_job(job_id, session_id, question_index, 'Server is busy')
+            raise QueueFullError("Transcription queue is full", e.retry_after) from e
+        logger.info("Queued transcription job", extra={'jobId': job_id, 'questionIndex': question_index})
+        return job_id
+
+    def get_job(self, job_id):
+        return self.session_manager.get_transcription_job(job_id)
+
+    def _update_job(self, job_id, session_id, question_index, state, **details):
+        self.session_manager.set_transcription_state(session_id, question_index, state, jobId=job_id, **details)
+
+    def _publish(self, session_id, event_type, data):
+        if self.event_bus is None:
+            return
+        try:
+            self.event_bus.publish(session_id, event_type, data)
+        except Exception as e:
+            # Clients can still poll the status; the job itself succeeded
+            logger.warning("Could not publish %s event: %s", event_type, e)
+
+    def _run_job(self, ticket, job_id, session_id, question_index, audio_path, audio_bytes, transcribe):
+        # The job runs in a copy of the upload request's context; replace
+        # the request's deadline with the job's own
+        deadlines.start(JOB_TIMEOUT)
+        try:
+            self._update_job(job_id, session_id, question_index, 'processing')
+            if transcribe is not None:
+                transcription = transcribe()
+            else:
+                transcription = self.speech_service.transcribe_audio(
+                    audio_bytes if audio_bytes is not None else self._audio_file(audio_path)
+                )
+            has_content = self.speech_service.has_meaningful_content(transcription)
+            # Failures raise, so what is returned settles the answer, even
+            # when no speech was found in it
+            self._release_audio(job_id)
+            if self.audio_archive is not None and audio_path:
+                self.audio_archive.mark_transcribed(audio_path)
+            logger.info("Answer transcribed", extra={
+                'jobId': job_id,
+                'questionIndex': question_index,
+                'hasMeaningfulContent': has_content,
+                'text': redact(transcription.get('text', ''))
+            })
+            skipped_reason = (transcription.get('prescreen') or {}).get('reason')
+            self._publish(session_id, 'transcription-ready', {
+                'jobId': job_id,
+                'questionIndex': question_index,
+                'transcription': transcription.get('text', ''),
+                'hasMeaningfulContent': has_content,
+                'skippedReason': skipped_reason
+            })
+
+            # Score the answer now so the final analysis only has to aggregate
+            self._update_job(job_id, session_id, question_index, 'analyzing')
+            question_set = self.session_manager.get_question_set(session_id)
+            if question_set is None:
+                raise ValueError("Session not found")
+            answer_analysis = self.ai_service.analyze_answer(question_set.question(question_index), transcription)
+
+            # The answer and the job's completion are one store write
+            is_complete = self.session_manager.add_response(
+                session_id,
+                question_index,
+                audio_path,
+                transcription,
+                answer_analysis,
+                job_state={
+                    'status': 'completed',
+                    'jobId': job_id,
+                    'transcription': transcription.get('text', ''),
+                    'hasMeaningfulContent': has_content,
+                    'skippedReason': skipped_reason,
+                    'completedAt': datetime.now().isoformat()
+                }
+            )
+            self._publish(session_id, 'analysis-ready', {
+                'jobId': job_id,
+                'questionIndex': question_index,
+                'analysis': answer_analysis,
+                'isComplete': is_complete
+            })
+
+        except Overloaded as e:
+            # Recognition or Gemini filled up after the job was admitted
+            logger.warning("Transcription job %s turned away: %s", job_id, e)
+            self._fail_job(job_id, session_id, question_index, 'Server is busy', retryAfter=e.retry_after)
+        except Exception as e:
+            # The details (paths, backend errors) stay in the log
+            logger.exception("Transcription job %s failed: %s", job_id, e)
+            self._fail_job(job_id, session_id, question_index, 'Could not process the answer')
+        else:
+            if is_complete:
+                self._analyze_interview(session_id)
+        finally:
+            self._release_audio(job_id)
+            ticket.release()
+    
+    def _audio_file(self, audio_path):
+        # The raw upload may have been replaced by its Opus copy
+        if self.audio_archive is None:
+            return audio_path
+        path = self.audio_archive.locate(audio_path)
+        if path is None:
+            raise TranscriptionError(f"Recording {audio_path} is no longer available")
+        return path
+    
+    def _release_audio(self, job_id):
+        if self.audio_archive is not None:
+            try:
+                self.audio_archive.release(job_id)
+            except Exception as e:
+                logger.warning("Could not release the audio of job %s: %s", job_id, e)
+
+    def _analyze_interview(self, session_id):
+        # The answer is recorded by now, so a failure here is not the job's
+        logger.info("Interview complete, starting AI analysis", extra={'sessionId': session_id})
+        try:
+            session = self.session_manager.get_session(session_id)
+            if session is not None and self.analysis_batcher is not None:
+                self.analysis_batcher.submit(session, lambda analysis: self._store_analysis(session_id, analysis))
+            elif session is not None:
+                with deadlines.deadline(ANALYSIS_TIMEOUT):
+                    analysis = self.ai_service.analyze_interview(session)
+                self._store_analysis(session_id, analysis)
+        except Exception as e:
+            logger.exception("AI analysis of session %s failed: %s", session_id, e)
+
+    def _fail_job(self, job_id, session_id, question_index, error, **details):
+        # No answer is recorded, so the interview cannot complete until the
+        # question is submitted again
+        self._update_job(job_id, session_id, question_index, 'failed', error=error, resubmit=True, **details)
+        self._publish(session_id, 'job-failed', {
+            'jobId': job_id, 'questionIndex': question_index, 'error': error, 'resubmit': True, **details
+        })
+
+    def _store_analysis(self, session_id, analysis):
+        self.session_manager.set_analysis(session_id, analysis)
+        logger.info("AI analysis completed", extra={'sessionId': session_id})
+        result = self.session_manager.get_session_result(session_id)
+        if result is not None:
+            self._publish(session_id, 'result', result)
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
@@ -0,0 +1,68 @@
+import io
+import os
+import wave
+import tempfile
+from flask import Request
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+from config import ALLOWED_AUDIO_EXTENSIONS, MAX_UPLOAD_BYTES, UPLOAD_SPOOL_BYTES
+import deadlines
+
+
+def allowed_audio_file(filename):
+    return bool(filename) and os.path.splitext(filename)[1].lower().lstrip('.') in ALLOWED_AUDIO_EXTENSIONS
+
+
+class CappedFile:
+    """Spools an uploaded file, in memory up to ``spool_bytes`` and then on
+    disk, and rejects it as soon as more than ``max_bytes`` are written or
+    the request's deadline passes"""
+
+    def __init__(self, max_bytes=MAX_UPLOAD_BYTES, spool_bytes=UPLOAD_SPOOL_BYTES):
+        self.max_bytes = max_bytes
+        self.written = 0
+        self.file = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+
+    def write(self, data):
+        self.written += len(data)
+        if self.written > self.max_bytes:
+            self.file.close()
+            raise RequestEntityTooLarge(f"Audio upload exceeds {self.max_bytes // (1024 * 1024)} MB")
+        try:
+            deadlines.check('the upload was received')
+        except deadlines.DeadlineExceeded:
+            self.file.close()
+            raise
+        return self.file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+    def __iter__(self):
+        return iter(self.file)
+
+
+class AudioUploadRequest(Request):
+    """Checks uploaded files while the multipart body is parsed: a file with
+    a disallowed extension is rejected before its content is read, and one
+    that grows past MAX_UPLOAD_BYTES as soon as it does"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if filename and not allowed_audio_file(filename):
+            raise UnsupportedMediaType(
+                f"Unsupported audio format; allowed: {', '.join(sorted(ALLOWED_AUDIO_EXTENSIONS))}"
+            )
+        if content_length is not None and content_length > MAX_UPLOAD_BYTES:
+            raise RequestEntityTooLarge(f"Audio upload exceeds {MAX_UPLOAD_BYTES // (1024 * 1024)} MB")
+        return CappedFile(MAX_UPLOAD_BYTES)
+
+
+def wav_duration(stream):
+    """Duration in seconds from a WAV header, or None for other formats.
+    Leaves the stream at its start."""
+    try:
+        with wave.open(stream, 'rb') as wav:
+            return wav.getnframes() / float(wav.getframerate())
+    except (wave.Error, EOFError, ZeroDivisionError):
+        return None
+    finally:
+        stream.seek(0, io.SEEK_SET)